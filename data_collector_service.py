@@ -43,6 +43,9 @@ class TTNDataCollector:
         self.django_api_url = os.getenv(
             "DJANGO_API_URL", "http://localhost:8000/api/ingest/"
         )
+        self.django_batch_api_url = os.getenv(
+            "DJANGO_BATCH_API_URL", self.django_api_url.rstrip("/") + "/batch/"
+        )
 
         # Collection settings
         self.fetch_interval = int(
@@ -146,6 +149,23 @@ class TTNDataCollector:
             logger.error(f"❌ Error sending to Django: {e}")
             return False
 
+    def send_batch_to_django(self, data: List[Dict]) -> Optional[Dict]:
+        """Send all processed data points to the Django batch API in one request"""
+        try:
+            response = requests.post(self.django_batch_api_url, json=data, timeout=60)
+
+            if response.status_code == 200:
+                return response.json()
+
+            logger.error(
+                f"❌ Django batch API error: {response.status_code} - {response.text}"
+            )
+            return None
+
+        except Exception as e:
+            logger.error(f"❌ Error sending batch to Django: {e}")
+            return None
+
     def collect_and_process_data(self):
         """Main data collection and processing function"""
         logger.info("🔄 Starting data collection cycle...")
@@ -157,25 +177,31 @@ class TTNDataCollector:
             logger.warning("⚠️ No data points received from TTN")
             return
 
-        # Process and send each data point
-        successful_sends = 0
-        for data_point in data_points:
-            processed_data = self.process_data_point(data_point)
-
-            if processed_data:
-                if self.send_to_django(processed_data):
-                    successful_sends += 1
+        # Process all data points and send them in a single batch request
+        processed = [
+            processed_data
+            for processed_data in map(self.process_data_point, data_points)
+            if processed_data
+        ]
+        if not processed:
+            logger.warning("⚠️ No valid data points to send")
+            return
 
-                    # Log the latest reading
-                    logger.info(
-                        f"📊 Latest: {processed_data['received_at']} - "
-                        f"Temp: {processed_data['field5']}°C, "
-                        f"Humidity: {processed_data['field3']}%, "
-                        f"Battery: {processed_data['field1']}V"
-                    )
+        result = self.send_batch_to_django(processed)
+        if result is None:
+            return
 
+        latest = max(processed, key=lambda d: d["received_at"])
+        logger.info(
+            f"📊 Latest: {latest['received_at']} - "
+            f"Temp: {latest['field5']}°C, "
+            f"Humidity: {latest['field3']}%, "
+            f"Battery: {latest['field1']}V"
+        )
         logger.info(
-            f"✅ Collection cycle complete: {successful_sends}/{len(data_points)} data points sent successfully"
+            f"✅ Collection cycle complete: {result['created']} new, "
+            f"{result['duplicate']} already stored, {result['invalid']} invalid "
+            f"out of {len(data_points)} data points"
         )
 
     def run_continuous(self):
@@ -4,7 +4,6 @@ Script to post historical sensor data from message_history.json to the Django AP
 """
 import json
 import requests
-import time
 
 
 def post_historical_data():
@@ -26,63 +25,24 @@ def post_historical_data():
 
         print(f"Found {len(items)} historical records")
 
-        # Post each reading to the API
-        success_count = 0
-        for i, item in enumerate(items):
-            try:
-                # Extract data from the TTN structure
-                if "result" in item:
-                    result = item["result"]
-                    device_id = result.get("end_device_ids", {}).get(
-                        "device_id", "unknown-device"
-                    )
-                    received_at = result.get("received_at")
-                    decoded_payload = result.get("uplink_message", {}).get(
-                        "decoded_payload", {}
-                    )
-                else:
-                    device_id = item.get("end_device_ids", {}).get(
-                        "device_id", "unknown-device"
-                    )
-                    received_at = item.get("received_at")
-                    decoded_payload = item.get("uplink_message", {}).get(
-                        "decoded_payload", {}
-                    )
-
-                # Map the fields
-                payload = {
-                    "device_id": device_id,
-                    "received_at": received_at,
-                    "field1": decoded_payload.get("field1"),  # Battery voltage
-                    "field3": decoded_payload.get("field3"),  # Humidity
-                    "field4": decoded_payload.get("field4"),  # Motion counts
-                    "field5": decoded_payload.get("field5"),  # Temperature
-                }
-
-                # Post to API
-                response = requests.post(
-                    "http://127.0.0.1:8000/api/ingest/", json=payload, timeout=5
-                )
-
-                if response.status_code == 200:
-                    success_count += 1
-                    print(
-                        f"✓ Posted record {i+1}/{len(items)}: {device_id} at {received_at}"
-                    )
-                else:
-                    print(
-                        f"✗ Failed to post record {i+1}: {response.status_code} - {response.text}"
-                    )
-
-                # Small delay to avoid overwhelming the API
-                time.sleep(0.1)
+        # Post all readings in a single batch request; the API maps the TTN
+        # structure, validates and skips readings it already has
+        response = requests.post(
+            "http://127.0.0.1:8000/api/ingest/batch/", json=items, timeout=120
+        )
+        if response.status_code != 200:
+            print(f"✗ Batch upload failed: {response.status_code} - {response.text}")
+            return
 
-            except Exception as e:
-                print(f"✗ Error processing record {i+1}: {e}")
-                continue
+        result = response.json()
+        for item in result["results"]:
+            if item["status"] == "invalid":
+                print(f"✗ Record {item['index'] + 1}: {item['error']}")
 
         print(
-            f"\nSuccessfully posted {success_count}/{len(items)} historical records to the API"
+            f"\nPosted {len(items)} historical records to the API: "
+            f"{result['created']} new, {result['duplicate']} already stored, "
+            f"{result['invalid']} invalid"
         )
 
     except FileNotFoundError:
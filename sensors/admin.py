@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SensorReading
+from .models import DeviceState, JobLease, SensorReading
 
 
 @admin.register(SensorReading)
@@ -17,4 +17,23 @@ class SensorReadingAdmin(admin.ModelAdmin):
     ordering = ("-received_at",)
 
 
+@admin.register(DeviceState)
+class DeviceStateAdmin(admin.ModelAdmin):
+    list_display = (
+        "device_id",
+        "last_seen",
+        "temperature_c",
+        "humidity",
+        "battery_voltage",
+        "reading_count",
+    )
+    search_fields = ("device_id",)
+    readonly_fields = ("last_reading", "updated_at")
+
+
+@admin.register(JobLease)
+class JobLeaseAdmin(admin.ModelAdmin):
+    list_display = ("name", "last_run_at", "holder", "expires_at")
+
+
 # Register your models here.
@@ -0,0 +1,117 @@
+"""Tagged caching of computed page data.
+
+Entries are cached under a key derived from the current version of each of
+their tags. Ingest bumps the versions of the tags a batch of readings
+touches (see ``invalidate_readings``), which orphans exactly the entries
+that depend on them; everything else stays cached. TTLs only act as a
+safety net for data that goes stale with the clock, like online status.
+
+Keys also carry the database version of the readings behind them (see
+``sensors.conditional.data_version``). Processes that write readings
+without reaching this cache, such as the MQTT worker, the scheduler,
+retention or another server worker with its own local-memory cache, still
+orphan the entries they make stale. Cached bodies therefore never lag
+behind the ETags derived from the same version.
+
+Tags:
+
+* ``readings`` - any reading at all (all-device pages)
+* ``device:<id>`` - readings of one device
+* ``day:<YYYY-MM-DD>`` - readings received on one (local) day
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .conditional import data_version
+from .models import DailyRollup
+
+ALL_READINGS = "readings"
+
+
+def device_tag(device_id):
+    return f"device:{device_id}"
+
+
+def day_tag(day):
+    return f"day:{day.isoformat()}"
+
+
+def recent_day_tags(days=1, now=None):
+    """Tags of the local days covered by the last ``days`` days up to now"""
+    today = timezone.localdate(now)
+    return [day_tag(today - timedelta(days=i)) for i in range(days + 1)]
+
+
+def _tag_key(tag):
+    return f"sensors:tag:{tag}"
+
+
+def _tag_versions(tags):
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        # A fresh (time based) version never matches an evicted one
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def _data_version(tags):
+    """Database version of the readings behind ``tags``.
+
+    Entries that only depend on devices use those devices' versions, and
+    entries that only depend on days the readings counted by those days'
+    rollups, so unrelated readings leave them cached. Anything else uses
+    the version of all readings.
+    """
+    scopes = {tag.partition(":")[0] for tag in tags}
+    if scopes == {"device"}:
+        return ",".join(data_version(tag.partition(":")[2])[0] for tag in tags)
+    if scopes == {"day"}:
+        days = [tag.partition(":")[2] for tag in tags]
+        counted = DailyRollup.objects.filter(bucket__in=days).aggregate(
+            total=Sum("reading_count")
+        )["total"]
+        return f"days:{counted or 0}"
+    return data_version()[0]
+
+
+def cached(name, tags, compute, timeout=None, version=None):
+    """Return ``compute()`` cached until one of ``tags`` is invalidated.
+
+    ``timeout`` defaults to ``SENSOR_CACHE_TIMEOUT``. ``version`` replaces
+    the database version of ``tags`` in the key, for callers that already
+    hold a version covering them, such as the one of their page's ETag.
+    """
+    tags = sorted(set(tags))
+    versions = ".".join(str(v) for v in _tag_versions(tags))
+    version = _data_version(tags) if version is None else version
+    key = f"sensors:page:{name}:{versions}:{version}"
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(
+            key, value, settings.SENSOR_CACHE_TIMEOUT if timeout is None else timeout
+        )
+    return value
+
+
+def invalidate(tags):
+    """Bump the version of every tag, orphaning the entries that use it"""
+    cache.set_many({_tag_key(tag): time.time_ns() for tag in set(tags)}, None)
+
+
+def invalidate_readings(readings):
+    """Invalidate everything a batch of newly stored readings can change"""
+    tags = {ALL_READINGS}
+    for reading in readings:
+        tags.add(device_tag(reading.device_id))
+        tags.add(day_tag(timezone.localdate(reading.received_at)))
+    invalidate(tags)
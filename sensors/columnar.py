@@ -0,0 +1,207 @@
+"""Columnar (Parquet / Arrow IPC) export and import of sensor history.
+
+pyarrow is an optional dependency (see requirements.analytics.txt); it is
+imported lazily so the dashboard runs without it.
+"""
+
+import datetime
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .ingest import store_readings
+
+# Rows per Arrow record batch / Parquet row group
+COLUMNAR_BATCH_SIZE = 50000
+
+COLUMNS = (
+    "device_id",
+    "received_at",
+    "temperature_c",
+    "humidity",
+    "battery_voltage",
+    "motion_counts",
+)
+
+
+class ColumnarUnavailable(ImportError):
+    """Raised when pyarrow is not installed"""
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ColumnarUnavailable(
+            "Columnar export needs pyarrow: pip install -r requirements.analytics.txt"
+        ) from e
+    return pyarrow
+
+
+def reading_schema(with_date=False):
+    """Arrow schema of exported readings; ``with_date`` adds the day partition column"""
+    pa = _pyarrow()
+    fields = [
+        ("device_id", pa.string()),
+        ("received_at", pa.timestamp("us", tz="UTC")),
+        ("temperature_c", pa.float64()),
+        ("humidity", pa.float64()),
+        ("battery_voltage", pa.float64()),
+        ("motion_counts", pa.int64()),
+    ]
+    if with_date:
+        fields.append(("date", pa.date32()))
+    return pa.schema(fields)
+
+
+def iter_record_batches(readings, batch_size=COLUMNAR_BATCH_SIZE, with_date=False):
+    """Yield Arrow record batches of ``readings`` pulled with a chunked cursor"""
+    pa = _pyarrow()
+    schema = reading_schema(with_date)
+    columns = [[] for _ in schema]
+
+    def flush():
+        batch = pa.record_batch(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema,
+        )
+        for values in columns:
+            values.clear()
+        return batch
+
+    for row in readings.values_list(*COLUMNS).iterator(chunk_size=batch_size):
+        for values, value in zip(columns, row):
+            values.append(value)
+        if with_date:
+            columns[-1].append(timezone.localdate(row[1]))
+        if len(columns[0]) >= batch_size:
+            yield flush()
+    if columns[0]:
+        yield flush()
+
+
+def write_dataset(readings, base_dir, batch_size=COLUMNAR_BATCH_SIZE):
+    """Write ``readings`` as a Parquet dataset partitioned by device_id/date (hive layout).
+
+    Each record batch is written on the calling thread (pyarrow would
+    otherwise pull the queryset from a worker thread that has no database
+    connection), producing one file per partition per batch. Returns the
+    number of rows written.
+    """
+    pa = _pyarrow()
+    written = 0
+    for index, batch in enumerate(
+        iter_record_batches(readings, batch_size, with_date=True)
+    ):
+        pa.dataset.write_dataset(
+            batch,
+            base_dir,
+            format="parquet",
+            partitioning=["device_id", "date"],
+            partitioning_flavor="hive",
+            basename_template=f"part-{index}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            max_rows_per_group=batch_size,
+        )
+        written += batch.num_rows
+    return written
+
+
+def import_dataset(path, batch_size=COLUMNAR_BATCH_SIZE):
+    """Load a Parquet file or dataset directory back into SensorReading.
+
+    Rows go through the shared ingest path, so re-importing a dump skips
+    readings that are already stored. Returns ``(created, duplicates)``.
+    """
+    pa = _pyarrow()
+    dataset = pa.dataset.dataset(path, format="parquet", partitioning="hive")
+    created = duplicates = 0
+    for batch in dataset.to_batches(columns=list(COLUMNS), batch_size=batch_size):
+        rows = []
+        for record in batch.to_pylist():
+            received_at = record["received_at"]
+            if timezone.is_naive(received_at):
+                received_at = timezone.make_aware(received_at, datetime.timezone.utc)
+            rows.append(
+                {
+                    **record,
+                    "device_id": str(record["device_id"]),
+                    "received_at": received_at,
+                }
+            )
+        for status, _ in store_readings(rows):
+            if status == "created":
+                created += 1
+            else:
+                duplicates += 1
+    return created, duplicates
+
+
+class _Drain:
+    """Write-only file object that hands buffered bytes to a streaming response"""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_parquet(readings, batch_size=COLUMNAR_BATCH_SIZE):
+    """Encode ``readings`` as one Parquet file, yielding bytes after each row group"""
+    pa = _pyarrow()
+    sink = _Drain()
+    writer = pa.parquet.ParquetWriter(sink, reading_schema())
+    for batch in iter_record_batches(readings, batch_size):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_arrow_stream(readings, batch_size=COLUMNAR_BATCH_SIZE):
+    """Encode ``readings`` in the Arrow IPC streaming format, one record batch at a time"""
+    pa = _pyarrow()
+    sink = _Drain()
+    writer = pa.ipc.new_stream(sink, reading_schema())
+    for batch in iter_record_batches(readings, batch_size):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+COLUMNAR_FORMATS = {
+    "parquet": (iter_parquet, "application/vnd.apache.parquet", "parquet"),
+    "arrow": (iter_arrow_stream, "application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+def columnar_response(readings, columnar_format, filename="sensor_readings"):
+    """Stream ``readings`` as Parquet or Arrow IPC; raises ColumnarUnavailable without pyarrow"""
+    _pyarrow()
+    iterator, content_type, extension = COLUMNAR_FORMATS[columnar_format]
+    response = StreamingHttpResponse(iterator(readings), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{extension}"'
+    return response
@@ -0,0 +1,132 @@
+"""Conditional GET: answer repeat requests with 304 while the data is unchanged.
+
+Every page and API response carries an ``ETag`` and ``Last-Modified``
+derived from a cheap data version: the newest and oldest reading ids (one
+query of two primary key lookups) for pages over all readings, or the device's
+``DeviceState`` row for pages about one device. Ingest moves the newest id
+and bumps the state row; retention moves the oldest id and touches the
+state rows of the devices it deleted readings of. A poll that sends
+the validators back gets a 304 before the view runs any of its queries.
+
+Pages that also change with the clock (online status, "last 24 hours"
+charts) fold the current ``SENSOR_ETAG_WINDOW`` into their ETag, so they
+are rendered again at least that often. Responses are marked
+``Cache-Control: no-cache`` so browsers revalidate every time instead of
+guessing a freshness lifetime from ``Last-Modified``.
+"""
+
+import contextvars
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Subquery
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .models import DeviceState, SensorReading
+
+
+# Versions already read while serving the current request, by device id
+_request_versions = contextvars.ContextVar("sensors_data_versions", default=None)
+
+
+def data_version(device_id=None):
+    """``(version, last_modified)`` of all readings or of one device's readings.
+
+    ``version`` is an opaque string that changes whenever readings in scope
+    are stored or deleted; ``last_modified`` is when that last happened, or
+    None without any readings. Within a ``conditional`` view each version
+    is read once, so cached data is keyed on the version of its ETag.
+    """
+    memo = _request_versions.get()
+    if memo is None:
+        return _read_version(device_id)
+    if device_id not in memo:
+        memo[device_id] = _read_version(device_id)
+    return memo[device_id]
+
+
+def _read_version(device_id):
+    if device_id:
+        state = (
+            DeviceState.objects.filter(device_id=device_id)
+            .values_list("reading_count", "updated_at")
+            .first()
+        )
+        if state is None:
+            return "device:none", None
+        count, updated_at = state
+        return f"device:{count}:{updated_at.timestamp()}", updated_at
+
+    oldest = SensorReading.objects.order_by("id").values("id")[:1]
+    newest = (
+        SensorReading.objects.annotate(oldest=Subquery(oldest))
+        .order_by("-id")
+        .values_list("id", "created_at", "oldest")
+        .first()
+    )
+    if newest is None:
+        return "all:none", None
+    return f"all:{newest[2]}:{newest[0]}", newest[1]
+
+
+def _window_start(now=None):
+    """Start of the current ``SENSOR_ETAG_WINDOW`` as an aware datetime"""
+    window = settings.SENSOR_ETAG_WINDOW
+    seconds = (now or timezone.now()).timestamp()
+    return datetime.fromtimestamp(seconds - seconds % window, tz=dt_timezone.utc)
+
+
+def conditional(device=None, clock=False):
+    """Decorate a GET view with validators from ``data_version``.
+
+    ``device(request, *args, **kwargs)`` returns the device id a request is
+    scoped to (falsy for all readings). ``clock`` marks views whose output
+    also depends on the current time. The ETag covers the view and its full
+    query string, so every distinct response has its own validator.
+    """
+
+    def decorator(view):
+        def validators(request, *args, **kwargs):
+            # condition() asks for the ETag and Last-Modified separately
+            if not hasattr(request, "_sensors_validators"):
+                device_id = device(request, *args, **kwargs) if device else None
+                version, modified = data_version(device_id)
+                parts = [view.__name__, request.get_full_path(), version]
+                if clock:
+                    window = _window_start()
+                    parts.append(str(int(window.timestamp())))
+                    modified = max(modified, window) if modified else window
+                etag = hashlib.sha1("\n".join(parts).encode()).hexdigest()[:20]
+                request._sensors_validators = (etag, modified)
+            return request._sensors_validators
+
+        guarded = condition(
+            etag_func=lambda *a, **kw: validators(*a, **kw)[0],
+            last_modified_func=lambda *a, **kw: validators(*a, **kw)[1],
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = _request_versions.set({})
+            try:
+                return guarded(request, *args, **kwargs)
+            finally:
+                _request_versions.reset(token)
+
+        return cache_control(no_cache=True)(wrapper)
+
+    return decorator
+
+
+def device_param(request, *args, **kwargs):
+    """Scope of views filtered by an optional ``?device=``"""
+    return request.GET.get("device", "")
+
+
+def device_arg(request, device_id, *args, **kwargs):
+    """Scope of views addressed by a ``device_id`` URL argument"""
+    return device_id
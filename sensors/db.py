@@ -0,0 +1,127 @@
+import logging
+import re
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_pragmas():
+    """The pragma profile selected by ``SQLITE_PRAGMA_PROFILE``"""
+    return settings.SQLITE_PRAGMA_PROFILES.get(settings.SQLITE_PRAGMA_PROFILE, {})
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """``connection_created`` receiver applying the pragma profile to new SQLite connections"""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    logger.debug("Applied SQLite pragmas %s", settings.SQLITE_PRAGMA_PROFILE)
+
+
+def current_pragmas(connection):
+    """Read back the pragmas of the profile as SQLite reports them"""
+    values = {}
+    with connection.cursor() as cursor:
+        for name in sqlite_pragmas():
+            cursor.execute(f"PRAGMA {name}")
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+    return values
+
+
+# Query plan lines meaning "reads the whole table" or "sorts rows itself";
+# walking a whole index reads every row too
+SQLITE_PLAN_PROBLEM = re.compile(
+    r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$|USE TEMP B-TREE"
+)
+POSTGRES_PLAN_PROBLEM = re.compile(r"Seq Scan on (\w+)|^\s*(?:->\s+)?Sort\s+\(")
+
+
+def query_plan(connection, sql, params=None):
+    """The plan of ``sql`` as text lines (``EXPLAIN QUERY PLAN`` / ``EXPLAIN``)"""
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def plan_problems(connection, sql, params=None, tables=None):
+    """Plan lines of ``sql`` showing a full scan of one of ``tables`` or a sort.
+
+    Scans of subqueries and of tables outside ``tables`` (default: any) are
+    not reported.
+    """
+    pattern = SQLITE_PLAN_PROBLEM if connection.vendor == "sqlite" else POSTGRES_PLAN_PROBLEM
+    problems = []
+    for line in query_plan(connection, sql, params):
+        match = pattern.search(line)
+        if match and (tables is None or match.group(1) in (None, *tables)):
+            problems.append(line.strip())
+    if connection.vendor == "sqlite" and not any("TEMP B-TREE" in line for line in problems):
+        # Under a LIMIT a walk in ORDER BY order stops early, so only scans of
+        # other tables or in other orders are a problem
+        excused = _ordered_walks(connection, sql)
+        problems = [line for line in problems if line not in excused]
+    return problems
+
+
+# ORDER BY one column (by name, or by position when selected first)
+# directly followed by a LIMIT
+_ORDER_BY_COLUMN = re.compile(r'ORDER BY "(\w+)"\."(\w+)"(?: ASC| DESC)? LIMIT ')
+_ORDER_BY_FIRST = re.compile(r'ORDER BY 1(?: ASC| DESC)? LIMIT ')
+_SELECT_FIRST = re.compile(r'^SELECT (?:DISTINCT )?"(\w+)"\."(\w+)"[ ,]')
+
+
+def _order_column(sql):
+    """``(table, column)`` a ``LIMIT`` query is ordered by, or None"""
+    match = _ORDER_BY_COLUMN.search(sql)
+    if match is None and _ORDER_BY_FIRST.search(sql):
+        match = _SELECT_FIRST.match(sql)
+    return match.groups() if match else None
+
+
+def _ordered_walks(connection, sql):
+    """SQLite plan lines of walks in the order of a ``LIMIT`` query's ORDER BY.
+
+    That is the bare SCAN of the table for its primary key, or a scan of an
+    index whose first column is the ORDER BY column.
+    """
+    order = _order_column(sql)
+    if order is None:
+        return set()
+    table, column = order
+    if column == "id":
+        return {f"SCAN {table}"}
+    walks = set()
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA index_list({connection.ops.quote_name(table)})")
+        for index in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"PRAGMA index_info({connection.ops.quote_name(index)})")
+            if [row[2] for row in sorted(cursor.fetchall())][:1] == [column]:
+                walks.add(f"SCAN {table} USING INDEX {index}")
+                walks.add(f"SCAN {table} USING COVERING INDEX {index}")
+    return walks
+
+
+def database_bytes_used(connection):
+    """Bytes of the database holding data; freed SQLite pages are not counted.
+
+    PostgreSQL only returns space to this figure after VACUUM.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            values = []
+            for name in ("page_count", "freelist_count", "page_size"):
+                cursor.execute(f"PRAGMA {name}")
+                values.append(cursor.fetchone()[0])
+            page_count, freelist_count, page_size = values
+            return (page_count - freelist_count) * page_size
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT pg_database_size(current_database())")
+            return cursor.fetchone()[0]
+    return None
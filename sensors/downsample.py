@@ -0,0 +1,70 @@
+"""Chart series downsampling.
+
+Series are reduced to a target number of points before they reach
+Chart.js, so the cost of a chart depends on its width rather than on the
+time range it covers. Both reducers work on the plain lists pulled with
+``values_list`` and return the indices of the points to keep, so callers
+only format labels for points that are actually sent.
+"""
+
+
+def lttb_indices(xs, ys, threshold):
+    """Largest-Triangle-Three-Buckets: keep the visually significant points.
+
+    ``xs`` must be increasing numbers (e.g. epoch seconds). The first and
+    last points are always kept.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average point of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = next_start - 1, -1.0
+        for j in range(int(i * every) + 1, next_start):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+def minmax_indices(xs, ys, threshold):
+    """Keep the minimum and maximum of each of ``threshold // 2`` equal buckets.
+
+    Preserves spikes exactly, at the cost of a less even shape than LTTB.
+    """
+    n = len(ys)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return list(range(n))
+
+    every = n / buckets
+    kept = []
+    for i in range(buckets):
+        start, end = int(i * every), int((i + 1) * every)
+        if start >= end:
+            continue
+        window = range(start, end)
+        low = min(window, key=ys.__getitem__)
+        high = max(window, key=ys.__getitem__)
+        kept.extend(sorted({low, high}))
+    return kept
+
+
+DOWNSAMPLE_METHODS = {
+    "lttb": lttb_indices,
+    "minmax": minmax_indices,
+}
@@ -0,0 +1,93 @@
+import csv
+
+from django.http import StreamingHttpResponse
+
+from .fastjson import dumps
+
+# Columns pulled from SensorReading for every export format
+EXPORT_FIELDS = (
+    "received_at",
+    "device_id",
+    "temperature_c",
+    "humidity",
+    "battery_voltage",
+    "motion_counts",
+)
+CSV_HEADER = ["Timestamp", "Device", "Temperature", "Humidity", "Battery", "Motion"]
+
+# Rows fetched from the database cursor (and emitted to the client) per chunk
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Pseudo-buffer for csv.writer: ``write`` hands back the formatted line"""
+
+    def write(self, value):
+        return value
+
+
+def _chunks(readings):
+    """Yield lists of export rows without materialising the whole queryset"""
+    chunk = []
+    for row in readings.values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        chunk.append(row)
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _record(row):
+    received_at, device_id, temperature_c, humidity, battery_voltage, motion = row
+    return {
+        "timestamp": received_at.isoformat(),
+        "device_id": device_id,
+        "temperature_c": temperature_c,
+        "humidity": humidity,
+        "battery_voltage": battery_voltage,
+        "motion_counts": motion,
+    }
+
+
+def iter_csv(readings):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for chunk in _chunks(readings):
+        # Missing values become blanks; 0.0 readings are kept
+        yield "".join(
+            writer.writerow(["" if value is None else value for value in row])
+            for row in chunk
+        )
+
+
+def iter_ndjson(readings):
+    for chunk in _chunks(readings):
+        yield b"".join(dumps(_record(row)) + b"\n" for row in chunk)
+
+
+def iter_json_array(readings):
+    """Encode a JSON array incrementally, one chunk of records at a time"""
+    yield b"["
+    separator = b""
+    for chunk in _chunks(readings):
+        yield separator + b",".join(dumps(_record(row)) for row in chunk)
+        separator = b","
+    yield b"]"
+
+
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv", "csv"),
+    "json": (iter_json_array, "application/json", "json"),
+    "ndjson": (iter_ndjson, "application/x-ndjson", "ndjson"),
+}
+
+
+def export_response(readings, export_format, filename="sensor_readings"):
+    """Stream ``readings`` in ``export_format`` with flat memory use"""
+    iterator, content_type, extension = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(iterator(readings), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{extension}"'
+    return response
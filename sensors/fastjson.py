@@ -0,0 +1,54 @@
+"""JSON encoding for API responses and exports.
+
+Uses orjson when it is installed (``pip install -r
+requirements.speedups.txt``), which encodes rows of floats and strings
+several times faster than the stdlib encoder, and falls back to ``json``
+with Django's encoder otherwise. Both produce compact output (no spaces
+after separators); orjson writes NaN and infinities as ``null``.
+"""
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+_django_default = DjangoJSONEncoder().default
+
+
+def dumps(value):
+    """Encode ``value`` as compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_django_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """Drop-in ``JsonResponse`` encoded with ``dumps``"""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def columns(fields, rows, time_field="received_at"):
+    """Column-oriented JSON shape of ``rows``: ``{"t": [...], field: [...]}``.
+
+    Each field name is written once instead of once per row, and arrays of
+    numbers compress far better than interleaved records. The time field
+    is renamed ``t``.
+    """
+    values = list(zip(*rows)) if rows else [()] * len(fields)
+    return {
+        "t" if field == time_field else field: list(column)
+        for field, column in zip(fields, values)
+    }
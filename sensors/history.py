@@ -0,0 +1,192 @@
+"""History query engine: sargable filters, keyset pages and cheap totals.
+
+Day filters become half-open ``received_at`` ranges in the current
+timezone, so they use the index (and prune monthly partitions) instead of
+casting every row to a date. Pages are cut with a keyset cursor on
+``(received_at, id)``: the next page starts right after the last row shown
+rather than at an ``OFFSET``, so a deep page costs the same as the first.
+Page statistics come from one aggregate, cached per filter until ingest
+touches them; the approximate total is summed from the daily rollups.
+"""
+
+import hashlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Avg, Count, Min, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .cache import ALL_READINGS, cached, device_tag
+from .conditional import data_version
+from .models import DailyRollup, SensorReading
+from .services import EXCLUDED_DEVICE_IDS, device_states
+
+HISTORY_PAGE_SIZE = 50
+
+# Sources of the page statistics: the raw rows or the daily rollups
+HISTORY_TOTALS = ("exact", "approx")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def parse_day(value):
+    """The date of a YYYY-MM-DD filter value, or None if it is empty or invalid"""
+    try:
+        return parse_date(value) if value else None
+    except ValueError:
+        return None
+
+
+def start_of_day(value):
+    """Aware midnight of a YYYY-MM-DD string in the current timezone, or None"""
+    day = parse_day(value)
+    if day is None:
+        return None
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def end_of_day(value):
+    """Aware midnight after a YYYY-MM-DD day, or None if it is invalid or the last date"""
+    day = parse_day(value)
+    if day is None or day == date.max:
+        return None
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+
+
+def history_readings(device_id="", date_from="", date_to=""):
+    """Readings matching the history filters, newest first, without test devices"""
+    query = ~Q(device_id__in=EXCLUDED_DEVICE_IDS)
+    if device_id:
+        query &= Q(device_id=device_id)
+    start = start_of_day(date_from)
+    if start:
+        query &= Q(received_at__gte=start)
+    end = end_of_day(date_to)
+    if end:
+        query &= Q(received_at__lt=end)
+    return SensorReading.objects.filter(query).order_by("-received_at", "-id")
+
+
+def encode_cursor(reading):
+    """Opaque page cursor of a reading: ``<microseconds since epoch>_<id>``"""
+    return f"{(reading.received_at - _EPOCH) // timedelta(microseconds=1)}_{reading.pk}"
+
+
+def decode_cursor(cursor):
+    """``(received_at, id)`` of a cursor; ValueError if it is malformed"""
+    micros, _, pk = cursor.partition("_")
+    try:
+        return _EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except OverflowError:
+        raise ValueError(f"Cursor out of range: {cursor!r}")
+
+
+class HistoryPage:
+    """One keyset page of readings, newest first"""
+
+    def __init__(self, readings, has_next, has_previous):
+        self.readings = readings
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    @property
+    def next_cursor(self):
+        """Cursor of the page of older readings"""
+        return encode_cursor(self.readings[-1]) if self.has_next else None
+
+    @property
+    def previous_cursor(self):
+        """Cursor of the page of newer readings"""
+        return encode_cursor(self.readings[0]) if self.has_previous else None
+
+
+def history_page(readings, after=None, before=None, size=HISTORY_PAGE_SIZE):
+    """The page of ``readings`` older than cursor ``after`` or newer than ``before``.
+
+    ``readings`` is a ``history_readings`` queryset. Without a cursor the
+    newest page is returned. Raises ValueError for a malformed cursor.
+    """
+    if before:
+        received_at, pk = decode_cursor(before)
+        # Rows just newer than the cursor, walked upwards from it
+        rows = list(
+            readings.filter(received_at__gte=received_at)
+            .exclude(received_at=received_at, id__lte=pk)
+            .order_by("received_at", "id")[: size + 1]
+        )
+        if len(rows) <= size:
+            # Back at the top: show a full newest page
+            return history_page(readings, size=size)
+        return HistoryPage(rows[:size][::-1], has_next=True, has_previous=True)
+
+    if after:
+        received_at, pk = decode_cursor(after)
+        readings = readings.filter(received_at__lte=received_at).exclude(
+            received_at=received_at, id__gte=pk
+        )
+    rows = list(readings[: size + 1])
+    return HistoryPage(rows[:size], has_next=len(rows) > size, has_previous=bool(after))
+
+
+def _rollup_total(device_id, date_from, date_to):
+    """Readings counted by the daily rollups, or None if they miss part of the range.
+
+    Readings removed by retention are still counted. The rollups miss
+    part of the range when they start after the oldest matching reading,
+    e.g. on a database that was never backfilled.
+    """
+    rollups = DailyRollup.objects.exclude(device_id__in=EXCLUDED_DEVICE_IDS)
+    if device_id:
+        rollups = rollups.filter(device_id=device_id)
+    first, last = parse_day(date_from), parse_day(date_to)
+    if first:
+        rollups = rollups.filter(bucket__gte=first)
+    if last:
+        rollups = rollups.filter(bucket__lte=last)
+    sums = rollups.aggregate(total=Sum("reading_count"), first=Min("bucket"))
+
+    oldest = (
+        history_readings(device_id, date_from, date_to)
+        .order_by("received_at")
+        .values_list("received_at", flat=True)
+        .first()
+    )
+    if oldest is None:
+        return sums["total"] or 0
+    if sums["first"] is None or sums["first"] > timezone.localdate(oldest):
+        return None
+    return sums["total"]
+
+
+def history_stats(device_id="", date_from="", date_to="", mode="exact"):
+    """``total``, ``avg_temp`` and ``avg_humidity`` of the filtered readings.
+
+    One aggregate over the raw rows, cached until a matching reading is
+    ingested. With ``"approx"`` the total is summed from the daily rollups
+    instead of counted, unless they do not cover the range.
+    """
+
+    def compute():
+        readings = history_readings(device_id, date_from, date_to)
+        averages = {"avg_temp": Avg("temperature_c"), "avg_humidity": Avg("humidity")}
+        if mode == "approx":
+            total = _rollup_total(device_id, date_from, date_to)
+            if total is not None:
+                return {"total": total, **readings.aggregate(**averages)}
+        return readings.aggregate(total=Count("id"), **averages)
+
+    # Device ids are free text; hash the filters into a safe cache key
+    filters = "\n".join((mode, device_id, date_from, date_to))
+    digest = hashlib.sha1(filters.encode()).hexdigest()
+    tags = [device_tag(device_id)] if device_id else [ALL_READINGS]
+    # Keyed on the version of all readings that the page's ETag already read
+    return cached(f"history_stats:{digest}", tags, compute, version=data_version()[0])
+
+
+def history_devices():
+    """Device ids offered by the history filter, cached until the next ingest"""
+    return cached(
+        "history_devices",
+        [ALL_READINGS],
+        lambda: list(device_states().values_list("device_id", flat=True)),
+    )
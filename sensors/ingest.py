@@ -0,0 +1,206 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import invalidate_readings
+from .models import DeviceState, SensorReading
+from .rollups import apply_readings
+from .stream import publish_readings
+
+# SensorReading field -> (TTN decoded payload field, type)
+FIELD_MAP = {
+    "battery_voltage": ("field1", float),
+    "humidity": ("field3", float),
+    "motion_counts": ("field4", int),
+    "temperature_c": ("field5", float),
+}
+
+# Upper bound on the number of (device_id, received_at) pairs per lookup query
+DUPLICATE_LOOKUP_CHUNK = 500
+
+
+class InvalidReading(ValueError):
+    """Raised when an ingest payload cannot be turned into a SensorReading"""
+
+
+def _object(payload, key):
+    """``payload[key]`` as a dict, {} when missing; raises for any other shape"""
+    value = payload.get(key) or {}
+    if not isinstance(value, dict):
+        raise InvalidReading(f"{key} must be an object")
+    return value
+
+
+def parse_reading(payload):
+    """Normalise a TTN uplink or a flat reading dict into SensorReading field values.
+
+    Accepts the Storage API ``{"result": {...}}`` wrapper, raw TTN uplinks
+    (``end_device_ids`` / ``uplink_message.decoded_payload``) and flat
+    ``{"device_id": ..., "temperature_c": ...}`` or ``field1..field5`` bodies.
+    Raises ``InvalidReading`` for anything that cannot be stored.
+    """
+    if not isinstance(payload, dict):
+        raise InvalidReading("Reading must be a JSON object")
+    if isinstance(payload.get("result"), dict):
+        payload = payload["result"]
+
+    device_ids = _object(payload, "end_device_ids")
+    device_id = payload.get("device_id") or device_ids.get("device_id")
+    rx_metadata = payload.get("rx_metadata") or [{}]
+    if not isinstance(rx_metadata, list) or not isinstance(rx_metadata[0], dict):
+        raise InvalidReading("rx_metadata must be a list of objects")
+    received_at_raw = payload.get("received_at") or rx_metadata[0].get("time")
+
+    # Extract fields by expected mapping
+    uplink = _object(payload, "uplink_message")
+    fields = _object(uplink, "decoded_payload") or _object(payload, "fields") or payload
+    values = {}
+    for name, (ttn_name, cast) in FIELD_MAP.items():
+        value = fields.get(ttn_name)
+        if value is None:
+            value = fields.get(name)
+        if value is not None:
+            try:
+                value = cast(value)
+            except (TypeError, ValueError):
+                raise InvalidReading(f"{name} must be a number")
+        values[name] = value
+
+    # Parse timestamp
+    if received_at_raw in (None, ""):
+        received_at = timezone.now()
+    else:
+        received_at = (
+            parse_datetime(received_at_raw) if isinstance(received_at_raw, str) else None
+        )
+        if received_at is None:
+            raise InvalidReading("received_at must be an ISO 8601 timestamp")
+        if timezone.is_naive(received_at):
+            received_at = timezone.make_aware(received_at)
+
+    return {
+        "device_id": str(device_id).strip() if device_id else "unknown-device",
+        "received_at": received_at,
+        **values,
+    }
+
+
+def _stored_rows(keys):
+    """Return (device_id, received_at) -> (id, created_at) for the stored readings"""
+    stored = {}
+    keys = list(keys)
+    for start in range(0, len(keys), DUPLICATE_LOOKUP_CHUNK):
+        condition = Q()
+        for device_id, received_at in keys[start : start + DUPLICATE_LOOKUP_CHUNK]:
+            condition |= Q(device_id=device_id, received_at=received_at)
+        for pk, device_id, received_at, created_at in SensorReading.objects.filter(
+            condition
+        ).values_list("id", "device_id", "received_at", "created_at"):
+            stored[(device_id, received_at)] = (pk, created_at)
+    return stored
+
+
+def store_readings(rows):
+    """Insert parsed readings in one transaction, skipping duplicates.
+
+    This is the shared write path of every ingest route. ``rows`` are dicts
+    from ``parse_reading``. Duplicates within the batch are dropped up front;
+    duplicates of stored readings are left to the (device_id, received_at)
+    unique constraint via ``bulk_create(ignore_conflicts=True)``, which also
+    settles races between concurrent ingest paths. Rows whose stored
+    ``created_at`` matches the one stamped on insert are ours.
+
+    Returns one ``(status, reading)`` tuple per row where status is
+    ``"created"`` or ``"duplicate"``; for duplicates ``reading.pk`` is the
+    id of the reading that was already stored.
+    """
+    results = []
+    pending = {}
+    for row in rows:
+        key = (row["device_id"], row["received_at"])
+        if key in pending:
+            results.append(("duplicate", pending[key]))
+            continue
+        reading = SensorReading(**row)
+        pending[key] = reading
+        results.append(("created", reading))
+    if not pending:
+        return results
+
+    with transaction.atomic():
+        SensorReading.objects.bulk_create(pending.values(), ignore_conflicts=True)
+        stored = _stored_rows(pending)
+        new = []
+        for key, reading in pending.items():
+            pk, created_at = stored[key]
+            reading.pk = pk
+            reading._state.adding = False
+            if created_at == reading.created_at:
+                new.append(reading)
+        record_readings(new)
+
+    created = {id(reading) for reading in new}
+    return [
+        (status if id(reading) in created else "duplicate", reading)
+        for status, reading in results
+    ]
+
+
+def record_readings(readings):
+    """Fold freshly stored readings into ``DeviceState`` and the rollup tables.
+
+    Every ingest path calls this after inserting so that pages needing "the
+    latest reading per device" read one row per device instead of sorting
+    ``SensorReading``. Readings older than the stored state only bump the
+    counters; the last values are only replaced by a newer reading. Once the
+    readings commit, cached page data depending on them is invalidated and
+    they are pushed to live stream clients.
+    """
+    readings = list(readings)
+    by_device = defaultdict(list)
+    for reading in readings:
+        by_device[reading.device_id].append(reading)
+    if not by_device:
+        return
+
+    today = timezone.localdate()
+    with transaction.atomic():
+        for device_id, items in by_device.items():
+            state, _ = DeviceState.objects.select_for_update().get_or_create(
+                device_id=device_id
+            )
+            newest = max(items, key=lambda r: (r.received_at, r.pk or 0))
+            if state.last_seen is None or newest.received_at >= state.last_seen:
+                state.last_reading = newest
+                state.battery_voltage = newest.battery_voltage
+                state.humidity = newest.humidity
+                state.motion_counts = newest.motion_counts
+                state.temperature_c = newest.temperature_c
+                state.last_seen = newest.received_at
+
+            if state.today_date != today:
+                state.today_date = today
+                state.today_count = 0
+            state.today_count += sum(
+                1 for r in items if timezone.localdate(r.received_at) == today
+            )
+            state.reading_count += len(items)
+            state.save()
+
+        apply_readings(readings)
+        transaction.on_commit(lambda: invalidate_readings(readings))
+        transaction.on_commit(lambda: publish_readings(readings))
+
+
+def touch_devices(device_ids):
+    """Mark devices whose stored readings were deleted as changed.
+
+    Retention calls this for the devices it deleted readings of: their
+    ``updated_at`` is what their data version (and so their ETags and cached
+    pages) is built from. ``reading_count`` stays the lifetime total, like
+    the rollups that outlive the raw rows.
+    """
+    DeviceState.objects.filter(device_id__in=list(device_ids)).update(updated_at=timezone.now())
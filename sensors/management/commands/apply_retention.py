@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from sensors.retention import apply_retention, vacuum
+
+
+class Command(BaseCommand):
+    help = "Delete raw readings and rollups older than the retention policy"
+
+    def add_arguments(self, parser):
+        for tier in ("raw", "hourly", "daily"):
+            parser.add_argument(
+                f"--{tier}-days",
+                type=int,
+                help=f"Keep {tier} data for this many days (overrides SENSOR_RETENTION_DAYS)",
+            )
+        parser.add_argument("--batch-size", type=int, help="Rows deleted per transaction")
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Count expired rows without deleting"
+        )
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="Compact the database afterwards (SQLite locks it while it runs)",
+        )
+
+    def handle(self, *args, **options):
+        policy = dict(settings.SENSOR_RETENTION_DAYS)
+        for tier in policy:
+            if options.get(f"{tier}_days") is not None:
+                if options[f"{tier}_days"] < 1:
+                    raise CommandError(f"--{tier}-days must be at least 1")
+                policy[tier] = options[f"{tier}_days"]
+
+        reports = apply_retention(
+            policy, batch_size=options["batch_size"], dry_run=options["dry_run"]
+        )
+        for report in reports:
+            cutoff = report["cutoff"]
+            if isinstance(cutoff, datetime):
+                cutoff = f"{timezone.localtime(cutoff):%Y-%m-%d %H:%M}"
+            if options["dry_run"]:
+                self.stdout.write(
+                    f"🔍 {report['tier']}: {report['rows']} rows older than {cutoff} would be deleted"
+                )
+            else:
+                freed = "" if report["bytes"] is None else f", {filesizeformat(report['bytes'])} freed"
+                self.stdout.write(
+                    f"🗑️  {report['tier']}: deleted {report['rows']} rows older than {cutoff}{freed}"
+                )
+        kept = [tier for tier, days in policy.items() if days is None]
+        if kept:
+            self.stdout.write(f"♾️  Kept forever: {', '.join(kept)}")
+
+        if options["vacuum"] and not options["dry_run"]:
+            self.stdout.write("🧹 Vacuuming...")
+            freed = vacuum()
+            if freed is not None:
+                self.stdout.write(f"🧹 Vacuum freed {filesizeformat(freed)}")
+
+        total = sum(report["rows"] for report in reports)
+        verb = "would be deleted" if options["dry_run"] else "deleted"
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} rows {verb}"))
@@ -0,0 +1,299 @@
+import gzip
+import json
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from sensors.db import current_pragmas
+from sensors.export import EXPORT_FIELDS, _record
+from sensors import fastjson
+from sensors.ingest import store_readings
+from sensors.models import DailyRollup, DeviceState, HourlyRollup, SensorReading
+from sensors.series import build_series
+from sensors.services import device_status_summary
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Run performance benchmarks against throwaway data (rolled back afterwards)"
+
+    scenarios = ("device_status", "chart_series", "concurrency", "json_encoding")
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=self.scenarios)
+        parser.add_argument(
+            "--sizes",
+            default="10,100,500",
+            help="Comma separated list of data set sizes to run the scenario with",
+        )
+        parser.add_argument(
+            "--readers", type=int, default=4, help="Reader threads (concurrency)"
+        )
+        parser.add_argument(
+            "--writers", type=int, default=2, help="Writer threads (concurrency)"
+        )
+        parser.add_argument(
+            "--duration", type=float, default=5.0, help="Seconds per run (concurrency)"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(s) for s in options["sizes"].split(",") if s.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be a comma separated list of integers")
+
+        self.options = options
+        runner = getattr(self, f"bench_{options['scenario']}")
+        for size in sizes:
+            if not getattr(runner, "rolls_back", True):
+                runner(size)
+                continue
+            try:
+                with transaction.atomic():
+                    runner(size)
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+    def _report(self, label, size, queries, elapsed):
+        self.stdout.write(
+            f"{label:<24} size={size:<8} queries={queries:<5} time={elapsed * 1000:.1f}ms"
+        )
+
+    def bench_device_status(self, size):
+        """Device status summary: query count must not grow with the device count"""
+        now = timezone.now()
+        SensorReading.objects.bulk_create(
+            SensorReading(
+                device_id=f"benchmark-{i}",
+                temperature_c=20.0,
+                received_at=now - timedelta(minutes=i),
+            )
+            for i in range(size)
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            device_status_summary()
+            elapsed = time.perf_counter() - start
+        self._report("device_status", size, len(ctx.captured_queries), elapsed)
+
+    def bench_chart_series(self, size):
+        """Chart series: model-instance comprehensions vs the single values_list pass"""
+        now = timezone.now()
+        SensorReading.objects.bulk_create(
+            SensorReading(
+                device_id="benchmark",
+                temperature_c=20.0 + i % 10,
+                humidity=40.0 + i % 20,
+                received_at=now - timedelta(seconds=i),
+            )
+            for i in range(size)
+        )
+        readings = SensorReading.objects.filter(received_at__gte=now - timedelta(days=1))
+
+        def comprehensions():
+            chart_data = readings.order_by("received_at")
+            return (
+                [
+                    float(r.temperature_c)
+                    for r in chart_data
+                    if r.temperature_c is not None
+                ],
+                [
+                    r.received_at.strftime("%H:%M")
+                    for r in chart_data
+                    if r.temperature_c is not None
+                ],
+                [float(r.humidity) for r in chart_data if r.humidity is not None],
+                [
+                    r.received_at.strftime("%H:%M")
+                    for r in chart_data
+                    if r.humidity is not None
+                ],
+            )
+
+        for label, build in (
+            ("chart_series[models]", comprehensions),
+            ("chart_series[values]", lambda: build_series(readings)),
+        ):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                build()
+                elapsed = time.perf_counter() - start
+            self._report(label, size, len(ctx.captured_queries), elapsed)
+
+            # Second run under tracemalloc, which would otherwise skew the timing
+            tracemalloc.start()
+            build()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f"{'':<24} peak={peak / 1024:.0f}KiB per_row={peak / max(size, 1):.0f}B"
+            )
+
+    def bench_concurrency(self, size):
+        """Mixed reader and writer threads on SensorReading.
+
+        Threads need committed data and their own connections, so this
+        scenario commits and deletes its benchmark-* rows afterwards instead
+        of running in the rolled-back transaction. Compare pragma profiles
+        with SQLITE_PRAGMA_PROFILE=default / production.
+        """
+        readers, writers = self.options["readers"], self.options["writers"]
+        duration = self.options["duration"]
+        if connection.vendor == "sqlite":
+            self.stdout.write(f"pragmas: {current_pragmas(connection)}")
+
+        now = timezone.now()
+        SensorReading.objects.bulk_create(
+            SensorReading(
+                device_id=f"benchmark-{i % 10}",
+                temperature_c=20.0,
+                received_at=now - timedelta(seconds=i),
+            )
+            for i in range(size)
+        )
+        stats = {"read": [], "write": []}
+        errors = {"read": 0, "write": 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def read(n, i):
+            device_id = f"benchmark-{i % 10}"
+            list(
+                SensorReading.objects.filter(device_id=device_id).order_by(
+                    "-received_at"
+                )[:50]
+            )
+            SensorReading.objects.filter(
+                received_at__gte=now - timedelta(hours=1)
+            ).count()
+
+        def write(n, i):
+            store_readings(
+                [
+                    {
+                        "device_id": f"benchmark-writer-{n}",
+                        "received_at": now + timedelta(milliseconds=i),
+                        "temperature_c": 21.0,
+                    }
+                ]
+            )
+
+        def worker(role, op, n):
+            latencies, failed, i = [], 0, 0
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        op(n, i)
+                        latencies.append(time.perf_counter() - start)
+                    except OperationalError:
+                        failed += 1
+                    i += 1
+            finally:
+                connection.close()
+            with lock:
+                stats[role].extend(latencies)
+                errors[role] += failed
+
+        threads = [
+            threading.Thread(target=worker, args=("read", read, n))
+            for n in range(readers)
+        ] + [
+            threading.Thread(target=worker, args=("write", write, n))
+            for n in range(writers)
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            for model in (SensorReading, DeviceState, HourlyRollup, DailyRollup):
+                model.objects.filter(device_id__startswith="benchmark-").delete()
+
+        for role, threads_count in (("read", readers), ("write", writers)):
+            latencies = sorted(stats[role])
+            p50 = latencies[len(latencies) // 2] if latencies else 0
+            p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+            label = f"concurrency[{role}]"
+            self.stdout.write(
+                f"{label:<24} size={size:<8} threads={threads_count:<3} "
+                f"ops/s={len(latencies) / duration:.0f} p50={p50 * 1000:.1f}ms "
+                f"p95={p95 * 1000:.1f}ms errors={errors[role]}"
+            )
+
+    bench_concurrency.rolls_back = False
+
+    def bench_json_encoding(self, size):
+        """History export payloads: encoder, record vs column shape, compression.
+
+        Try ``--sizes 100000``. Times cover encoding only; the rows are
+        fetched once beforehand.
+        """
+        now = timezone.now()
+        SensorReading.objects.bulk_create(
+            (
+                SensorReading(
+                    device_id=f"benchmark-{i % 10}",
+                    temperature_c=20.0 + (i % 100) / 10,
+                    humidity=40.0 + i % 20,
+                    battery_voltage=3.6 - (i % 50) / 100,
+                    motion_counts=i % 3,
+                    received_at=now - timedelta(seconds=i),
+                )
+                for i in range(size)
+            ),
+            batch_size=5000,
+        )
+        rows = list(
+            SensorReading.objects.filter(device_id__startswith="benchmark-")
+            .order_by("received_at")
+            .values_list(*EXPORT_FIELDS)
+        )
+        records = [_record(row) for row in rows]
+        shaped = fastjson.columns(
+            ("t",) + EXPORT_FIELDS[1:],
+            [(record["timestamp"], *row[1:]) for record, row in zip(records, rows)],
+        )
+
+        encoders = [
+            ("json[records]", lambda: json.dumps(records).encode()),
+            ("json[columns]", lambda: json.dumps(shaped).encode()),
+        ]
+        if fastjson.orjson is not None:
+            encoders += [
+                ("orjson[records]", lambda: fastjson.orjson.dumps(records)),
+                ("orjson[columns]", lambda: fastjson.orjson.dumps(shaped)),
+            ]
+        else:
+            self.stdout.write("orjson is not installed; only the stdlib encoder is measured")
+
+        for label, encode in encoders:
+            start = time.perf_counter()
+            body = encode()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label:<24} size={size:<8} time={elapsed * 1000:.1f}ms "
+                f"bytes={len(body)} gzip={len(gzip.compress(body, 6))}"
+                + self._brotli_size(body)
+            )
+
+    def _brotli_size(self, body):
+        try:
+            import brotli
+        except ImportError:
+            return ""
+        return f" br={len(brotli.compress(body, quality=settings.SENSOR_BROTLI_QUALITY))}"
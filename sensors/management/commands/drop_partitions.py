@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sensors.partitioning import add_months, drop_partitions, partitioning_mode
+
+
+class Command(BaseCommand):
+    help = "Drop monthly partitions of raw readings older than a retention window"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-months",
+            type=int,
+            required=True,
+            help="Keep this many whole months before the current one",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="List partitions without dropping"
+        )
+
+    def handle(self, *args, **options):
+        if options["older_than_months"] < 1:
+            raise CommandError("--older-than-months must be at least 1")
+        if partitioning_mode() is None:
+            raise CommandError(
+                "Readings are not partitioned; this needs PostgreSQL and partition_readings"
+            )
+
+        before = add_months(timezone.now().date(), -options["older_than_months"])
+        names = drop_partitions(before, dry_run=options["dry_run"])
+        verb = "Would drop" if options["dry_run"] else "Dropped"
+        for name in names:
+            self.stdout.write(f"🗑️  {verb} {name}")
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ {verb} {len(names)} partitions before {before}")
+        )
@@ -2,8 +2,8 @@ import os
 import requests
 import json
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from sensors.models import SensorReading
+from sensors.ingest import InvalidReading, parse_reading, store_readings
+from sensors.models import DeviceState
 
 
 class Command(BaseCommand):
@@ -27,7 +27,7 @@ class Command(BaseCommand):
 
             if response.status_code == 200:
                 lines = response.text.strip().split("\n")
-                new_count = 0
+                rows = []
                 total_processed = 0
 
                 for line in lines:
@@ -43,25 +43,17 @@ class Command(BaseCommand):
 
                         if received_at and decoded:
                             total_processed += 1
+                            row = parse_reading(result)
+                            row["device_id"] = device_id
+                            rows.append(row)
 
-                            # Check if this reading already exists
-                            if not SensorReading.objects.filter(
-                                device_id=device_id, received_at=received_at
-                            ).exists():
-
-                                SensorReading.objects.create(
-                                    device_id=device_id,
-                                    battery_voltage=decoded.get("field1"),
-                                    humidity=decoded.get("field3"),
-                                    motion_counts=decoded.get("field4"),
-                                    temperature_c=decoded.get("field5"),
-                                    received_at=received_at,
-                                )
-                                new_count += 1
-
-                    except (json.JSONDecodeError, KeyError) as e:
+                    except (json.JSONDecodeError, KeyError, InvalidReading) as e:
                         continue
 
+                # Existing readings are skipped by the unique (device_id, received_at) constraint
+                results = store_readings(rows)
+                new_count = sum(1 for status, _ in results if status == "created")
+
                 self.stdout.write(
                     self.style.SUCCESS(
                         f"✅ Processed {total_processed} readings, added {new_count} new ones"
@@ -70,14 +62,10 @@ class Command(BaseCommand):
 
                 if new_count > 0:
                     # Show latest reading
-                    latest = (
-                        SensorReading.objects.filter(device_id=device_id)
-                        .order_by("-received_at")
-                        .first()
-                    )
+                    latest = DeviceState.objects.filter(device_id=device_id).first()
                     if latest:
                         self.stdout.write(
-                            f"📊 Latest: {latest.received_at.strftime('%Y-%m-%d %H:%M:%S')} - "
+                            f"📊 Latest: {latest.last_seen.strftime('%Y-%m-%d %H:%M:%S')} - "
                             f"Temp: {latest.temperature_c}°C, Humidity: {latest.humidity}%, "
                             f"Battery: {latest.battery_voltage}V"
                         )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sensors.columnar import COLUMNAR_BATCH_SIZE, ColumnarUnavailable, import_dataset
+
+
+class Command(BaseCommand):
+    help = "Bulk-load sensor readings from a Parquet file or dataset directory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Parquet file or export_parquet directory")
+        parser.add_argument("--batch-size", type=int, default=COLUMNAR_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"📥 Importing readings from {options['path']}...")
+        try:
+            created, duplicates = import_dataset(
+                options["path"], batch_size=options["batch_size"]
+            )
+        except ColumnarUnavailable as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Imported {created} readings ({duplicates} already stored)"
+            )
+        )
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from sensors.partitioning import ensure_partitions, partition_table, partitioning_mode
+
+
+class Command(BaseCommand):
+    help = "Partition sensor readings by month on PostgreSQL (or make a TimescaleDB hypertable)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--timescale",
+            action="store_true",
+            help="Convert to a TimescaleDB hypertable with monthly chunks",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Future monthly partitions to create (native partitioning)",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning needs PostgreSQL; set DATABASE_URL")
+
+        mode = partitioning_mode()
+        if mode == "native":
+            names = ensure_partitions(options["months_ahead"])
+            self.stdout.write(f"⏭️  Already partitioned; ensured {', '.join(names)}")
+            return
+        if mode == "timescale":
+            self.stdout.write("⏭️  Already a TimescaleDB hypertable")
+            return
+
+        self.stdout.write("🗂️  Partitioning readings (the table is locked meanwhile)...")
+        try:
+            moved = partition_table(
+                timescale=options["timescale"], months_ahead=options["months_ahead"]
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options["timescale"]:
+            self.stdout.write(self.style.SUCCESS("✅ Readings are now a hypertable"))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Moved {moved} readings into monthly partitions")
+            )
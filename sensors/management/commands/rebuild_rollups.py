@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from sensors.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Backfill the hourly/daily rollup tables from raw sensor readings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help="Only rebuild buckets from this date (YYYY-MM-DD) onwards",
+        )
+        parser.add_argument("--device", help="Only rebuild rollups for this device id")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_date(options["since"])
+            if since is None:
+                raise CommandError("--since must be a date in YYYY-MM-DD format")
+
+        self.stdout.write("🔄 Rebuilding rollups...")
+        hourly, daily = rebuild_rollups(
+            since=since,
+            device_id=options["device"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Wrote {hourly} hourly and {daily} daily rollup rows"
+            )
+        )
@@ -0,0 +1,51 @@
+import asyncio
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sensors.mqtt_ingest import MqttIngestWorker, paho_messages
+
+
+class Command(BaseCommand):
+    help = "Consume TTN uplinks over MQTT and write them to the database in micro-batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queue-size", type=int, default=1000)
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--flush-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait for a batch to fill before writing it",
+        )
+        parser.add_argument(
+            "--metrics-interval",
+            type=float,
+            default=30.0,
+            help="Seconds between queue depth / latency metric reports",
+        )
+
+    def handle(self, *args, **options):
+        broker = os.getenv("TTN_BROKER", "eu1.cloud.thethings.network")
+        port = int(os.getenv("TTN_PORT", "1883"))
+        username = os.getenv("TTN_USERNAME")
+        password = os.getenv("TTN_PASSWORD")
+        device_id = os.getenv("TTN_DEVICE_ID")
+        if not all([username, password]):
+            raise CommandError("TTN_USERNAME and TTN_PASSWORD must be set")
+
+        # Without TTN_DEVICE_ID, subscribe to every device of the application
+        topic = f"v3/{username}/devices/{device_id or '+'}/up"
+        worker = MqttIngestWorker(
+            paho_messages(broker, port, username, password, topic),
+            queue_size=options["queue_size"],
+            batch_size=options["batch_size"],
+            flush_interval=options["flush_interval"],
+            metrics_interval=options["metrics_interval"],
+            default_device_id=device_id,
+        )
+        self.stdout.write(self.style.SUCCESS(f"🚀 Ingesting MQTT uplinks from {topic}"))
+        try:
+            asyncio.run(worker.run())
+        except KeyboardInterrupt:
+            self.stdout.write("🛑 Stopped")
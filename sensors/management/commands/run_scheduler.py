@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from sensors.scheduler import JOBS, run_due_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Run periodic background jobs (TTN polling, ...) outside the web process"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Run due jobs once and exit"
+        )
+        parser.add_argument(
+            "--job",
+            help="Run only this job now, ignoring its interval (implies --once)",
+        )
+
+    def handle(self, *args, **options):
+        if options["job"]:
+            if options["job"] not in JOBS:
+                raise CommandError(
+                    f"Unknown job {options['job']!r}; choose from: {', '.join(JOBS)}"
+                )
+            if run_job(options["job"], force=True):
+                self.stdout.write(self.style.SUCCESS(f"✅ Ran {options['job']}"))
+            else:
+                self.stdout.write(f"⏭️  {options['job']} is running elsewhere")
+            return
+
+        self.stdout.write(f"⏱️  Scheduler started with jobs: {', '.join(JOBS)}")
+        while True:
+            for name in run_due_jobs():
+                self.stdout.write(f"✅ Ran {name}")
+            close_old_connections()
+            if options["once"]:
+                return
+            time.sleep(settings.SENSOR_SCHEDULER_TICK)
@@ -0,0 +1,110 @@
+"""Response compression for JSON and CSV bodies, and the scheduler start.
+
+Negotiates brotli (with the ``brotli`` package, see
+``requirements.speedups.txt``) or gzip from ``Accept-Encoding`` for
+responses whose type is in ``SENSOR_COMPRESS_TYPES`` and which are at least
+``SENSOR_COMPRESS_MIN_BYTES`` long; streamed exports are compressed chunk
+by chunk. HTML pages are left alone because they carry CSRF tokens that
+compression can leak (BREACH), and so are Server-Sent Events, which must
+reach the client unbuffered.
+
+``SchedulerMiddleware`` starts the in-process scheduler on the first
+request of any kind, before conditional views can answer 304 without
+running.
+"""
+
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+from .scheduler import start_scheduler
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+_CODING = re.compile(r"^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$")
+
+
+def accepted_encoding(header):
+    """The best coding we can produce for an ``Accept-Encoding`` header, or None"""
+    weights = {}
+    for item in header.split(","):
+        match = _CODING.match(item)
+        if not match:
+            continue
+        try:
+            weights[match[1].lower()] = float(match[2]) if match[2] else 1.0
+        except ValueError:
+            continue
+    available = ("br", "gzip") if brotli is not None else ("gzip",)
+    best = None
+    for coding in available:
+        weight = weights.get(coding, weights.get("*", 0))
+        if weight > 0 and (best is None or weight > best[1]):
+            best = (coding, weight)
+    return best[0] if best else None
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=settings.SENSOR_BROTLI_QUALITY)
+    for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress(content, coding):
+    if coding == "br":
+        return brotli.compress(content, quality=settings.SENSOR_BROTLI_QUALITY)
+    return compress_string(content)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        if content_type not in settings.SENSOR_COMPRESS_TYPES:
+            return response
+        if response.has_header("Content-Encoding"):
+            return response
+        if response.streaming:
+            if response.is_async:
+                return response
+        elif len(response.content) < settings.SENSOR_COMPRESS_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        coding = accepted_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            if coding == "br":
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers["Content-Length"]
+        else:
+            compressed = compress(response.content, coding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # The body differs from the uncompressed one byte for byte
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = coding
+        return response
+
+
+class SchedulerMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        # Background jobs (TTN polling, retention); requests never wait on them
+        start_scheduler()
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+
+def populate_device_state(apps, schema_editor):
+    SensorReading = apps.get_model('sensors', 'SensorReading')
+    DeviceState = apps.get_model('sensors', 'DeviceState')
+    today = timezone.localdate()
+
+    rows = (
+        SensorReading.objects.values('device_id')
+        .annotate(
+            reading_count=Count('id'),
+            today_count=Count('id', filter=Q(received_at__date=today)),
+            last_seen=Max('received_at'),
+        )
+        .order_by()
+    )
+    states = []
+    for row in rows:
+        latest = (
+            SensorReading.objects.filter(device_id=row['device_id'])
+            .order_by('-received_at', '-id')
+            .first()
+        )
+        states.append(
+            DeviceState(
+                device_id=row['device_id'],
+                last_reading_id=latest.id,
+                battery_voltage=latest.battery_voltage,
+                humidity=latest.humidity,
+                motion_counts=latest.motion_counts,
+                temperature_c=latest.temperature_c,
+                last_seen=row['last_seen'],
+                reading_count=row['reading_count'],
+                today_count=row['today_count'],
+                today_date=today,
+            )
+        )
+    DeviceState.objects.bulk_create(states)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=128, unique=True)),
+                ('battery_voltage', models.FloatField(blank=True, null=True)),
+                ('humidity', models.FloatField(blank=True, null=True)),
+                ('motion_counts', models.IntegerField(blank=True, null=True)),
+                ('temperature_c', models.FloatField(blank=True, null=True)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+                ('reading_count', models.PositiveIntegerField(default=0)),
+                ('today_count', models.PositiveIntegerField(default=0)),
+                ('today_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_reading', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='sensors.sensorreading')),
+            ],
+            options={
+                'ordering': ['device_id'],
+            },
+        ),
+        migrations.RunPython(populate_device_state, migrations.RunPython.noop),
+    ]
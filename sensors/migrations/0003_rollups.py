@@ -0,0 +1,127 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:05
+
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, Max, Min, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncHour
+
+
+# Frozen copies of the sensors.rollups helpers as of this migration, so later
+# edits to the app code cannot change what this migration does.
+METRICS = {
+    'temperature': 'temperature_c',
+    'humidity': 'humidity',
+    'battery': 'battery_voltage',
+}
+
+
+def rollup_aggregates():
+    aggregates = {'reading_count': Count('id')}
+    for prefix, field in METRICS.items():
+        aggregates[f'{prefix}_count'] = Count(field)
+        aggregates[f'{prefix}_sum'] = Coalesce(Sum(field), 0.0)
+        aggregates[f'{prefix}_sumsq'] = Coalesce(
+            Sum(F(field) * F(field), output_field=FloatField()), 0.0
+        )
+        aggregates[f'{prefix}_min'] = Min(field)
+        aggregates[f'{prefix}_max'] = Max(field)
+    aggregates['motion_count'] = Count('motion_counts')
+    aggregates['motion_sum'] = Coalesce(Sum('motion_counts'), 0)
+    return aggregates
+
+
+def rebuild(model, trunc, readings, batch_size=1000):
+    rows = (
+        readings.annotate(bucket=trunc('received_at'))
+        .values('device_id', 'bucket')
+        .annotate(**rollup_aggregates())
+        .order_by()
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(model(**row))
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def backfill_rollups(apps, readings):
+    rebuild(apps.get_model('sensors', 'HourlyRollup'), TruncHour, readings)
+    rebuild(apps.get_model('sensors', 'DailyRollup'), TruncDate, readings)
+
+
+def populate_rollups(apps, schema_editor):
+    SensorReading = apps.get_model('sensors', 'SensorReading')
+    backfill_rollups(apps, SensorReading.objects.all())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0002_devicestate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=128)),
+                ('reading_count', models.PositiveIntegerField(default=0)),
+                ('temperature_count', models.PositiveIntegerField(default=0)),
+                ('temperature_sum', models.FloatField(default=0)),
+                ('temperature_sumsq', models.FloatField(default=0)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('humidity_count', models.PositiveIntegerField(default=0)),
+                ('humidity_sum', models.FloatField(default=0)),
+                ('humidity_sumsq', models.FloatField(default=0)),
+                ('humidity_min', models.FloatField(blank=True, null=True)),
+                ('humidity_max', models.FloatField(blank=True, null=True)),
+                ('battery_count', models.PositiveIntegerField(default=0)),
+                ('battery_sum', models.FloatField(default=0)),
+                ('battery_sumsq', models.FloatField(default=0)),
+                ('battery_min', models.FloatField(blank=True, null=True)),
+                ('battery_max', models.FloatField(blank=True, null=True)),
+                ('motion_count', models.PositiveIntegerField(default=0)),
+                ('motion_sum', models.BigIntegerField(default=0)),
+                ('bucket', models.DateField(db_index=True)),
+            ],
+            options={
+                'ordering': ['-bucket', 'device_id'],
+                'constraints': [models.UniqueConstraint(fields=('device_id', 'bucket'), name='unique_daily_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=128)),
+                ('reading_count', models.PositiveIntegerField(default=0)),
+                ('temperature_count', models.PositiveIntegerField(default=0)),
+                ('temperature_sum', models.FloatField(default=0)),
+                ('temperature_sumsq', models.FloatField(default=0)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('humidity_count', models.PositiveIntegerField(default=0)),
+                ('humidity_sum', models.FloatField(default=0)),
+                ('humidity_sumsq', models.FloatField(default=0)),
+                ('humidity_min', models.FloatField(blank=True, null=True)),
+                ('humidity_max', models.FloatField(blank=True, null=True)),
+                ('battery_count', models.PositiveIntegerField(default=0)),
+                ('battery_sum', models.FloatField(default=0)),
+                ('battery_sumsq', models.FloatField(default=0)),
+                ('battery_min', models.FloatField(blank=True, null=True)),
+                ('battery_max', models.FloatField(blank=True, null=True)),
+                ('motion_count', models.PositiveIntegerField(default=0)),
+                ('motion_sum', models.BigIntegerField(default=0)),
+                ('bucket', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'ordering': ['-bucket', 'device_id'],
+                'constraints': [models.UniqueConstraint(fields=('device_id', 'bucket'), name='unique_hourly_rollup')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,111 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:09
+
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, Max, Min, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncHour
+
+
+# Frozen copies of the sensors.rollups helpers as of this migration, so later
+# edits to the app code cannot change what this migration does.
+METRICS = {
+    'temperature': 'temperature_c',
+    'humidity': 'humidity',
+    'battery': 'battery_voltage',
+}
+
+
+def rollup_aggregates():
+    aggregates = {'reading_count': Count('id')}
+    for prefix, field in METRICS.items():
+        aggregates[f'{prefix}_count'] = Count(field)
+        aggregates[f'{prefix}_sum'] = Coalesce(Sum(field), 0.0)
+        aggregates[f'{prefix}_sumsq'] = Coalesce(
+            Sum(F(field) * F(field), output_field=FloatField()), 0.0
+        )
+        aggregates[f'{prefix}_min'] = Min(field)
+        aggregates[f'{prefix}_max'] = Max(field)
+    aggregates['motion_count'] = Count('motion_counts')
+    aggregates['motion_sum'] = Coalesce(Sum('motion_counts'), 0)
+    return aggregates
+
+
+def rebuild(model, trunc, readings, batch_size=1000):
+    rows = (
+        readings.annotate(bucket=trunc('received_at'))
+        .values('device_id', 'bucket')
+        .annotate(**rollup_aggregates())
+        .order_by()
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(model(**row))
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def backfill_rollups(apps, readings):
+    rebuild(apps.get_model('sensors', 'HourlyRollup'), TruncHour, readings)
+    rebuild(apps.get_model('sensors', 'DailyRollup'), TruncDate, readings)
+
+
+def recount_today(apps, devices):
+    """Recompute DeviceState.today_count of ``devices`` from the stored readings"""
+    SensorReading = apps.get_model('sensors', 'SensorReading')
+    DeviceState = apps.get_model('sensors', 'DeviceState')
+    for state in DeviceState.objects.filter(device_id__in=devices, today_date__isnull=False):
+        state.today_count = SensorReading.objects.filter(
+            device_id=state.device_id, received_at__date=state.today_date
+        ).count()
+        state.save(update_fields=['today_count'])
+
+
+def delete_duplicate_readings(apps, schema_editor):
+    """Keep the first stored reading of every (device_id, received_at) pair"""
+    SensorReading = apps.get_model('sensors', 'SensorReading')
+    DeviceState = apps.get_model('sensors', 'DeviceState')
+
+    devices = set()
+    duplicates = (
+        SensorReading.objects.values('device_id', 'received_at')
+        .annotate(keep=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for group in duplicates:
+        deleted, _ = (
+            SensorReading.objects.filter(
+                device_id=group['device_id'], received_at=group['received_at']
+            )
+            .exclude(id=group['keep'])
+            .delete()
+        )
+        DeviceState.objects.filter(device_id=group['device_id']).update(
+            reading_count=F('reading_count') - deleted
+        )
+        devices.add(group['device_id'])
+    recount_today(apps, devices)
+
+    # The rollups backfilled by 0003 still count the duplicates
+    HourlyRollup = apps.get_model('sensors', 'HourlyRollup')
+    DailyRollup = apps.get_model('sensors', 'DailyRollup')
+    HourlyRollup.objects.filter(device_id__in=devices).delete()
+    DailyRollup.objects.filter(device_id__in=devices).delete()
+    backfill_rollups(apps, SensorReading.objects.filter(device_id__in=devices))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0003_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_readings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='sensorreading',
+            constraint=models.UniqueConstraint(fields=('device_id', 'received_at'), name='unique_device_reading'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0005_joblease'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sensorreading',
+            index=models.Index(fields=['device_id', '-received_at'], name='reading_device_recent_idx'),
+        ),
+        migrations.AlterField(
+            model_name='sensorreading',
+            name='device_id',
+            field=models.CharField(max_length=128),
+        ),
+    ]
@@ -1,8 +1,10 @@
 from django.db import models
+from django.utils import timezone
 
 
 class SensorReading(models.Model):
-    device_id = models.CharField(max_length=128, db_index=True)
+    # Indexed together with received_at, see Meta
+    device_id = models.CharField(max_length=128)
     battery_voltage = models.FloatField(null=True, blank=True)
     humidity = models.FloatField(null=True, blank=True)
     motion_counts = models.IntegerField(null=True, blank=True)
@@ -12,9 +14,142 @@ class SensorReading(models.Model):
 
     class Meta:
         ordering = ["-received_at", "-id"]
+        constraints = [
+            # One reading per device and uplink timestamp; ingest relies on it
+            # to skip duplicates without a lookup per reading
+            models.UniqueConstraint(
+                fields=["device_id", "received_at"], name="unique_device_reading"
+            )
+        ]
+        indexes = [
+            # Per-device "newest first" reads (device pages, last readings
+            # per device) walk this index instead of sorting; the unique
+            # constraint above serves ascending ranges
+            models.Index(fields=["device_id", "-received_at"], name="reading_device_recent_idx")
+        ]
 
     def __str__(self) -> str:
         return f"{self.device_id} @ {self.received_at:%Y-%m-%d %H:%M:%S}"
 
 
+class DeviceState(models.Model):
+    """Latest known values per device, maintained by the ingest paths."""
+
+    device_id = models.CharField(max_length=128, unique=True)
+    last_reading = models.ForeignKey(
+        SensorReading,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    battery_voltage = models.FloatField(null=True, blank=True)
+    humidity = models.FloatField(null=True, blank=True)
+    motion_counts = models.IntegerField(null=True, blank=True)
+    temperature_c = models.FloatField(null=True, blank=True)
+    last_seen = models.DateTimeField(null=True, blank=True)
+    reading_count = models.PositiveIntegerField(default=0)
+    today_count = models.PositiveIntegerField(default=0)
+    today_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["device_id"]
+
+    def __str__(self) -> str:
+        return self.device_id
+
+    @property
+    def today_readings(self) -> int:
+        """Readings received today; the counter resets lazily on the first reading of a new day"""
+        if self.today_date != timezone.localdate():
+            return 0
+        return self.today_count
+
+
+class ReadingRollup(models.Model):
+    """Pre-aggregated readings for one device over one time bucket.
+
+    Each metric keeps count/sum/min/max/sum of squares so averages and
+    standard deviations can be recombined across buckets without touching
+    the raw table.
+    """
+
+    device_id = models.CharField(max_length=128)
+    reading_count = models.PositiveIntegerField(default=0)
+    temperature_count = models.PositiveIntegerField(default=0)
+    temperature_sum = models.FloatField(default=0)
+    temperature_sumsq = models.FloatField(default=0)
+    temperature_min = models.FloatField(null=True, blank=True)
+    temperature_max = models.FloatField(null=True, blank=True)
+    humidity_count = models.PositiveIntegerField(default=0)
+    humidity_sum = models.FloatField(default=0)
+    humidity_sumsq = models.FloatField(default=0)
+    humidity_min = models.FloatField(null=True, blank=True)
+    humidity_max = models.FloatField(null=True, blank=True)
+    battery_count = models.PositiveIntegerField(default=0)
+    battery_sum = models.FloatField(default=0)
+    battery_sumsq = models.FloatField(default=0)
+    battery_min = models.FloatField(null=True, blank=True)
+    battery_max = models.FloatField(null=True, blank=True)
+    motion_count = models.PositiveIntegerField(default=0)
+    motion_sum = models.BigIntegerField(default=0)
+
+    # Rollup metric prefix -> SensorReading field
+    METRICS = {
+        "temperature": "temperature_c",
+        "humidity": "humidity",
+        "battery": "battery_voltage",
+    }
+
+    class Meta:
+        abstract = True
+
+    def __str__(self) -> str:
+        return f"{self.device_id} @ {self.bucket}"
+
+
+class HourlyRollup(ReadingRollup):
+    bucket = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ["-bucket", "device_id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["device_id", "bucket"], name="unique_hourly_rollup"
+            )
+        ]
+
+
+class DailyRollup(ReadingRollup):
+    bucket = models.DateField(db_index=True)
+
+    class Meta:
+        ordering = ["-bucket", "device_id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["device_id", "bucket"], name="unique_daily_rollup"
+            )
+        ]
+
+
+class JobLease(models.Model):
+    """Single-flight lock and last run time of a periodic background job.
+
+    Shared through the database, so only one process (web worker or
+    ``run_scheduler``) runs a given job at a time.
+    """
+
+    name = models.CharField(max_length=64, unique=True)
+    holder = models.CharField(max_length=128, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return self.name
+
+
 # Create your models here.
@@ -0,0 +1,266 @@
+"""Asyncio MQTT ingest worker.
+
+Uplinks are decoded as they arrive, queued on a bounded ``asyncio.Queue``
+and written with ``store_readings`` in micro-batches, straight to the
+database with no HTTP hop. When the database falls behind, the full queue
+makes the consumer wait, and that pressure reaches the broker connection
+instead of growing memory. Messages come from any async iterable of
+``(topic, payload)`` pairs, such as ``paho_messages`` for a real broker or
+a plain async generator in tests. A batch that fails to commit is retried
+with backoff, then stored reading by reading so one bad row cannot sink
+the rest; readings that still fail are logged and counted as ``failed``.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .ingest import InvalidReading, parse_reading, store_readings
+
+logger = logging.getLogger(__name__)
+
+# Cache key of the latest metrics snapshot, served by /api/ingest/metrics/
+METRICS_CACHE_KEY = "sensors:mqtt_ingest:metrics"
+
+
+class IngestMetrics:
+    """Counters and enqueue-to-commit latency of one worker"""
+
+    def __init__(self):
+        self.received = 0
+        self.created = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.queue_depth = 0
+        self.queue_capacity = 0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self._latency_total = 0.0
+        self._latency_count = 0
+
+    def observe_latency(self, seconds):
+        self.latency_last = seconds
+        self.latency_max = max(self.latency_max, seconds)
+        self._latency_total += seconds
+        self._latency_count += 1
+
+    def snapshot(self):
+        return {
+            "received": self.received,
+            "created": self.created,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "queue_depth": self.queue_depth,
+            "queue_capacity": self.queue_capacity,
+            "latency_ms": {
+                "last": round(self.latency_last * 1000, 1),
+                "avg": round(
+                    self._latency_total / self._latency_count * 1000
+                    if self._latency_count
+                    else 0.0,
+                    1,
+                ),
+                "max": round(self.latency_max * 1000, 1),
+            },
+        }
+
+
+def decode_message(payload, default_device_id=None):
+    """Turn a raw MQTT payload into ``parse_reading`` field values"""
+    try:
+        data = json.loads(payload)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise InvalidReading("Payload is not valid JSON")
+    row = parse_reading(data)
+    if row["device_id"] == "unknown-device" and default_device_id:
+        row["device_id"] = default_device_id
+    return row
+
+
+def _store_batch(rows):
+    """``store_readings`` on a usable connection of the calling thread"""
+    close_old_connections()
+    try:
+        return store_readings(rows)
+    finally:
+        # Drops a connection broken by this batch so the next one reconnects
+        close_old_connections()
+
+
+class MqttIngestWorker:
+    def __init__(
+        self,
+        source,
+        queue_size=1000,
+        batch_size=200,
+        flush_interval=1.0,
+        metrics_interval=30.0,
+        default_device_id=None,
+        max_attempts=5,
+        retry_delay=1.0,
+    ):
+        self.source = source
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.metrics_interval = metrics_interval
+        self.default_device_id = default_device_id
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.metrics = IngestMetrics()
+        self.metrics.queue_capacity = queue_size
+
+    async def run(self):
+        """Consume until the source is exhausted, then flush what is queued"""
+        writer = asyncio.create_task(self._write())
+        reporter = asyncio.create_task(self._report())
+        try:
+            await self._consume()
+            await self.queue.join()
+        finally:
+            writer.cancel()
+            reporter.cancel()
+            await asyncio.gather(writer, reporter, return_exceptions=True)
+            self.publish_metrics()
+
+    async def _consume(self):
+        async for topic, payload in self.source:
+            self.metrics.received += 1
+            try:
+                row = decode_message(payload, self.default_device_id)
+            except InvalidReading as e:
+                self.metrics.invalid += 1
+                logger.warning("Dropping invalid message on %s: %s", topic, e)
+                continue
+            except Exception:
+                self.metrics.failed += 1
+                logger.exception("Dropping message on %s that could not be decoded", topic)
+                continue
+            await self.queue.put((time.monotonic(), row))
+            self.metrics.queue_depth = self.queue.qsize()
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _store(self, rows):
+        """Store rows, retrying with backoff; returns the results of those stored"""
+        delay = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await sync_to_async(_store_batch)(rows)
+            except Exception:
+                self.metrics.retries += 1
+                logger.exception(
+                    "Failed to store a batch of %d readings (attempt %d of %d)",
+                    len(rows),
+                    attempt,
+                    self.max_attempts,
+                )
+            if attempt < self.max_attempts:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+        results = []
+        for row in rows:
+            try:
+                results.extend(await sync_to_async(_store_batch)([row]))
+            except Exception:
+                self.metrics.failed += 1
+                logger.exception("Dropping a reading that could not be stored: %r", row)
+        return results
+
+    async def _write(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                results = await self._store([row for _, row in batch])
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+            now = time.monotonic()
+            self.metrics.batches += 1
+            for status, _ in results:
+                if status == "created":
+                    self.metrics.created += 1
+                else:
+                    self.metrics.duplicates += 1
+            self.metrics.observe_latency(max(now - enqueued for enqueued, _ in batch))
+            self.metrics.queue_depth = self.queue.qsize()
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            self.publish_metrics()
+            logger.info("MQTT ingest metrics: %s", self.metrics.snapshot())
+
+    def publish_metrics(self):
+        cache.set(METRICS_CACHE_KEY, self.metrics.snapshot(), None)
+
+
+async def paho_messages(broker, port, username, password, topic, keepalive=60):
+    """Yield ``(topic, payload)`` from a paho client running its own network thread.
+
+    The paho callback waits until the event loop has taken each message,
+    so a slow consumer throttles the socket instead of buffering messages.
+    """
+    import paho.mqtt.client as mqtt
+
+    loop = asyncio.get_running_loop()
+    handoff = asyncio.Queue(maxsize=1)
+    stopped = threading.Event()
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            logger.info("Connected to %s:%s, subscribing to %s", broker, port, topic)
+            client.subscribe(topic)
+        else:
+            logger.error("MQTT connection refused (code %s)", rc)
+
+    def on_message(client, userdata, msg):
+        future = asyncio.run_coroutine_threadsafe(
+            handoff.put((msg.topic, msg.payload)), loop
+        )
+        while not stopped.is_set():
+            try:
+                future.result(timeout=1)
+                return
+            except TimeoutError:
+                continue
+
+    client = mqtt.Client()
+    client.username_pw_set(username, password)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.reconnect_delay_set(min_delay=1, max_delay=60)
+    client.connect_async(broker, port, keepalive)
+    client.loop_start()
+    try:
+        while True:
+            yield await handoff.get()
+    finally:
+        stopped.set()
+        client.loop_stop()
+        client.disconnect()
@@ -0,0 +1,262 @@
+"""Monthly time partitioning of SensorReading on PostgreSQL.
+
+``partition_table`` turns the raw readings table into a table partitioned
+by month on ``received_at`` (declarative range partitioning), or into a
+TimescaleDB hypertable with monthly chunks. Queries that filter on a
+``received_at`` range then only touch the matching partitions, and
+retention becomes dropping whole partitions (``drop_partitions``) instead
+of deleting rows. All of this is opt-in: on SQLite, or on an unpartitioned
+PostgreSQL table, the helpers do nothing.
+"""
+
+import logging
+import re
+from datetime import date, datetime, time, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .ingest import touch_devices
+from .models import SensorReading
+
+logger = logging.getLogger(__name__)
+
+TABLE = SensorReading._meta.db_table
+PARTITION_PREFIX = f"{TABLE}_p"
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_NAME_RE = re.compile(rf"^{re.escape(PARTITION_PREFIX)}(\d{{4}})(\d{{2}})$")
+
+
+def add_months(day, months):
+    """First day of the month ``months`` after the month of ``day``"""
+    years, month = divmod(day.month - 1 + months, 12)
+    return date(day.year + years, month + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def _bound(day):
+    # Generated dates only, so the literal is safe; DDL cannot take parameters
+    return f"'{day.isoformat()} 00:00:00+00'"
+
+
+def partitioning_mode():
+    """``"native"``, ``"timescale"`` or None for the readings table"""
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid"
+            " WHERE c.relname = %s",
+            [TABLE],
+        )
+        if cursor.fetchone():
+            return "native"
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+        if cursor.fetchone():
+            cursor.execute(
+                "SELECT 1 FROM timescaledb_information.hypertables"
+                " WHERE hypertable_name = %s",
+                [TABLE],
+            )
+            if cursor.fetchone():
+                return "timescale"
+    return None
+
+
+def _create_partition(cursor, month):
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {TABLE}"
+        f" FOR VALUES FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})"
+    )
+
+
+def ensure_partitions(months_ahead=3, today=None):
+    """Create the partitions of this month and the next ``months_ahead`` months.
+
+    Run daily by the scheduler; a no-op unless the table is natively
+    partitioned. Returns the names of the partitions that now exist.
+    """
+    if partitioning_mode() != "native":
+        return []
+    month = (today or timezone.now().date()).replace(day=1)
+    months = [add_months(month, i) for i in range(months_ahead + 1)]
+    with connection.cursor() as cursor:
+        for month in months:
+            _create_partition(cursor, month)
+    return [partition_name(month) for month in months]
+
+
+def _table_definitions(cursor, table):
+    """Primary/unique constraints, plain indexes and referencing foreign keys"""
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint"
+        " WHERE conrelid = %s::regclass AND contype IN ('p', 'u')",
+        [table],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s", [table]
+    )
+    names = {name for name, _, _ in constraints}
+    indexes = [(name, sql) for name, sql in cursor.fetchall() if name not in names]
+    cursor.execute(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint"
+        " WHERE confrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    return constraints, indexes, cursor.fetchall()
+
+
+def _partition_key_constraints(cursor, constraints):
+    """Re-add primary/unique constraints; PostgreSQL needs them to include received_at"""
+    for name, kind, definition in constraints:
+        if kind == "p":
+            cursor.execute(
+                f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} PRIMARY KEY (id, received_at)"
+            )
+        elif "received_at" in definition:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+        else:
+            logger.warning("Dropping constraint %s: it does not include received_at", name)
+
+
+def partition_table(timescale=False, months_ahead=3):
+    """Convert the readings table to monthly partitions in one transaction.
+
+    Foreign keys pointing at readings (``DeviceState.last_reading``) are
+    dropped, because PostgreSQL only allows them to reference a unique key
+    that includes the partition key; Django still applies ``on_delete``
+    itself. Returns the number of rows moved (native) or None (Timescale).
+    """
+    if connection.vendor != "postgresql":
+        raise ValueError("Partitioning needs PostgreSQL")
+    if partitioning_mode():
+        raise ValueError(f"{TABLE} is already partitioned")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        constraints, indexes, foreign_keys = _table_definitions(cursor, TABLE)
+        for table, name in foreign_keys:
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+
+        if timescale:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS timescaledb")
+            for name, kind, _ in constraints:
+                cursor.execute(f"ALTER TABLE {TABLE} DROP CONSTRAINT {name}")
+            _partition_key_constraints(cursor, constraints)
+            cursor.execute(
+                "SELECT create_hypertable(%s, 'received_at',"
+                " chunk_time_interval => INTERVAL '1 month', migrate_data => true)",
+                [TABLE],
+            )
+            return None
+
+        old = f"{TABLE}_unpartitioned"
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {old}")
+        cursor.execute(
+            f"CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS INCLUDING IDENTITY)"
+            " PARTITION BY RANGE (received_at)"
+        )
+        cursor.execute(f"SELECT min(received_at) FROM {old}")
+        first = cursor.fetchone()[0] or timezone.now()
+        month = first.astimezone(dt_timezone.utc).date().replace(day=1)
+        last = add_months(timezone.now().date().replace(day=1), months_ahead)
+        while month <= last:
+            _create_partition(cursor, month)
+            month = add_months(month, 1)
+        # Catches readings outside the prepared months (e.g. bad device clocks)
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {old}")
+        moved = cursor.rowcount
+        cursor.execute(f"DROP TABLE {old}")
+
+        _partition_key_constraints(cursor, constraints)
+        for _, definition in indexes:
+            cursor.execute(
+                re.sub(rf"ON (ONLY )?(\S+\.)?{re.escape(old)}\b", f"ON {TABLE}", definition)
+            )
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'),"
+            f" (SELECT coalesce(max(id), 0) + 1 FROM {TABLE}), false)",
+            [TABLE],
+        )
+    return moved
+
+
+def _clear_dangling_last_readings(cursor):
+    cursor.execute(
+        "UPDATE sensors_devicestate SET last_reading_id = NULL"
+        f" WHERE last_reading_id IS NOT NULL AND NOT EXISTS"
+        f" (SELECT 1 FROM {TABLE} r WHERE r.id = last_reading_id)"
+    )
+
+
+def _touch_table_devices(cursor, table):
+    """Mark the devices with readings in a partition or chunk about to be dropped"""
+    cursor.execute(f"SELECT DISTINCT device_id FROM {table}")
+    touch_devices(device_id for (device_id,) in cursor.fetchall())
+
+
+def droppable_partitions(before):
+    """Names of monthly partitions whose whole range lies before ``before`` (a date)"""
+    if partitioning_mode() != "native":
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+            [TABLE],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+    droppable = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            if add_months(month, 1) <= before:
+                droppable.append(name)
+    return droppable
+
+
+def drop_partitions(before, dry_run=False):
+    """Drop raw readings received before ``before`` a partition (or chunk) at a time.
+
+    Rollups are kept, so analytics over the dropped months still work.
+    Returns the names of the dropped partitions or chunks.
+    """
+    mode = partitioning_mode()
+    if mode == "native":
+        names = droppable_partitions(before)
+        if dry_run:
+            return names
+        with transaction.atomic(), connection.cursor() as cursor:
+            for name in names:
+                _touch_table_devices(cursor, name)
+                cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+                cursor.execute(f"DROP TABLE {name}")
+            _clear_dangling_last_readings(cursor)
+        return names
+
+    if mode == "timescale":
+        cutoff = timezone.make_aware(datetime.combine(before, time.min), dt_timezone.utc)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT show_chunks(%s, older_than => %s::timestamptz)", [TABLE, cutoff]
+            )
+            chunks = [str(name) for (name,) in cursor.fetchall()]
+            if dry_run:
+                return chunks
+            for chunk in chunks:
+                _touch_table_devices(cursor, chunk)
+            cursor.execute(
+                "SELECT drop_chunks(%s, older_than => %s::timestamptz)", [TABLE, cutoff]
+            )
+            names = [str(name) for (name,) in cursor.fetchall()]
+            _clear_dangling_last_readings(cursor)
+        return names
+
+    raise ValueError(f"{TABLE} is not partitioned; run partition_readings first")
@@ -0,0 +1,138 @@
+"""In-process ingest queue with micro-batched writes.
+
+With ``SENSOR_INGEST_MODE = "queued"`` the ingest endpoint hands parsed
+readings to a bounded queue instead of inserting them itself. A flusher
+thread drains the queue in batches of up to ``SENSOR_INGEST_FLUSH_ROWS``
+readings, or whatever arrived within ``SENSOR_INGEST_FLUSH_MS``, and writes
+each batch with ``store_readings`` in one transaction. Concurrent requests
+then share a commit instead of paying one each. When a batch fails its
+readings are stored one by one, so only the requests whose own readings
+cannot be stored get an error. A full queue is reported to
+the caller (``IngestQueueFull``) so the endpoint can answer 429.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .ingest import store_readings
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class IngestQueueFull(Exception):
+    """Raised by ``submit`` when the queue has no room for the readings"""
+
+
+class IngestPipeline:
+    def __init__(self, max_queue=10000, batch_size=500, max_latency=0.2):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="sensors-ingest-flusher", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Flush what is queued, then stop the flusher thread"""
+        if self._thread is not None:
+            self.queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, rows):
+        """Queue parsed readings; returns one Future per row.
+
+        Each future resolves to the ``(status, reading)`` tuple that
+        ``store_readings`` produced for the row. Raises ``IngestQueueFull``
+        without queueing anything when the rows do not fit.
+        """
+        self.start()
+        futures = []
+        with self._lock:
+            if self.queue.maxsize - self.queue.qsize() < len(rows):
+                raise IngestQueueFull(f"Ingest queue is full ({self.queue.maxsize})")
+            for row in rows:
+                future = Future()
+                self.queue.put_nowait((row, future))
+                futures.append(future)
+        return futures
+
+    def _next_batch(self):
+        item = self.queue.get()
+        if item is _STOP:
+            return None, True
+        batch = [item]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            try:
+                results = store_readings([row for row, _ in batch])
+            except Exception:
+                logger.exception("Failed to store a batch of %d readings", len(batch))
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+                return
+            # One bad reading must not fail the requests it shared a batch with
+            for row, future in batch:
+                try:
+                    (result,) = store_readings([row])
+                except Exception as e:
+                    logger.exception("Failed to store a reading: %r", row)
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            close_old_connections()
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """The process-wide pipeline configured from settings"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = IngestPipeline(
+                max_queue=settings.SENSOR_INGEST_QUEUE_SIZE,
+                batch_size=settings.SENSOR_INGEST_FLUSH_ROWS,
+                max_latency=settings.SENSOR_INGEST_FLUSH_MS / 1000,
+            )
+    return _pipeline
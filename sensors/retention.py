@@ -0,0 +1,136 @@
+"""Data lifecycle: raw readings age into hourly, then daily rollups.
+
+``SENSOR_RETENTION_DAYS`` sets how long each tier is kept: by default raw
+readings for 30 days, hourly rollups for a year and daily rollups forever.
+Rollups are maintained on ingest, so analytics over old periods survive
+the raw rows, while the raw table and its indexes stop growing. Expired
+rows are deleted in batches of ``SENSOR_RETENTION_BATCH_SIZE``, each in
+its own short transaction so ingest is never locked out for long. On a
+partitioned PostgreSQL table whole months are dropped first.
+"""
+
+import logging
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import ALL_READINGS, device_tag, invalidate
+from .db import database_bytes_used
+from .ingest import touch_devices
+from .models import DailyRollup, DeviceState, HourlyRollup, SensorReading
+from .partitioning import drop_partitions, partitioning_mode
+
+logger = logging.getLogger(__name__)
+
+# tier -> (model, time field)
+TIERS = {
+    "raw": (SensorReading, "received_at"),
+    "hourly": (HourlyRollup, "bucket"),
+    "daily": (DailyRollup, "bucket"),
+}
+
+
+def retention_cutoffs(policy=None, now=None):
+    """tier -> oldest moment kept (a date for daily rollups), for tiers with a limit"""
+    policy = settings.SENSOR_RETENTION_DAYS if policy is None else policy
+    now = now or timezone.now()
+    cutoffs = {}
+    for tier, days in policy.items():
+        if tier not in TIERS:
+            raise ValueError(f"Unknown retention tier {tier!r}; choose from: {', '.join(TIERS)}")
+        if days is None:
+            continue
+        cutoff = now - timedelta(days=days)
+        cutoffs[tier] = timezone.localdate(cutoff) if tier == "daily" else cutoff
+    return cutoffs
+
+
+def _delete_ids(model, ids):
+    table = connection.ops.quote_name(model._meta.db_table)
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+        return cursor.rowcount
+
+
+def purge(queryset, batch_size, pause=0):
+    """Delete ``queryset`` in short transactions of ``batch_size`` rows.
+
+    Returns ``(rows_deleted, device_ids)``. Deleting readings also clears
+    the ``DeviceState.last_reading`` links pointing at them, which is what
+    ``on_delete=SET_NULL`` does, without loading the rows into Python, and
+    marks those devices as changed (``touch_devices``).
+    """
+    model = queryset.model
+    deleted = 0
+    devices = set()
+    while True:
+        with transaction.atomic():
+            rows = list(queryset.order_by().values_list("id", "device_id")[:batch_size])
+            if not rows:
+                break
+            ids = [pk for pk, _ in rows]
+            if model is SensorReading:
+                DeviceState.objects.filter(last_reading_id__in=ids).update(last_reading=None)
+                touch_devices({device_id for _, device_id in rows})
+            deleted += _delete_ids(model, ids)
+        devices.update(device_id for _, device_id in rows)
+        if len(rows) < batch_size:
+            break
+        time.sleep(pause)
+    return deleted, devices
+
+
+def apply_retention(policy=None, now=None, batch_size=None, pause=None, dry_run=False):
+    """Enforce the retention policy; returns one report dict per limited tier.
+
+    A report holds the ``tier``, its ``cutoff``, the ``rows`` deleted (or
+    due for deletion with ``dry_run``) and the database ``bytes`` freed,
+    None for a dry run (see ``database_bytes_used``).
+    """
+    batch_size = batch_size or settings.SENSOR_RETENTION_BATCH_SIZE
+    pause = settings.SENSOR_RETENTION_PAUSE if pause is None else pause
+    reports = []
+    for tier, cutoff in retention_cutoffs(policy, now).items():
+        model, field = TIERS[tier]
+        expired = model.objects.filter(**{f"{field}__lt": cutoff})
+        if dry_run:
+            reports.append({"tier": tier, "cutoff": cutoff, "rows": expired.count(), "bytes": None})
+            continue
+
+        bytes_before = database_bytes_used(connection)
+        if tier == "raw" and partitioning_mode():
+            # Months wholly past the cutoff go at once, the rest row by row
+            rows = expired.count()
+            drop_partitions(cutoff.astimezone(dt_timezone.utc).date())
+            _, devices = purge(expired, batch_size, pause)
+        else:
+            rows, devices = purge(expired, batch_size, pause)
+        bytes_after = database_bytes_used(connection)
+
+        if rows:
+            invalidate([ALL_READINGS, *(device_tag(device_id) for device_id in devices)])
+        freed = None if bytes_before is None else max(bytes_before - bytes_after, 0)
+        logger.info("Retention: deleted %d %s rows older than %s", rows, tier, cutoff)
+        reports.append({"tier": tier, "cutoff": cutoff, "rows": rows, "bytes": freed})
+    return reports
+
+
+def vacuum():
+    """Compact the database after large deletions; returns the bytes it freed.
+
+    SQLite rewrites the whole file (a full lock while it runs); PostgreSQL
+    marks the space reusable and refreshes planner statistics.
+    """
+    before = database_bytes_used(connection)
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("VACUUM")
+        elif connection.vendor == "postgresql":
+            for model, _ in TIERS.values():
+                cursor.execute(f"VACUUM ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+    after = database_bytes_used(connection)
+    return None if before is None else max(before - after, 0)
@@ -0,0 +1,201 @@
+import math
+from datetime import datetime, time
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Max, Min, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import DailyRollup, HourlyRollup, ReadingRollup, SensorReading
+
+METRICS = ReadingRollup.METRICS
+COUNTER_FIELDS = ["reading_count", "motion_count", "motion_sum"] + [
+    f"{prefix}_{suffix}" for prefix in METRICS for suffix in ("count", "sum", "sumsq")
+]
+
+
+def hour_bucket(dt):
+    return timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(dt):
+    return timezone.localdate(dt)
+
+
+def _number(value, cast=float):
+    if value is None:
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _add_reading(rollup, reading):
+    rollup.reading_count += 1
+    for prefix, field in METRICS.items():
+        value = _number(getattr(reading, field))
+        if value is None:
+            continue
+        setattr(rollup, f"{prefix}_count", getattr(rollup, f"{prefix}_count") + 1)
+        setattr(rollup, f"{prefix}_sum", getattr(rollup, f"{prefix}_sum") + value)
+        setattr(
+            rollup, f"{prefix}_sumsq", getattr(rollup, f"{prefix}_sumsq") + value * value
+        )
+        _merge_extremes(rollup, prefix, value, value)
+    motion = _number(reading.motion_counts, int)
+    if motion is not None:
+        rollup.motion_count += 1
+        rollup.motion_sum += motion
+
+
+def _merge_extremes(rollup, prefix, low, high):
+    current_min = getattr(rollup, f"{prefix}_min")
+    current_max = getattr(rollup, f"{prefix}_max")
+    if low is not None and (current_min is None or low < current_min):
+        setattr(rollup, f"{prefix}_min", low)
+    if high is not None and (current_max is None or high > current_max):
+        setattr(rollup, f"{prefix}_max", high)
+
+
+def _merge(target, partial):
+    for name in COUNTER_FIELDS:
+        setattr(target, name, getattr(target, name) + getattr(partial, name))
+    for prefix in METRICS:
+        _merge_extremes(
+            target,
+            prefix,
+            getattr(partial, f"{prefix}_min"),
+            getattr(partial, f"{prefix}_max"),
+        )
+
+
+def _field_values(rollup):
+    names = COUNTER_FIELDS + [
+        f"{prefix}_{suffix}" for prefix in METRICS for suffix in ("min", "max")
+    ]
+    return {name: getattr(rollup, name) for name in names}
+
+
+def apply_readings(readings):
+    """Incrementally fold newly stored readings into the hourly and daily rollups"""
+    partials = {}
+    for reading in readings:
+        for model, bucket in (
+            (HourlyRollup, hour_bucket(reading.received_at)),
+            (DailyRollup, day_bucket(reading.received_at)),
+        ):
+            key = (model, reading.device_id, bucket)
+            if key not in partials:
+                partials[key] = model(device_id=reading.device_id, bucket=bucket)
+            _add_reading(partials[key], reading)
+
+    with transaction.atomic():
+        for (model, device_id, bucket), partial in partials.items():
+            row, created = model.objects.select_for_update().get_or_create(
+                device_id=device_id, bucket=bucket, defaults=_field_values(partial)
+            )
+            if not created:
+                _merge(row, partial)
+                row.save()
+
+
+def _rollup_aggregates():
+    aggregates = {"reading_count": Count("id")}
+    for prefix, field in METRICS.items():
+        aggregates[f"{prefix}_count"] = Count(field)
+        aggregates[f"{prefix}_sum"] = Coalesce(Sum(field), 0.0)
+        aggregates[f"{prefix}_sumsq"] = Coalesce(
+            Sum(F(field) * F(field), output_field=FloatField()), 0.0
+        )
+        aggregates[f"{prefix}_min"] = Min(field)
+        aggregates[f"{prefix}_max"] = Max(field)
+    aggregates["motion_count"] = Count("motion_counts")
+    aggregates["motion_sum"] = Coalesce(Sum("motion_counts"), 0)
+    return aggregates
+
+
+def _rebuild(model, trunc, readings, batch_size):
+    rows = (
+        readings.annotate(bucket=trunc("received_at"))
+        .values("device_id", "bucket")
+        .annotate(**_rollup_aggregates())
+        .order_by()
+    )
+    batch = []
+    created = 0
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(model(**row))
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def backfill_rollups(readings, hourly_model=HourlyRollup, daily_model=DailyRollup, batch_size=1000):
+    """Write hourly and daily rollup rows aggregated from ``readings``.
+
+    Migrations pass their historical rollup models. Returns a
+    ``(hourly_rows, daily_rows)`` tuple.
+    """
+    return (
+        _rebuild(hourly_model, TruncHour, readings, batch_size),
+        _rebuild(daily_model, TruncDate, readings, batch_size),
+    )
+
+
+def rebuild_rollups(since=None, device_id=None, batch_size=1000):
+    """Recompute rollups from the raw table, optionally from ``since`` (a date) onwards.
+
+    Returns a ``(hourly_rows, daily_rows)`` tuple with the number of rows written.
+    """
+    readings = SensorReading.objects.all()
+    hourly = HourlyRollup.objects.all()
+    daily = DailyRollup.objects.all()
+    if since is not None:
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        readings = readings.filter(received_at__gte=start)
+        hourly = hourly.filter(bucket__gte=start)
+        daily = daily.filter(bucket__gte=since)
+    if device_id:
+        readings = readings.filter(device_id=device_id)
+        hourly = hourly.filter(device_id=device_id)
+        daily = daily.filter(device_id=device_id)
+
+    with transaction.atomic():
+        hourly.delete()
+        daily.delete()
+        return backfill_rollups(readings, batch_size=batch_size)
+
+
+def summarize(rollups):
+    """Combine a rollup queryset into a single row of totals, minimums and maximums"""
+    aggregates = {
+        name: Coalesce(Sum(name), 0.0 if name.endswith(("_sum", "_sumsq")) else 0)
+        for name in COUNTER_FIELDS
+        if name != "motion_sum"
+    }
+    aggregates["motion_sum"] = Coalesce(Sum("motion_sum"), 0)
+    for prefix in METRICS:
+        aggregates[f"{prefix}_min"] = Min(f"{prefix}_min")
+        aggregates[f"{prefix}_max"] = Max(f"{prefix}_max")
+    return rollups.aggregate(**aggregates)
+
+
+def metric_stats(totals, prefix):
+    """Derive avg/min/max/std for one metric from summed rollup columns"""
+    count = totals[f"{prefix}_count"]
+    if not count:
+        return {"avg": None, "min": None, "max": None, "std": None}
+    mean = totals[f"{prefix}_sum"] / count
+    variance = max(totals[f"{prefix}_sumsq"] / count - mean * mean, 0.0)
+    return {
+        "avg": mean,
+        "min": totals[f"{prefix}_min"],
+        "max": totals[f"{prefix}_max"],
+        "std": math.sqrt(variance),
+    }
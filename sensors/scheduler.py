@@ -0,0 +1,188 @@
+"""Periodic background jobs, run off the request path.
+
+Jobs are registered with ``register_job`` and run by ``run_due_jobs``,
+either from a daemon thread that the web process starts on its first
+request (``start_scheduler``, called by ``SchedulerMiddleware``) or from
+the ``run_scheduler`` management command.
+Each run is claimed with one conditional UPDATE of the job's ``JobLease``
+row, so however many gunicorn workers and scheduler processes are up, a
+due job runs exactly once. While a job runs its lease is renewed every
+third of its TTL (``JOB_LEASE_TTL`` unless registered with another), so a
+lease only expires when its holder crashed.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import JobLease
+
+logger = logging.getLogger(__name__)
+
+# A lease not renewed for this long is considered abandoned by a crashed holder
+JOB_LEASE_TTL = timedelta(minutes=5)
+
+# name -> (interval, callable, lease TTL)
+JOBS = {}
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def register_job(name, interval, func, lease_ttl=JOB_LEASE_TTL):
+    """Run ``func()`` every ``interval`` (a timedelta) in the scheduler.
+
+    ``lease_ttl`` is how long the job stays blocked after its holder
+    crashed; it does not limit how long a run may take.
+    """
+    JOBS[name] = (interval, func, lease_ttl)
+
+
+def holder_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim_job(name, interval, holder, now=None, lease_ttl=JOB_LEASE_TTL):
+    """Atomically take the lease of a due job; False if it is not due or taken"""
+    now = now or timezone.now()
+    try:
+        JobLease.objects.get_or_create(name=name)
+    except IntegrityError:
+        # Created concurrently by another process
+        pass
+    claimed = (
+        JobLease.objects.filter(name=name)
+        .filter(Q(last_run_at__isnull=True) | Q(last_run_at__lte=now - interval))
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__lte=now))
+        .update(holder=holder, expires_at=now + lease_ttl)
+    )
+    return claimed == 1
+
+
+def renew_lease(name, holder, lease_ttl=JOB_LEASE_TTL):
+    """Push back the expiry of a lease ``holder`` still holds; False if it was lost"""
+    renewed = (
+        JobLease.objects.filter(name=name, holder=holder, expires_at__isnull=False)
+        .update(expires_at=timezone.now() + lease_ttl)
+    )
+    return renewed == 1
+
+
+class _LeaseKeeper(threading.Thread):
+    """Renews a job's lease every third of its TTL until stopped"""
+
+    def __init__(self, job, holder, lease_ttl):
+        super().__init__(name=f"sensors-lease-{job}", daemon=True)
+        self.job = job
+        self.holder = holder
+        self.lease_ttl = lease_ttl
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.lease_ttl.total_seconds() / 3):
+                try:
+                    if not renew_lease(self.job, self.holder, self.lease_ttl):
+                        logger.warning("Lost the lease of job %s", self.job)
+                        return
+                except Exception:
+                    logger.exception("Could not renew the lease of job %s", self.job)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(name, force=False):
+    """Run one registered job if it is due and no other process holds it.
+
+    ``force`` ignores the interval but still honours a lease held elsewhere.
+    Returns True when the job ran here.
+    """
+    interval, func, lease_ttl = JOBS[name]
+    holder = holder_id()
+    if not claim_job(name, timedelta(0) if force else interval, holder, lease_ttl=lease_ttl):
+        return False
+    keeper = _LeaseKeeper(name, holder, lease_ttl)
+    keeper.start()
+    try:
+        func()
+    finally:
+        keeper.stop()
+        JobLease.objects.filter(name=name, holder=holder).update(
+            expires_at=None, last_run_at=timezone.now()
+        )
+    return True
+
+
+def run_due_jobs():
+    """Run every due job once; a failing job is logged and does not stop the others"""
+    ran = []
+    for name in list(JOBS):
+        try:
+            if run_job(name):
+                ran.append(name)
+        except Exception:
+            logger.exception("Scheduled job %s failed", name)
+    return ran
+
+
+def _loop():
+    while True:
+        try:
+            run_due_jobs()
+        except Exception:
+            logger.exception("Scheduler tick failed")
+        finally:
+            close_old_connections()
+        time.sleep(settings.SENSOR_SCHEDULER_TICK)
+
+
+def start_scheduler():
+    """Start the in-process scheduler thread once; cheap to call on every request"""
+    global _thread
+    if not settings.SENSOR_SCHEDULER_IN_WEB:
+        return False
+    if _thread is not None and _thread.is_alive():
+        return False
+    with _thread_lock:
+        if _thread is not None and _thread.is_alive():
+            return False
+        _thread = threading.Thread(target=_loop, name="sensors-scheduler", daemon=True)
+        _thread.start()
+    logger.info("Started background scheduler thread")
+    return True
+
+
+def _poll_ttn():
+    from .ttn_poller import fetch_recent_ttn_data
+
+    fetch_recent_ttn_data(minutes=settings.TTN_POLL_INTERVAL_MIN)
+
+
+def _ensure_partitions():
+    from .partitioning import ensure_partitions
+
+    ensure_partitions()
+
+
+def _apply_retention():
+    if settings.SENSOR_RETENTION_SCHEDULED:
+        from .retention import apply_retention
+
+        apply_retention()
+
+
+register_job("ttn_poll", timedelta(minutes=settings.TTN_POLL_INTERVAL_MIN), _poll_ttn)
+register_job("ensure_partitions", timedelta(days=1), _ensure_partitions)
+register_job("retention", timedelta(days=1), _apply_retention)
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.utils import timezone
+
+from .cache import cached
+from .downsample import lttb_indices
+
+# Fields charted on the dashboard and analytics pages
+CHART_FIELDS = ("temperature_c", "humidity")
+
+# New readings invalidate cached series; the timeout only bounds how far a
+# cached "last N days" window can lag behind the clock
+SERIES_CACHE_TIMEOUT = 60
+
+
+def build_series(readings, fields=CHART_FIELDS, points=None, label_format="%H:%M"):
+    """Build ``{field: (labels, values)}`` for several fields in one pass.
+
+    ``(received_at, *fields)`` tuples are pulled with ``values_list`` and
+    split into per-field columns while iterating, so no model instances are
+    created and the queryset is read once however many series are charted.
+    Each series skips its NULLs and is downsampled with LTTB to ``points``
+    (default ``SENSOR_CHART_POINTS``) before labels are formatted.
+    """
+    points = points or settings.SENSOR_CHART_POINTS
+    columns = [([], [], []) for _ in fields]
+    rows = readings.order_by("received_at", "id").values_list("received_at", *fields)
+    for row in rows:
+        received_at = row[0]
+        for (times, xs, values), value in zip(columns, row[1:]):
+            if value is not None:
+                times.append(received_at)
+                xs.append(received_at.timestamp())
+                values.append(float(value))
+
+    series = {}
+    for field, (times, xs, values) in zip(fields, columns):
+        indices = lttb_indices(xs, values, points)
+        series[field] = (
+            [timezone.localtime(times[i]).strftime(label_format) for i in indices],
+            [values[i] for i in indices],
+        )
+    return series
+
+
+def cached_series(key, readings, tags, fields=CHART_FIELDS, **kwargs):
+    """``build_series`` cached until one of ``tags`` is invalidated (see ``cache``)"""
+    return cached(
+        f"series:{key}",
+        tags,
+        lambda: build_series(readings, fields, **kwargs),
+        timeout=SERIES_CACHE_TIMEOUT,
+    )
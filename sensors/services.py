@@ -0,0 +1,207 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Min, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .downsample import DOWNSAMPLE_METHODS
+from .models import DailyRollup, DeviceState, HourlyRollup, SensorReading
+from .rollups import hour_bucket
+
+# Placeholder device ids created while testing the ingest endpoint
+EXCLUDED_DEVICE_IDS = ["test-device", "unknown-device"]
+
+# A device counts as online if it reported within this window
+ONLINE_WINDOW = timedelta(hours=2)
+
+# Time-series metric name -> SensorReading field; rollup columns use the name
+SERIES_METRICS = {
+    "temperature": "temperature_c",
+    "humidity": "humidity",
+    "battery": "battery_voltage",
+    "motion": "motion_counts",
+}
+SERIES_BUCKETS = {"hour": HourlyRollup, "day": DailyRollup}
+
+
+def device_states():
+    """Return the maintained per-device state rows, excluding placeholder devices"""
+    return DeviceState.objects.exclude(device_id__in=EXCLUDED_DEVICE_IDS)
+
+
+def device_last_seen():
+    """Return a mapping of device_id -> latest received_at in a single query"""
+    return dict(device_states().values_list("device_id", "last_seen"))
+
+
+def last_readings_by_device(device_ids, limit=5):
+    """Return the ``limit`` most recent readings of each device in a single query"""
+    rows = (
+        SensorReading.objects.filter(device_id__in=device_ids)
+        .annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=[F("device_id")],
+                # (device_id, received_at) is unique, so no id tie-break is
+                # needed and the window reads reading_device_recent_idx in order
+                order_by=[F("received_at").desc()],
+            )
+        )
+        .filter(row_number__lte=limit)
+        # At most ``limit`` rows per device; ordering them here is cheaper
+        # than a temp B-tree sort of the subquery in SQL
+        .order_by()
+    )
+    grouped = {device_id: [] for device_id in device_ids}
+    for reading in rows:
+        grouped[reading.device_id].append(reading)
+    for readings in grouped.values():
+        readings.sort(key=lambda r: (r.received_at, r.id), reverse=True)
+    return grouped
+
+
+def device_intervals(readings=None):
+    """Return device_id -> average minutes between readings, computed in SQL.
+
+    Uses (last - first) / (count - 1) per device in one grouped query, so
+    readings of different devices are never interleaved and nothing is
+    loaded into Python. Devices with fewer than two readings are omitted.
+    ``readings`` defaults to all readings of non-placeholder devices and
+    may be any ``SensorReading`` queryset (e.g. a date range).
+    """
+    if readings is None:
+        readings = SensorReading.objects.exclude(device_id__in=EXCLUDED_DEVICE_IDS)
+    rows = (
+        readings.values_list("device_id")
+        .annotate(
+            first=Min("received_at"), last=Max("received_at"), count=Count("id")
+        )
+        .filter(count__gt=1)
+        .order_by()
+    )
+    return {
+        device_id: (last - first).total_seconds() / 60 / (count - 1)
+        for device_id, first, last, count in rows
+    }
+
+
+def average_interval(intervals):
+    """Average the per-device intervals from ``device_intervals`` (minutes, 1 decimal)"""
+    if not intervals:
+        return 0
+    return round(sum(intervals.values()) / len(intervals), 1)
+
+
+def histograms(readings, fields):
+    """Count ``readings`` into the ``SENSOR_HISTOGRAMS`` buckets of each field.
+
+    Every bucket of every requested field becomes a conditional
+    ``COUNT(...) FILTER (WHERE ...)`` of one aggregate, so the table is
+    scanned once. Returns ``{field: [(label, count), ...]}`` in bucket order.
+    """
+    aggregates = {}
+    for field in fields:
+        for index, (label, lookups) in enumerate(settings.SENSOR_HISTOGRAMS[field]):
+            condition = Q(**{f"{field}__{op}": value for op, value in lookups.items()})
+            aggregates[f"{field}_{index}"] = Count("id", filter=condition)
+
+    counts = readings.aggregate(**aggregates)
+    return {
+        field: [
+            (label, counts[f"{field}_{index}"])
+            for index, (label, _) in enumerate(settings.SENSOR_HISTOGRAMS[field])
+        ]
+        for field in fields
+    }
+
+
+def device_status_summary(last_seen=None, now=None):
+    """Summarise total/online/offline devices and the uptime percentage.
+
+    ``last_seen`` may be passed in when the caller already fetched it with
+    ``device_last_seen()`` so the page does not pay for the query twice.
+    """
+    if last_seen is None:
+        last_seen = device_last_seen()
+    now = now or timezone.now()
+    cutoff = now - ONLINE_WINDOW
+
+    total = len(last_seen)
+    online = sum(1 for seen in last_seen.values() if seen and seen > cutoff)
+
+    uptime_percentage = 0
+    if total > 0:
+        uptime_percentage = round((online * 100) / total, 0)
+
+    return {
+        "total": total,
+        "online": online,
+        "offline": total - online,
+        "uptime_percentage": uptime_percentage,
+    }
+
+
+def timeseries(
+    metric, start, end, device_id=None, bucket=None, points=None, method="lttb"
+):
+    """Return ``(timestamps, values)`` of one metric in ``[start, end)``.
+
+    Without ``bucket`` the raw readings are returned; with ``"hour"`` or
+    ``"day"`` the series is read from the rollup tables instead, averaging
+    each bucket (motion is summed). Placeholder devices are excluded unless
+    asked for by ``device_id``. With ``points`` the series is downsampled
+    using ``method`` (see ``DOWNSAMPLE_METHODS``). Timestamps are ISO 8601 strings.
+    """
+    field = SERIES_METRICS[metric]
+    times, values = [], []
+    if bucket is None:
+        readings = SensorReading.objects.filter(
+            received_at__gte=start, received_at__lt=end, **{f"{field}__isnull": False}
+        )
+        readings = (
+            readings.filter(device_id=device_id)
+            if device_id
+            else readings.exclude(device_id__in=EXCLUDED_DEVICE_IDS)
+        )
+        rows = readings.order_by("received_at", "id").values_list("received_at", field)
+        for received_at, value in rows:
+            times.append(timezone.localtime(received_at))
+            values.append(value)
+    else:
+        model = SERIES_BUCKETS[bucket]
+        if bucket == "day":
+            rollups = model.objects.filter(
+                bucket__gte=timezone.localdate(start),
+                bucket__lte=timezone.localdate(end),
+            )
+        else:
+            rollups = model.objects.filter(bucket__gte=hour_bucket(start), bucket__lt=end)
+        rollups = (
+            rollups.filter(device_id=device_id)
+            if device_id
+            else rollups.exclude(device_id__in=EXCLUDED_DEVICE_IDS)
+        )
+        rows = (
+            rollups.values_list("bucket")
+            .annotate(total=Sum(f"{metric}_sum"), count=Sum(f"{metric}_count"))
+            .filter(count__gt=0)
+            .order_by("bucket")
+        )
+        for start_of_bucket, total, count in rows:
+            if bucket == "hour":
+                start_of_bucket = timezone.localtime(start_of_bucket)
+            times.append(start_of_bucket)
+            values.append(total if metric == "motion" else total / count)
+
+    if points:
+        indices = DOWNSAMPLE_METHODS[method]([_epoch(t) for t in times], values, points)
+        times = [times[i] for i in indices]
+        values = [values[i] for i in indices]
+    return [t.isoformat() for t in times], values
+
+
+def _epoch(moment):
+    if isinstance(moment, datetime):
+        return moment.timestamp()
+    return datetime.combine(moment, time.min).timestamp()
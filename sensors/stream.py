@@ -0,0 +1,223 @@
+"""Live stream of new readings for Server-Sent Events clients.
+
+Ingest publishes every committed batch to the process-wide ``hub``. Each
+open ``/api/stream/`` response holds one small subscription queue on its
+event loop, so a new reading costs one push per client instead of a page
+render. Readings stored by another process (the MQTT worker, another
+server worker) only reach this process with ``SENSOR_STREAM_FANOUT =
+"db"``: a single thread then tails the readings table for the whole
+process while anyone is subscribed, and ingest stops publishing directly.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .fastjson import dumps
+from .models import SensorReading
+
+logger = logging.getLogger(__name__)
+
+# Fields of the compact reading rows returned by /api/latest/ and /api/stream/
+LATEST_FIELDS = (
+    "id",
+    "device_id",
+    "received_at",
+    "temperature_c",
+    "humidity",
+    "battery_voltage",
+    "motion_counts",
+)
+
+# Milliseconds browsers wait before reconnecting a dropped stream
+STREAM_RETRY_MS = 3000
+
+# Queued in place of readings when a client fell too far behind
+_OVERFLOW = object()
+
+
+def compact_row(row):
+    """JSON-ready values of a ``LATEST_FIELDS`` row; times in local ISO 8601"""
+    return [
+        timezone.localtime(value).isoformat() if isinstance(value, datetime) else value
+        for value in row
+    ]
+
+
+class Subscription:
+    """Readings waiting for one stream client, on that client's event loop"""
+
+    def __init__(self, device_id=None, max_pending=100):
+        self.device_id = device_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+
+    def offer(self, rows):
+        """Queue rows; a client that fell behind is told to reconnect and catch up"""
+        try:
+            self.queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_OVERFLOW)
+
+
+class ReadingHub:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._tail = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, device_id=None):
+        """Register the calling event loop's client; pair with ``unsubscribe``"""
+        subscription = Subscription(device_id, settings.SENSOR_STREAM_CLIENT_QUEUE)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if settings.SENSOR_STREAM_FANOUT == "db" and self._tail is None:
+                self._tail = threading.Thread(
+                    target=self._tail_readings, name="sensors-stream-tail", daemon=True
+                )
+                self._tail.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, rows):
+        """Hand ``LATEST_FIELDS`` rows to every matching subscriber; thread-safe"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            matching = [
+                row for row in rows if subscription.device_id in (None, row[1])
+            ]
+            if not matching:
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, matching)
+            except RuntimeError:
+                # The client's event loop is gone
+                self.unsubscribe(subscription)
+
+    def _tail_readings(self):
+        last_id = None
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._tail = None
+                    return
+            try:
+                if last_id is None:
+                    last = SensorReading.objects.order_by("-id").values_list("id", flat=True)
+                    last_id = last.first() or 0
+                rows = list(
+                    SensorReading.objects.filter(id__gt=last_id)
+                    .order_by("id")
+                    .values_list(*LATEST_FIELDS)[:1000]
+                )
+                if rows:
+                    last_id = rows[-1][0]
+                    self.publish(rows)
+            except Exception:
+                logger.exception("Tailing new readings failed")
+            finally:
+                close_old_connections()
+            time.sleep(settings.SENSOR_STREAM_TAIL_INTERVAL)
+
+
+hub = ReadingHub()
+
+
+def publish_readings(readings):
+    """Push freshly committed readings to this process's stream clients"""
+    if not len(hub) or settings.SENSOR_STREAM_FANOUT == "db":
+        return
+    hub.publish(
+        [tuple(getattr(reading, name) for name in LATEST_FIELDS) for reading in readings]
+    )
+
+
+def _event(row):
+    data = dumps(dict(zip(LATEST_FIELDS, compact_row(row)))).decode()
+    return f"id: {row[0]}\nevent: reading\ndata: {data}\n\n"
+
+
+def _reset_event(last_id):
+    # The id moves the browser's Last-Event-ID past the readings skipped
+    return f"id: {last_id}\nevent: reset\ndata: {dumps({'last_id': last_id}).decode()}\n\n"
+
+
+def _readings(device_id):
+    readings = SensorReading.objects.all()
+    return readings.filter(device_id=device_id) if device_id else readings
+
+
+def _rows_after(after_id, device_id, limit):
+    readings = _readings(device_id).filter(id__gt=after_id)
+    return list(readings.order_by("id").values_list(*LATEST_FIELDS)[:limit])
+
+
+def _newest_id(device_id):
+    return _readings(device_id).order_by("-id").values_list("id", flat=True).first()
+
+
+async def event_stream(device_id=None, after_id=0, catch_up=500, max_catch_up=None):
+    """SSE body: readings stored after ``after_id``, then live ones as they commit.
+
+    Subscribes before catching up so nothing committed in between is lost.
+    The backlog is replayed ``catch_up`` rows per query, up to
+    ``max_catch_up`` (default ``SENSOR_STREAM_CATCH_UP``) rows. A client
+    missing more gets an ``event: reset`` instead, telling it to reload, and
+    continues with the readings stored after that. A client that falls
+    behind is dropped; its browser reconnects with ``Last-Event-ID`` and
+    catches up from the database.
+    """
+    if max_catch_up is None:
+        max_catch_up = settings.SENSOR_STREAM_CATCH_UP
+    subscription = hub.subscribe(device_id)
+    try:
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        sent = set()
+        skip_through = 0
+        remaining = max_catch_up
+        while after_id:
+            limit = min(catch_up, remaining)
+            rows = await sync_to_async(_rows_after)(after_id, device_id, limit + 1)
+            for row in rows[:limit]:
+                sent.add(row[0])
+                yield _event(row)
+            if len(rows) <= limit:
+                break
+            remaining -= limit
+            if not remaining:
+                skip_through = await sync_to_async(_newest_id)(device_id)
+                yield _reset_event(skip_through)
+                break
+            after_id = rows[limit - 1][0]
+        while True:
+            try:
+                rows = await asyncio.wait_for(
+                    subscription.queue.get(), settings.SENSOR_STREAM_HEARTBEAT
+                )
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            if rows is _OVERFLOW:
+                return
+            for row in rows:
+                if row[0] > skip_through and row[0] not in sent:
+                    yield _event(row)
+    finally:
+        hub.unsubscribe(subscription)
@@ -1,3 +1,1543 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import json
+import re
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+from unittest import mock
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Count, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from iot_dashboard.database import database_from_url
+
+from .columnar import write_dataset
+from .db import current_pragmas, plan_problems
+from .downsample import lttb_indices, minmax_indices
+from .fastjson import FastJsonResponse, dumps
+from .history import (
+    HISTORY_TOTALS,
+    decode_cursor,
+    encode_cursor,
+    history_page,
+    history_readings,
+)
+from .ingest import InvalidReading, parse_reading, record_readings, store_readings
+from .middleware import accepted_encoding
+from .models import DailyRollup, DeviceState, HourlyRollup, JobLease, SensorReading
+from .mqtt_ingest import MqttIngestWorker, decode_message
+from .partitioning import (
+    add_months,
+    drop_partitions,
+    partition_name,
+    partition_table,
+    partitioning_mode,
+)
+from .pipeline import IngestPipeline, IngestQueueFull
+from .retention import apply_retention
+from .scheduler import (
+    JOB_LEASE_TTL,
+    JOBS,
+    _LeaseKeeper,
+    claim_job,
+    register_job,
+    renew_lease,
+    run_job,
+)
+from .cache import ALL_READINGS, cached, device_tag, recent_day_tags
+from .series import build_series, cached_series
+from .stream import event_stream, hub
+from .rollups import metric_stats, summarize
+from .services import (
+    average_interval,
+    device_intervals,
+    device_status_summary,
+    histograms,
+)
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+
+@override_settings(SENSOR_SCHEDULER_IN_WEB=False)
+class SensorTestCase(TestCase):
+    """Starts every test with an empty cache; cached pages would outlive the rollback"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+def make_readings(device_count, per_device=1, age=timedelta(minutes=5)):
+    now = timezone.now()
+    readings = SensorReading.objects.bulk_create(
+        SensorReading(
+            device_id=f"device-{d}",
+            temperature_c=21.5,
+            humidity=40.0,
+            battery_voltage=3.6,
+            motion_counts=1,
+            received_at=now - age - timedelta(minutes=i),
+        )
+        for d in range(device_count)
+        for i in range(per_device)
+    )
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        record_readings(readings)
+    return readings
+
+
+def ingest(**fields):
+    reading = SensorReading.objects.create(**fields)
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        record_readings([reading])
+    return reading
+
+
+class DeviceStatusTests(SensorTestCase):
+    def test_summary_counts_online_and_offline(self):
+        make_readings(3)
+        ingest(device_id="stale-device", received_at=timezone.now() - timedelta(hours=3))
+        ingest(device_id="test-device", received_at=timezone.now())
+
+        status = device_status_summary()
+
+        self.assertEqual(status["total"], 4)
+        self.assertEqual(status["online"], 3)
+        self.assertEqual(status["offline"], 1)
+        self.assertEqual(status["uptime_percentage"], 75)
+
+    def test_summary_is_one_query(self):
+        make_readings(20)
+        with self.assertNumQueries(1):
+            device_status_summary()
+
+    def test_dashboard_query_count_independent_of_device_count(self):
+        def dashboard_queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse("dashboard"))
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        make_readings(3)
+        small = dashboard_queries()
+        make_readings(60)
+        self.assertEqual(dashboard_queries(), small)
+
+
+class DeviceStateTests(SensorTestCase):
+    def test_newer_reading_replaces_last_values(self):
+        now = timezone.now()
+        ingest(device_id="node-1", temperature_c=20.0, received_at=now - timedelta(hours=1))
+        latest = ingest(device_id="node-1", temperature_c=22.0, received_at=now)
+
+        state = DeviceState.objects.get(device_id="node-1")
+        self.assertEqual(state.temperature_c, 22.0)
+        self.assertEqual(state.last_seen, now)
+        self.assertEqual(state.last_reading_id, latest.id)
+        self.assertEqual(state.reading_count, 2)
+
+    def test_late_reading_only_bumps_counters(self):
+        now = timezone.now()
+        ingest(device_id="node-1", temperature_c=22.0, received_at=now)
+        ingest(device_id="node-1", temperature_c=18.0, received_at=now - timedelta(days=2))
+
+        state = DeviceState.objects.get(device_id="node-1")
+        self.assertEqual(state.temperature_c, 22.0)
+        self.assertEqual(state.reading_count, 2)
+        self.assertEqual(state.today_readings, 1)
+
+    def test_ingest_endpoint_updates_state(self):
+        response = self.client.post(
+            reverse("ingest_reading"),
+            {"device_id": "node-9", "field5": 19.5, "received_at": "2025-01-01T10:00:00Z"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        state = DeviceState.objects.get(device_id="node-9")
+        self.assertEqual(state.temperature_c, 19.5)
+        self.assertEqual(state.last_reading_id, response.json()["id"])
+
+    def test_devices_page_query_count_independent_of_device_count(self):
+        def devices_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse("devices"))
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        make_readings(2, per_device=6)
+        small = devices_queries()
+        make_readings(30, per_device=6)
+        self.assertEqual(devices_queries(), small)
+
+
+class RollupTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.readings = [
+            ingest(
+                device_id="node-1",
+                temperature_c=value,
+                humidity=50.0,
+                motion_counts=2,
+                received_at=now - timedelta(minutes=minutes),
+            )
+            for value, minutes in ((20.0, 1), (22.0, 2), (24.0, 3))
+        ]
+
+    def test_incremental_rollups_match_rebuild(self):
+        fields = ["device_id", "bucket", "reading_count", "temperature_sum",
+                  "temperature_sumsq", "temperature_min", "temperature_max", "motion_sum"]
+        incremental = sorted(HourlyRollup.objects.values_list(*fields))
+        daily = sorted(DailyRollup.objects.values_list(*fields))
+
+        call_command("rebuild_rollups", stdout=StringIO())
+
+        self.assertEqual(sorted(HourlyRollup.objects.values_list(*fields)), incremental)
+        self.assertEqual(sorted(DailyRollup.objects.values_list(*fields)), daily)
+
+    def test_migration_backfills_rollups(self):
+        migration = importlib.import_module("sensors.migrations.0003_rollups")
+        HourlyRollup.objects.all().delete()
+        DailyRollup.objects.all().delete()
+
+        migration.populate_rollups(django_apps, None)
+
+        self.assertEqual(
+            DailyRollup.objects.aggregate(total=Sum("reading_count"))["total"], 3
+        )
+        self.assertTrue(HourlyRollup.objects.exists())
+
+    def test_metric_stats_from_rollups(self):
+        stats = metric_stats(summarize(DailyRollup.objects.all()), "temperature")
+        self.assertAlmostEqual(stats["avg"], 22.0)
+        self.assertEqual(stats["min"], 20.0)
+        self.assertEqual(stats["max"], 24.0)
+        self.assertAlmostEqual(stats["std"], (8 / 3) ** 0.5)
+
+    def test_analytics_uses_rollups(self):
+        response = self.client.get(reverse("analytics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["total_readings"], 3)
+        self.assertEqual(response.context["today_readings"], 3)
+        self.assertEqual(response.context["motion_stats"]["total"], 3)
+        self.assertEqual(sum(response.context["motion_hour_values"]), 6)
+
+
+class IntervalTests(SensorTestCase):
+    def test_intervals_are_computed_per_device(self):
+        start = timezone.now() - timedelta(hours=5)
+        for minutes in (0, 10, 20, 30):
+            ingest(device_id="fast", received_at=start + timedelta(minutes=minutes))
+        for minutes in (5, 65):
+            ingest(device_id="slow", received_at=start + timedelta(minutes=minutes))
+        ingest(device_id="single", received_at=start)
+
+        with self.assertNumQueries(1):
+            intervals = device_intervals()
+
+        self.assertEqual(intervals, {"fast": 10.0, "slow": 60.0})
+        self.assertEqual(average_interval(intervals), 35.0)
+        self.assertEqual(average_interval({}), 0)
+
+    def test_devices_page_reports_interval(self):
+        start = timezone.now() - timedelta(hours=1)
+        for minutes in (0, 15, 30):
+            ingest(device_id="node-1", received_at=start + timedelta(minutes=minutes))
+        response = self.client.get(reverse("devices"))
+        self.assertEqual(response.context["devices"][0]["avg_interval"], 15.0)
+
+
+class HistogramTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for temp, battery in ((19.0, 3.6), (21.0, 3.5), (21.5, 3.0), (40.0, 2.9), (None, None)):
+            ingest(device_id="node-1", temperature_c=temp, battery_voltage=battery, received_at=now)
+            now -= timedelta(minutes=1)
+
+    def test_all_buckets_in_one_query(self):
+        with self.assertNumQueries(1):
+            result = histograms(
+                SensorReading.objects.all(), ["temperature_c", "battery_voltage"]
+            )
+        temperature = dict(result["temperature_c"])
+        self.assertEqual(temperature["<20°C"], 1)
+        self.assertEqual(temperature["20-22°C"], 2)
+        self.assertEqual(temperature[">36°C"], 1)
+        self.assertEqual(
+            result["battery_voltage"], [("high", 1), ("medium", 2), ("critical", 1)]
+        )
+
+    @override_settings(SENSOR_HISTOGRAMS={"humidity": [("all", {"gte": 0})]})
+    def test_buckets_come_from_settings(self):
+        self.assertEqual(
+            histograms(SensorReading.objects.all(), ["humidity"]), {"humidity": [("all", 0)]}
+        )
+
+    def test_raw_only_panels_are_labelled_with_the_retention_window(self):
+        with override_settings(SENSOR_RETENTION_DAYS={"raw": 30, "hourly": 365, "daily": None}):
+            response = self.client.get(reverse("analytics"))
+        self.assertEqual(response.context["raw_days"], 30)
+        self.assertContains(response, "Avg Interval (last 30 days)")
+        self.assertContains(response, "Total Readings (all time)")
+
+        cache.clear()
+        with override_settings(SENSOR_RETENTION_DAYS={"raw": None, "daily": None}):
+            response = self.client.get(reverse("analytics"))
+        self.assertNotContains(response, "last 30 days")
+
+    @override_settings(DEBUG=True)
+    def test_analytics_reports_query_count_in_debug(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("analytics"))
+        self.assertEqual(response.context["battery_stats"]["medium"], 2)
+        self.assertLessEqual(int(response["X-Query-Count"]), 10)
+        self.assertEqual(int(response["X-Query-Count"]), len(ctx.captured_queries))
+
+        cache.clear()
+        with override_settings(DEBUG=False):
+            self.assertFalse(self.client.get(reverse("analytics")).has_header("X-Query-Count"))
+
+
+class BatchIngestTests(SensorTestCase):
+    def uplink(self, minute, temperature):
+        return {
+            "result": {
+                "end_device_ids": {"device_id": "node-1"},
+                "received_at": f"2025-01-01T10:{minute:02d}:00Z",
+                "uplink_message": {"decoded_payload": {"field5": temperature, "field1": 3.6}},
+            }
+        }
+
+    def post(self, body, content_type="application/json"):
+        return self.client.post(reverse("ingest_batch"), body, content_type=content_type)
+
+    def test_json_array_is_bulk_inserted(self):
+        items = [self.uplink(m, 20 + m) for m in range(20)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(json.dumps(items))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 20)
+        self.assertEqual(SensorReading.objects.count(), 20)
+        inserts = [
+            q for q in ctx.captured_queries
+            if q["sql"].startswith("INSERT") and '"sensors_sensorreading"' in q["sql"]
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(DeviceState.objects.get(device_id="node-1").reading_count, 20)
+
+    def test_ndjson_with_duplicates_and_invalid_items(self):
+        self.post(json.dumps([self.uplink(0, 20)]))
+        lines = [
+            json.dumps(self.uplink(0, 20)),
+            json.dumps(self.uplink(1, 21)),
+            json.dumps(self.uplink(1, 21)),
+            "{not json",
+            json.dumps({"device_id": "node-2", "temperature_c": "warm"}),
+        ]
+        response = self.post("\n".join(lines), content_type="application/x-ndjson")
+
+        body = response.json()
+        self.assertEqual(
+            [r["status"] for r in body["results"]],
+            ["duplicate", "created", "duplicate", "invalid", "invalid"],
+        )
+        self.assertEqual((body["created"], body["duplicate"], body["invalid"]), (1, 2, 2))
+        self.assertEqual(SensorReading.objects.count(), 2)
+
+    def test_malformed_uplinks_are_invalid(self):
+        malformed = [
+            {"end_device_ids": "node-1", "field5": 20.0},
+            {"device_id": "node-1", "uplink_message": ["field5", 20.0]},
+            {"device_id": "node-1", "uplink_message": {"decoded_payload": "20.0"}},
+            {"device_id": "node-1", "fields": [20.0]},
+            {"device_id": "node-1", "rx_metadata": {"time": "2025-01-01T10:00:00Z"}},
+            {"device_id": "node-1", "rx_metadata": ["2025-01-01T10:00:00Z"]},
+        ]
+        for payload in malformed:
+            with self.subTest(payload=payload), self.assertRaises(InvalidReading):
+                parse_reading(payload)
+
+        response = self.post(json.dumps(malformed))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["invalid"], len(malformed))
+        self.assertFalse(SensorReading.objects.exists())
+
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.post("[]").status_code, 400)
+        with override_settings(SENSOR_INGEST_BATCH_MAX=2):
+            self.assertEqual(self.post(json.dumps([{}, {}, {}])).status_code, 413)
+
+
+class DeduplicationTests(SensorTestCase):
+    def test_single_ingest_reports_duplicates(self):
+        body = {"device_id": "node-1", "field5": 20.0, "received_at": "2025-01-01T10:00:00Z"}
+        first = self.client.post(reverse("ingest_reading"), body, content_type="application/json")
+        second = self.client.post(reverse("ingest_reading"), body, content_type="application/json")
+
+        self.assertEqual(first.json()["status"], "created")
+        self.assertEqual(second.json(), {"id": first.json()["id"], "status": "duplicate"})
+        self.assertEqual(SensorReading.objects.count(), 1)
+        self.assertEqual(DeviceState.objects.get(device_id="node-1").reading_count, 1)
+
+    def test_store_readings_does_not_look_up_each_reading(self):
+        rows = [
+            parse_reading({"device_id": "node-1", "received_at": f"2025-01-01T10:{m:02d}:00Z"})
+            for m in range(30)
+        ]
+        store_readings(rows[:10])
+        with CaptureQueriesContext(connection) as ctx:
+            results = store_readings(rows)
+        self.assertEqual([s for s, _ in results].count("created"), 20)
+        self.assertEqual(SensorReading.objects.count(), 30)
+        selects = [q for q in ctx.captured_queries if q["sql"].startswith("SELECT")
+                   and 'FROM "sensors_sensorreading"' in q["sql"]]
+        self.assertEqual(len(selects), 1)
+
+    def test_migration_recounts_todays_readings(self):
+        migration = importlib.import_module("sensors.migrations.0004_unique_device_reading")
+        ingest(device_id="node-1", temperature_c=20.0, received_at=timezone.now())
+        ingest(device_id="node-1", received_at=timezone.now() - timedelta(days=2))
+        DeviceState.objects.filter(device_id="node-1").update(today_count=5)
+
+        migration.recount_today(django_apps, {"node-1"})
+        self.assertEqual(DeviceState.objects.get(device_id="node-1").today_count, 1)
+
+    def test_database_rejects_duplicate_readings(self):
+        now = timezone.now()
+        SensorReading.objects.create(device_id="node-1", received_at=now)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SensorReading.objects.create(device_id="node-1", received_at=now)
+
+
+class ExportTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        ingest(device_id="node-1", temperature_c=0.0, humidity=None, received_at=now)
+        ingest(device_id="node-1", temperature_c=21.5, humidity=40.0,
+               received_at=now - timedelta(minutes=1))
+
+    def export(self, export_format):
+        response = self.client.get(reverse("history"), {"export": export_format})
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_keeps_zero_values(self):
+        lines = self.export("csv").splitlines()
+        self.assertEqual(lines[0], "Timestamp,Device,Temperature,Humidity,Battery,Motion")
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1].split(",")[1:4], ["node-1", "0.0", ""])
+
+    def test_json_array_and_ndjson(self):
+        records = json.loads(self.export("json"))
+        self.assertEqual([r["temperature_c"] for r in records], [0.0, 21.5])
+        lines = self.export("ndjson").splitlines()
+        self.assertEqual([json.loads(line) for line in lines], records)
+
+    def test_empty_export_is_valid_json(self):
+        SensorReading.objects.all().delete()
+        self.assertEqual(json.loads(self.export("json")), [])
+
+    def test_history_day_filter_is_half_open(self):
+        today = timezone.localdate()
+        midnight = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        for offset in (timedelta(0), -timedelta(microseconds=1), timedelta(days=1)):
+            ingest(device_id="node-2", received_at=midnight + offset)
+
+        def count(**filters):
+            response = self.client.get(reverse("history"), {"device": "node-2", **filters})
+            self.assertEqual(response.status_code, 200)
+            return response.context["total_count"]
+
+        yesterday = (today - timedelta(days=1)).isoformat()
+        self.assertEqual(count(date_from=yesterday, date_to=yesterday), 1)
+        self.assertEqual(count(date_from=today.isoformat()), 2)
+        self.assertEqual(count(date_to=today.isoformat()), 2)
+
+
+@unittest.skipUnless(pq, "pyarrow is not installed")
+class ColumnarTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        make_readings(2, per_device=3)
+
+    def test_dataset_round_trip(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.assertEqual(write_dataset(SensorReading.objects.all(), path), 6)
+            table = pq.read_table(path)
+            self.assertEqual(table.num_rows, 6)
+            self.assertEqual(
+                sorted(set(table.column("device_id").to_pylist())),
+                ["device-0", "device-1"],
+            )
+
+            SensorReading.objects.filter(device_id="device-1").delete()
+            out = StringIO()
+            call_command("import_parquet", path, stdout=out)
+            self.assertIn("Imported 3 readings (3 already stored)", out.getvalue())
+        self.assertEqual(SensorReading.objects.count(), 6)
+
+    def test_command_exports_whole_days(self):
+        today = timezone.localdate()
+        yesterday = timezone.make_aware(
+            datetime.combine(today - timedelta(days=1), datetime.min.time())
+        )
+        ingest(device_id="node-1", received_at=yesterday + timedelta(hours=23, minutes=59))
+        ingest(device_id="node-1", received_at=yesterday - timedelta(minutes=1))
+
+        day = (today - timedelta(days=1)).isoformat()
+        with tempfile.TemporaryDirectory() as path:
+            call_command(
+                "export_parquet", path, device="node-1", since=day, until=day, stdout=StringIO()
+            )
+            self.assertEqual(pq.read_table(path).num_rows, 1)
+        with tempfile.TemporaryDirectory() as path:
+            call_command(
+                "export_parquet", path, device="node-1", until="9999-12-31", stdout=StringIO()
+            )
+            self.assertEqual(pq.read_table(path).num_rows, 2)
+        with self.assertRaises(CommandError):
+            call_command("export_parquet", "unused", since="yesterday", stdout=StringIO())
+
+    def test_parquet_endpoint_streams_filtered_rows(self):
+        response = self.client.get(
+            reverse("export_columnar"), {"format": "parquet", "device": "device-0"}
+        )
+        self.assertTrue(response.streaming)
+        table = pq.read_table(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(table.column("device_id").to_pylist(), ["device-0"] * 3)
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(reverse("export_columnar"), {"format": "xlsx"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TimeseriesApiTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for device_id, temperature, age in (
+            ("node-1", 20.0, timedelta(minutes=2)),
+            ("node-1", 22.0, timedelta(minutes=1)),
+            ("node-2", 30.0, timedelta(days=3)),
+        ):
+            ingest(device_id=device_id, temperature_c=temperature, received_at=now - age)
+
+    def get(self, **params):
+        return self.client.get(reverse("api_timeseries"), params)
+
+    def test_raw_series_defaults_to_last_day(self):
+        data = self.get(metric="temperature").json()
+        self.assertEqual(data["bucket"], "raw")
+        self.assertEqual(data["v"], [20.0, 22.0])
+        self.assertEqual(len(data["t"]), 2)
+
+    def test_daily_bucket_reads_rollups(self):
+        start = (timezone.localdate() - timedelta(days=5)).isoformat()
+        data = self.get(metric="temperature", bucket="day", **{"from": start}).json()
+        self.assertEqual(data["v"], [30.0, 21.0])
+
+    def test_device_filter_and_validation(self):
+        start = (timezone.now() - timedelta(days=5)).isoformat()
+        data = self.get(metric="temperature", device="node-2", **{"from": start}).json()
+        self.assertEqual(data["v"], [30.0])
+        self.assertEqual(self.get(metric="pressure").status_code, 400)
+        self.assertEqual(self.get(bucket="week").status_code, 400)
+        self.assertEqual(self.get(**{"from": "yesterday"}).status_code, 400)
+        self.assertEqual(self.get(shape="table").status_code, 400)
+
+    def test_columns_shape_names_the_field(self):
+        data = self.get(metric="temperature", shape="columns").json()
+        self.assertEqual(data["temperature_c"], [20.0, 22.0])
+        self.assertNotIn("v", data)
+
+
+class LatestApiTests(SensorTestCase):
+    def test_returns_only_readings_after_id(self):
+        first, second, third = make_readings(1, per_device=3)
+        data = self.client.get(reverse("api_latest"), {"after_id": first.id}).json()
+        ids = [row[data["fields"].index("id")] for row in data["readings"]]
+        self.assertEqual(ids, [second.id, third.id])
+        self.assertEqual(data["last_id"], third.id)
+
+        data = self.client.get(reverse("api_latest"), {"after_id": third.id}).json()
+        self.assertEqual(data["readings"], [])
+        self.assertEqual(data["last_id"], third.id)
+
+    def test_without_after_id_returns_newest(self):
+        readings = make_readings(1, per_device=3)
+        data = self.client.get(reverse("api_latest"), {"limit": 2}).json()
+        self.assertEqual(
+            [row[0] for row in data["readings"]], [r.id for r in readings[1:]]
+        )
+
+    def test_non_positive_limit_is_rejected(self):
+        make_readings(1, per_device=3)
+        for limit in ("0", "-1", "ten"):
+            response = self.client.get(reverse("api_latest"), {"after_id": 1, "limit": limit})
+            self.assertEqual(response.status_code, 400)
+
+    def test_columns_shape(self):
+        readings = make_readings(1, per_device=3)
+        data = self.client.get(
+            reverse("api_latest"), {"after_id": readings[0].id, "shape": "columns"}
+        ).json()
+        self.assertEqual(data["id"], [r.id for r in readings[1:]])
+        self.assertEqual(data["device_id"], ["device-0"] * 2)
+        self.assertEqual(len(data["t"]), 2)
+        self.assertEqual(data["last_id"], readings[-1].id)
+
+
+class DownsampleTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.xs = list(range(1000))
+        self.ys = [float(x % 50) for x in self.xs]
+        self.ys[437] = 500.0
+
+    def test_lttb_keeps_endpoints_and_spikes(self):
+        indices = lttb_indices(self.xs, self.ys, 100)
+        self.assertEqual(len(indices), 100)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertEqual(indices, sorted(indices))
+        self.assertIn(437, indices)
+
+    def test_minmax_keeps_extremes_of_each_bucket(self):
+        indices = minmax_indices(self.xs, self.ys, 100)
+        self.assertLessEqual(len(indices), 100)
+        self.assertIn(437, indices)
+        self.assertEqual(indices, sorted(indices))
+
+    def test_short_series_are_returned_unchanged(self):
+        self.assertEqual(lttb_indices([1, 2, 3], [4, 5, 6], 10), [0, 1, 2])
+        self.assertEqual(minmax_indices([1, 2, 3], [4, 5, 6], 10), [0, 1, 2])
+
+    @override_settings(SENSOR_CHART_POINTS=20)
+    def test_chart_cost_is_independent_of_range(self):
+        make_readings(1, per_device=200)
+        labels, values = build_series(SensorReading.objects.all())["temperature_c"]
+        self.assertEqual((len(labels), len(values)), (20, 20))
+
+        response = self.client.get(
+            reverse("device_detail", args=["device-0"]), {"days": 30}
+        )
+        self.assertEqual(len(response.context["temp_data"]), 20)
+        self.assertEqual(response.context["chart_days"], 30)
+
+
+class SeriesTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        ingest(device_id="node-1", temperature_c=20.0, humidity=None,
+               received_at=now - timedelta(minutes=2))
+        ingest(device_id="node-1", temperature_c=None, humidity=45.0,
+               received_at=now - timedelta(minutes=1))
+
+    def test_all_series_come_from_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            series = build_series(SensorReading.objects.all())
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(series["temperature_c"][1], [20.0])
+        self.assertEqual(series["humidity"][1], [45.0])
+        self.assertEqual(len(series["humidity"][0]), 1)
+
+    def test_cached_series_is_reused(self):
+        first = cached_series("test", SensorReading.objects.all(), ["device:node-1"])
+        with CaptureQueriesContext(connection) as ctx:
+            second = cached_series("test", SensorReading.objects.all(), ["device:node-1"])
+        self.assertEqual(second, first)
+        # Only the device's data version (see sensors.cache)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_benchmark_reports_both_strategies(self):
+        out = StringIO()
+        call_command("benchmark", "chart_series", sizes="50", stdout=out)
+        self.assertIn("chart_series[models]", out.getvalue())
+        self.assertIn("chart_series[values]", out.getvalue())
+        self.assertEqual(SensorReading.objects.count(), 2)
+
+
+class CacheInvalidationTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_only_touched_tags_are_invalidated(self):
+        now = timezone.now()
+        cached("node-1", [device_tag("node-1")], self.compute)
+        cached("today", recent_day_tags(1), self.compute)
+
+        ingest(device_id="node-2", received_at=now - timedelta(days=30))
+        self.assertEqual(cached("node-1", [device_tag("node-1")], self.compute), 1)
+        self.assertEqual(cached("today", recent_day_tags(1), self.compute), 2)
+
+        ingest(device_id="node-2", received_at=now - timedelta(days=40))
+        self.assertEqual(cached("today", recent_day_tags(1), self.compute), 2)
+
+        ingest(device_id="node-1", received_at=now)
+        self.assertEqual(cached("node-1", [device_tag("node-1")], self.compute), 3)
+
+    def test_writes_from_other_processes_orphan_entries(self):
+        cached("node-1", [device_tag("node-1")], self.compute)
+        cached("all", [ALL_READINGS], self.compute)
+        cached("today", recent_day_tags(1), self.compute)
+
+        # Stored elsewhere: the invalidation never reaches this cache
+        reading = SensorReading.objects.create(device_id="node-1", received_at=timezone.now())
+        with mock.patch("sensors.ingest.invalidate_readings"):
+            with self.captureOnCommitCallbacks(execute=True):
+                record_readings([reading])
+
+        self.assertEqual(cached("node-1", [device_tag("node-1")], self.compute), 4)
+        self.assertEqual(cached("all", [ALL_READINGS], self.compute), 5)
+        self.assertEqual(cached("today", recent_day_tags(1), self.compute), 6)
+
+    def test_ingest_endpoint_refreshes_analytics(self):
+        ingest(device_id="node-1", temperature_c=20.0, received_at=timezone.now())
+        self.assertEqual(
+            self.client.get(reverse("analytics")).context["total_readings"], 1
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("ingest_reading"),
+                json.dumps({"device_id": "node-2", "temperature_c": 21.0}),
+                content_type="application/json",
+            )
+        self.assertEqual(
+            self.client.get(reverse("analytics")).context["total_readings"], 2
+        )
+
+
+class SchedulerTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.runs = 0
+
+        def job():
+            self.runs += 1
+
+        register_job("test_job", timedelta(minutes=5), job)
+
+    def test_lease_is_single_flight(self):
+        self.assertTrue(claim_job("test_job", timedelta(minutes=5), "worker-1"))
+        self.assertFalse(claim_job("test_job", timedelta(minutes=5), "worker-2"))
+
+        # A lease abandoned by a crashed worker expires
+        later = timezone.now() + JOB_LEASE_TTL + timedelta(seconds=1)
+        self.assertTrue(claim_job("test_job", timedelta(0), "worker-2", now=later))
+
+    def test_running_job_renews_its_lease(self):
+        ttl = timedelta(seconds=30)
+        self.assertTrue(claim_job("test_job", timedelta(0), "worker-1", lease_ttl=ttl))
+        expires = JobLease.objects.get(name="test_job").expires_at
+
+        keeper = _LeaseKeeper("test_job", "worker-1", ttl)
+        with mock.patch.object(keeper.stopped, "wait", side_effect=[False, False, True]):
+            with mock.patch("sensors.scheduler.connection"):
+                keeper.run()
+        renewed = JobLease.objects.get(name="test_job").expires_at
+        self.assertGreater(renewed, expires)
+        # A job running past its first TTL keeps others out
+        self.assertFalse(claim_job("test_job", timedelta(0), "worker-2", now=expires))
+        self.assertFalse(renew_lease("test_job", "worker-2", ttl))
+
+    def test_jobs_take_their_own_lease_ttl(self):
+        leases = []
+        register_job(
+            "slow_job",
+            timedelta(days=1),
+            lambda: leases.append(JobLease.objects.get(name="slow_job").expires_at),
+            lease_ttl=timedelta(hours=2),
+        )
+        self.addCleanup(JOBS.pop, "slow_job")
+        self.assertTrue(run_job("slow_job"))
+        self.assertGreater(leases[0], timezone.now() + timedelta(hours=1))
+        self.assertIsNone(JobLease.objects.get(name="slow_job").expires_at)
+
+    def test_job_runs_once_per_interval(self):
+        self.assertTrue(run_job("test_job"))
+        self.assertFalse(run_job("test_job"))
+        self.assertEqual(self.runs, 1)
+
+        JobLease.objects.filter(name="test_job").update(
+            last_run_at=timezone.now() - timedelta(minutes=6)
+        )
+        self.assertTrue(run_job("test_job"))
+        self.assertEqual(self.runs, 2)
+
+    def test_any_request_starts_the_scheduler(self):
+        with mock.patch("sensors.middleware.start_scheduler") as start:
+            first = self.client.get(reverse("dashboard"))
+            again = self.client.get(reverse("dashboard"), HTTP_IF_NONE_MATCH=first["ETag"])
+            self.client.get(reverse("api_latest"))
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(start.call_count, 3)
+
+    def test_dashboard_never_polls_ttn(self):
+        with mock.patch("sensors.ttn_poller.fetch_recent_ttn_data") as fetch:
+            self.assertEqual(self.client.get(reverse("dashboard")).status_code, 200)
+            fetch.assert_not_called()
+
+            out = StringIO()
+            call_command("run_scheduler", job="ttn_poll", stdout=out)
+            fetch.assert_called_once()
+        self.assertIn("Ran ttn_poll", out.getvalue())
+
+
+class MqttIngestWorkerTests(SensorTestCase):
+    def uplink(self, minutes, temperature):
+        received_at = timezone.now() - timedelta(minutes=minutes)
+        return json.dumps(
+            {
+                "end_device_ids": {"device_id": "lht65n"},
+                "received_at": received_at.isoformat(),
+                "uplink_message": {"decoded_payload": {"field5": temperature}},
+            }
+        ).encode()
+
+    def run_worker(self, messages, **options):
+        async def source():
+            for payload in messages:
+                yield "v3/app@ttn/devices/lht65n/up", payload
+
+        worker = MqttIngestWorker(source(), flush_interval=0.05, retry_delay=0, **options)
+        # Inside the test transaction a real check would close the connection
+        with mock.patch("sensors.mqtt_ingest.close_old_connections") as check:
+            async_to_sync(worker.run)()
+        self.assertTrue(check.called)
+        return worker.metrics.snapshot()
+
+    def test_messages_are_stored_in_micro_batches(self):
+        messages = [self.uplink(i, 20.0 + i) for i in range(10)]
+        messages += [messages[0], b"not json"]
+        with self.assertLogs("sensors.mqtt_ingest", "WARNING"):
+            metrics = self.run_worker(messages, queue_size=4, batch_size=4)
+
+        self.assertEqual(SensorReading.objects.filter(device_id="lht65n").count(), 10)
+        self.assertEqual(
+            (metrics["received"], metrics["created"], metrics["duplicates"]),
+            (12, 10, 1),
+        )
+        self.assertEqual(metrics["invalid"], 1)
+        self.assertGreaterEqual(metrics["batches"], 3)
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertEqual(DeviceState.objects.get(device_id="lht65n").reading_count, 10)
+
+    def test_failed_batches_are_retried(self):
+        calls = []
+
+        def flaky(rows):
+            calls.append(len(rows))
+            if len(calls) == 1:
+                raise OperationalError("server closed the connection unexpectedly")
+            return store_readings(rows)
+
+        messages = [self.uplink(i, 20.0) for i in range(3)]
+        with mock.patch("sensors.mqtt_ingest.store_readings", flaky), self.assertLogs(
+            "sensors.mqtt_ingest", "ERROR"
+        ):
+            metrics = self.run_worker(messages)
+        self.assertEqual(SensorReading.objects.count(), 3)
+        self.assertEqual((metrics["retries"], metrics["failed"]), (1, 0))
+
+    def test_a_bad_reading_does_not_sink_its_batch(self):
+        def picky(rows):
+            if any(row["temperature_c"] == 99.0 for row in rows):
+                raise OperationalError("value rejected")
+            return store_readings(rows)
+
+        messages = [self.uplink(1, 20.0), self.uplink(2, 99.0), self.uplink(3, 21.0)]
+        with mock.patch("sensors.mqtt_ingest.store_readings", picky), self.assertLogs(
+            "sensors.mqtt_ingest", "ERROR"
+        ):
+            metrics = self.run_worker(messages, max_attempts=2)
+        self.assertEqual(
+            sorted(SensorReading.objects.values_list("temperature_c", flat=True)),
+            [20.0, 21.0],
+        )
+        self.assertEqual((metrics["created"], metrics["failed"]), (2, 1))
+
+    def test_unexpected_decode_errors_keep_the_consumer_running(self):
+        def fragile(payload, default_device_id=None):
+            if payload == b"boom":
+                raise KeyError("device_id")
+            return decode_message(payload, default_device_id)
+
+        with mock.patch("sensors.mqtt_ingest.decode_message", fragile), self.assertLogs(
+            "sensors.mqtt_ingest", "ERROR"
+        ):
+            metrics = self.run_worker([b"boom", self.uplink(1, 20.0)])
+        self.assertEqual((metrics["created"], metrics["failed"]), (1, 1))
+
+    def test_metrics_endpoint_serves_last_snapshot(self):
+        self.assertEqual(self.client.get(reverse("ingest_metrics")).status_code, 404)
+        self.run_worker([self.uplink(1, 21.0)])
+        data = self.client.get(reverse("ingest_metrics")).json()
+        self.assertEqual(data["created"], 1)
+        self.assertIn("avg", data["latency_ms"])
+
+
+@override_settings(SENSOR_SCHEDULER_IN_WEB=False)
+class IngestPipelineTests(TransactionTestCase):
+    """The flusher thread commits on its own connection, so tests must really commit"""
+
+    def setUp(self):
+        cache.clear()
+
+    def row(self, minutes):
+        return {
+            "device_id": "node-1",
+            "received_at": timezone.now() - timedelta(minutes=minutes),
+            "temperature_c": 21.0,
+        }
+
+    def test_concurrent_submits_share_one_transaction(self):
+        pipeline = IngestPipeline(batch_size=50, max_latency=0.2)
+        with mock.patch(
+            "sensors.pipeline.store_readings", wraps=store_readings
+        ) as store:
+            futures = [f for i in range(5) for f in pipeline.submit([self.row(i)])]
+            results = [future.result(timeout=5) for future in futures]
+            pipeline.stop()
+        self.assertEqual(store.call_count, 1)
+        self.assertEqual([status for status, _ in results], ["created"] * 5)
+        self.assertEqual(SensorReading.objects.count(), 5)
+
+    def test_failed_batch_only_fails_the_bad_rows(self):
+        def store(rows):
+            if any(row["temperature_c"] is None for row in rows):
+                raise OperationalError("NOT NULL constraint failed")
+            return store_readings(rows)
+
+        pipeline = IngestPipeline(batch_size=50, max_latency=0.2)
+        bad = {**self.row(3), "temperature_c": None}
+        with mock.patch("sensors.pipeline.store_readings", side_effect=store):
+            rows = (self.row(1), bad, self.row(2))
+            futures = [future for row in rows for future in pipeline.submit([row])]
+            with self.assertRaises(OperationalError):
+                futures[1].result(timeout=5)
+            results = [futures[0].result(timeout=5), futures[2].result(timeout=5)]
+            pipeline.stop()
+        self.assertEqual([status for status, _ in results], ["created"] * 2)
+        self.assertEqual(SensorReading.objects.count(), 2)
+
+    def test_full_queue_is_rejected_without_queueing(self):
+        pipeline = IngestPipeline(max_queue=2)
+        pipeline.start = lambda: None
+        pipeline.submit([self.row(1)])
+        with self.assertRaises(IngestQueueFull):
+            pipeline.submit([self.row(2), self.row(3)])
+        self.assertEqual(pipeline.queue.qsize(), 1)
+
+    def post(self):
+        return self.client.post(
+            reverse("ingest_reading"),
+            json.dumps({"device_id": "node-1", "temperature_c": 21.0}),
+            content_type="application/json",
+        )
+
+    @override_settings(SENSOR_INGEST_MODE="queued")
+    def test_queued_mode_endpoint(self):
+        pipeline = IngestPipeline(max_latency=0.01)
+        with mock.patch("sensors.views.get_pipeline", return_value=pipeline):
+            response = self.post()
+            pipeline.stop()
+        self.assertEqual(response.json()["status"], "created")
+        self.assertTrue(SensorReading.objects.filter(id=response.json()["id"]).exists())
+
+        full = IngestPipeline(max_queue=1)
+        full.start = lambda: None
+        full.submit([self.row(1)])
+        with mock.patch("sensors.views.get_pipeline", return_value=full):
+            response = self.post()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "SQLite pragma profile")
+class SqlitePragmaTests(SensorTestCase):
+    def test_production_profile_is_applied_to_connections(self):
+        pragmas = current_pragmas(connection)
+        self.assertEqual(pragmas["synchronous"], 1)  # NORMAL
+        self.assertEqual(pragmas["busy_timeout"], 5000)
+        self.assertEqual(pragmas["temp_store"], 2)  # MEMORY
+
+    @override_settings(SQLITE_PRAGMA_PROFILE="default")
+    def test_default_profile_reads_nothing(self):
+        self.assertEqual(current_pragmas(connection), {})
+
+
+class DatabaseUrlTests(SimpleTestCase):
+    def test_postgres_url(self):
+        config = database_from_url(
+            "postgres://iot:p%40ss@db:5433/iot?sslmode=require", conn_max_age=60
+        )
+        self.assertEqual(config["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(
+            (config["NAME"], config["USER"], config["PASSWORD"]), ("iot", "iot", "p@ss")
+        )
+        self.assertEqual((config["HOST"], config["PORT"]), ("db", "5433"))
+        self.assertEqual(config["OPTIONS"], {"sslmode": "require"})
+        self.assertEqual(config["CONN_MAX_AGE"], 60)
+        self.assertTrue(config["CONN_HEALTH_CHECKS"])
+
+    def test_pool_disables_persistent_connections(self):
+        config = database_from_url("postgresql://db/iot", conn_max_age=60, pool=True)
+        self.assertEqual(config["OPTIONS"], {"pool": True})
+        self.assertEqual(config["CONN_MAX_AGE"], 0)
+
+    def test_sqlite_and_unknown_schemes(self):
+        config = database_from_url("sqlite:////var/lib/iot/db.sqlite3")
+        self.assertEqual(config["ENGINE"], "django.db.backends.sqlite3")
+        self.assertEqual(config["NAME"], "/var/lib/iot/db.sqlite3")
+        with self.assertRaises(ValueError):
+            database_from_url("mysql://db/iot")
+
+
+class PartitionHelperTests(SensorTestCase):
+    def test_month_arithmetic_and_names(self):
+        self.assertEqual(add_months(date(2025, 11, 17), 2), date(2026, 1, 1))
+        self.assertEqual(add_months(date(2025, 1, 31), -1), date(2024, 12, 1))
+        self.assertEqual(partition_name(date(2025, 3, 1)), "sensors_sensorreading_p202503")
+
+    @unittest.skipIf(connection.vendor == "postgresql", "SQLite fallback")
+    def test_partitioning_is_a_no_op_off_postgres(self):
+        self.assertIsNone(partitioning_mode())
+        with self.assertRaises(CommandError):
+            call_command("partition_readings", stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command("drop_partitions", older_than_months=6, stdout=StringIO())
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "needs PostgreSQL")
+class PostgresPartitioningTests(TransactionTestCase):
+    def test_partition_and_drop_old_months(self):
+        now = timezone.now()
+        old = now - timedelta(days=200)
+        record_readings(SensorReading.objects.bulk_create([
+            SensorReading(device_id="node-1", temperature_c=20.0, received_at=old),
+            SensorReading(device_id="node-1", temperature_c=21.0, received_at=now),
+        ]))
+
+        self.assertEqual(partition_table(), 2)
+        self.assertEqual(partitioning_mode(), "native")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SensorReading.objects.create(device_id="node-1", received_at=now)
+        SensorReading.objects.create(device_id="node-1", received_at=now + timedelta(seconds=1))
+
+        dropped = drop_partitions(add_months(now.date(), -1))
+        self.assertIn(partition_name(old.date().replace(day=1)), dropped)
+        self.assertEqual(SensorReading.objects.count(), 2)
+        self.assertEqual(HourlyRollup.objects.filter(device_id="node-1").count(), 2)
+
+
+class QueryPlanTests(SensorTestCase):
+    """Hot pages must read readings through an index, never a full scan or sort"""
+
+    HOT_TABLES = (SensorReading._meta.db_table,)
+
+    # Aggregates that read every reading by design; their pages cache them
+    # until ingest
+    FULL_SCANS_ALLOWED = {
+        # services.device_intervals: first/last/count per device
+        "device_intervals": re.compile(
+            r'^SELECT "sensors_sensorreading"\."device_id" AS "device_id", '
+            r'MIN\("sensors_sensorreading"\."received_at"\) AS "first"'
+        ),
+    }
+
+    def setUp(self):
+        super().setUp()
+        make_readings(3, per_device=5)
+        if connection.vendor == "postgresql":
+            # Tiny test tables make sequential scans cheapest; ask for indexes
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertIndexedPlans(self, url, params=None, warm=False):
+        cache.clear()
+        if warm:
+            # Fill the cache first so only the per-request queries are checked
+            self.client.get(url, params or {})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            if self.HOT_TABLES[0] not in query["sql"]:
+                continue
+            if any(p.match(query["sql"]) for p in self.FULL_SCANS_ALLOWED.values()):
+                continue
+            with self.subTest(url=url, sql=query["sql"][:120]):
+                self.assertEqual(
+                    plan_problems(connection, query["sql"], tables=self.HOT_TABLES), []
+                )
+        return response
+
+    def test_checker_reports_scans_and_sorts(self):
+        query = SensorReading.objects.filter(humidity__gt=0).order_by("temperature_c")
+        sql, params = query.query.sql_with_params()
+        self.assertEqual(len(plan_problems(connection, sql, params, self.HOT_TABLES)), 2)
+
+    def test_checker_only_excuses_primary_key_walks_under_a_limit(self):
+        for query in (
+            SensorReading.objects.order_by("-id")[:1],
+            SensorReading.objects.order_by("-id").values_list("id", "created_at")[:1],
+        ):
+            sql, params = query.query.sql_with_params()
+            self.assertEqual(plan_problems(connection, sql, params, self.HOT_TABLES), [])
+
+        unindexed = SensorReading.objects.filter(humidity__gt=0).order_by()[:5]
+        sql, params = unindexed.query.sql_with_params()
+        self.assertEqual(len(plan_problems(connection, sql, params, self.HOT_TABLES)), 1)
+
+    def test_checker_reports_full_index_scans(self):
+        # Walking an index in ORDER BY order stops at the LIMIT
+        newest = SensorReading.objects.order_by("-received_at")[:5]
+        sql, params = newest.query.sql_with_params()
+        self.assertEqual(plan_problems(connection, sql, params, self.HOT_TABLES), [])
+
+        # Aggregating over a whole index reads every row
+        per_device = SensorReading.objects.values("device_id").annotate(n=Count("id")).order_by()
+        sql, params = per_device.query.sql_with_params()
+        self.assertEqual(len(plan_problems(connection, sql, params, self.HOT_TABLES)), 1)
+        # Such as device_intervals, which is allowed to
+        with CaptureQueriesContext(connection) as ctx:
+            device_intervals()
+        sql = ctx.captured_queries[0]["sql"]
+        self.assertTrue(self.FULL_SCANS_ALLOWED["device_intervals"].match(sql))
+        self.assertEqual(len(plan_problems(connection, sql, None, self.HOT_TABLES)), 1)
+
+    def test_dashboard(self):
+        self.assertIndexedPlans(reverse("dashboard"))
+
+    def test_devices_and_device_detail(self):
+        self.assertIndexedPlans(reverse("devices"))
+        self.assertIndexedPlans(reverse("device_detail", args=["device-1"]), {"days": 7})
+
+    def test_history(self):
+        today = timezone.localdate().isoformat()
+        self.assertIndexedPlans(
+            reverse("history"), {"device": "device-1", "date_from": today, "date_to": today}
+        )
+        self.assertIndexedPlans(reverse("history"), {"date_from": today})
+        # Exact statistics over every reading aggregate all of them; they are
+        # cached until ingest
+        cursor = encode_cursor(SensorReading.objects.order_by("received_at")[2])
+        self.assertIndexedPlans(reverse("history"), {"after": cursor}, warm=True)
+        self.assertIndexedPlans(reverse("history"), {"device": "device-1", "before": cursor})
+
+    def test_apis(self):
+        self.assertIndexedPlans(reverse("api_latest"), {"after_id": 0})
+        now = timezone.now()
+        start = now - timedelta(minutes=7, seconds=30)
+        response = self.assertIndexedPlans(
+            reverse("api_timeseries"),
+            {
+                "metric": "temperature",
+                "device": "device-1",
+                "from": start.isoformat(),
+                "to": now.isoformat(),
+            },
+        )
+        data = response.json()
+        self.assertEqual((data["from"], data["to"]), (start.isoformat(), now.isoformat()))
+        # Readings 5, 6 and 7 minutes old; the default window holds all five
+        self.assertEqual(len(data["t"]), 3)
+
+
+class RetentionTests(SensorTestCase):
+    POLICY = {"raw": 30, "hourly": 365, "daily": None}
+
+    def setUp(self):
+        super().setUp()
+        self.ancient = make_readings(2, per_device=3, age=timedelta(days=400))
+        self.old = make_readings(2, per_device=2, age=timedelta(days=40))
+        make_readings(2)
+
+    def test_tiers_age_out_in_batches(self):
+        year_ago = timezone.now() - timedelta(days=365)
+        expired_hourly = HourlyRollup.objects.filter(bucket__lt=year_ago).count()
+        daily_rollups = DailyRollup.objects.count()
+        reports = apply_retention(self.POLICY, batch_size=3, pause=0)
+
+        self.assertEqual([r["tier"] for r in reports], ["raw", "hourly"])
+        self.assertEqual(reports[0]["rows"], 10)
+        self.assertEqual(reports[1]["rows"], expired_hourly)
+        self.assertGreaterEqual(reports[0]["bytes"], 0)
+        self.assertEqual(SensorReading.objects.count(), 2)
+        self.assertFalse(HourlyRollup.objects.filter(bucket__lt=year_ago).exists())
+        self.assertEqual(DailyRollup.objects.count(), daily_rollups)
+
+    def test_expired_last_reading_is_unlinked(self):
+        DeviceState.objects.filter(device_id="device-0").update(last_reading=self.old[0])
+
+        apply_retention(self.POLICY, pause=0)
+        state = DeviceState.objects.get(device_id="device-0")
+        self.assertIsNone(state.last_reading_id)
+        self.assertEqual(state.reading_count, 6)
+
+    def test_dry_run_and_command(self):
+        reports = apply_retention(self.POLICY, dry_run=True)
+        self.assertEqual(reports[0]["rows"], 10)
+        self.assertEqual(SensorReading.objects.count(), 12)
+
+        out = StringIO()
+        call_command("apply_retention", raw_days=300, stdout=out)
+        self.assertIn("raw: deleted 6 rows", out.getvalue())
+        self.assertIn("Kept forever: daily", out.getvalue())
+        self.assertEqual(SensorReading.objects.count(), 6)
+
+    def test_scheduled_job_is_opt_in(self):
+        with override_settings(SENSOR_RETENTION_SCHEDULED=False):
+            run_job("retention", force=True)
+        self.assertEqual(SensorReading.objects.count(), 12)
+        with override_settings(SENSOR_RETENTION_SCHEDULED=True):
+            run_job("retention", force=True)
+        self.assertEqual(SensorReading.objects.count(), 2)
+
+
+class StreamTests(SensorTestCase):
+    def store(self, *rows):
+        with self.captureOnCommitCallbacks(execute=True):
+            return store_readings(
+                [
+                    {"device_id": device_id, "received_at": timezone.now() - timedelta(minutes=age)}
+                    for device_id, age in rows
+                ]
+            )
+
+    async def next_event(self, stream):
+        return (await asyncio.wait_for(anext(stream), 5)).decode()
+
+    def test_wsgi_requests_are_sent_to_polling(self):
+        response = self.client.get(reverse("api_stream"))
+        self.assertEqual(response.status_code, 501)
+
+    async def test_committed_readings_are_pushed_to_matching_clients(self):
+        response = await self.async_client.get(reverse("api_stream"), {"device": "node-1"})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await self.next_event(stream)).startswith("retry:"))
+
+        results = await sync_to_async(self.store)(("node-2", 2), ("node-1", 1))
+        event = await self.next_event(stream)
+        reading = results[1][1]
+        self.assertTrue(event.startswith(f"id: {reading.pk}\nevent: reading\n"))
+        data = json.loads(event.split("data: ", 1)[1])
+        self.assertEqual(data["device_id"], "node-1")
+        self.assertEqual(data["received_at"], timezone.localtime(reading.received_at).isoformat())
+        await stream.aclose()
+
+    async def test_reconnect_catches_up_after_last_event_id(self):
+        results = await sync_to_async(self.store)(("node-1", 3), ("node-1", 2), ("node-1", 1))
+        first_id = results[0][1].pk
+        response = await self.async_client.get(
+            reverse("api_stream"), headers={"Last-Event-ID": str(first_id)}
+        )
+        stream = aiter(response.streaming_content)
+        await self.next_event(stream)
+        ids = [
+            int((await self.next_event(stream)).split("\n", 1)[0][4:]) for _ in range(2)
+        ]
+        self.assertEqual(ids, [results[1][1].pk, results[2][1].pk])
+        await stream.aclose()
+
+    async def test_catch_up_pages_through_the_backlog(self):
+        results = await sync_to_async(self.store)(*[("node-1", age) for age in range(6, 0, -1)])
+        ids = [reading.pk for _, reading in results]
+
+        async def replay(max_catch_up, count):
+            stream = event_stream(after_id=ids[0], catch_up=2, max_catch_up=max_catch_up)
+            await anext(stream)
+            events = [await asyncio.wait_for(anext(stream), 5) for _ in range(count)]
+            await stream.aclose()
+            return [event.split("\n", 2)[:2] for event in events]
+
+        events = await replay(100, 5)
+        self.assertEqual(events, [[f"id: {pk}", "event: reading"] for pk in ids[1:]])
+
+        # Past the limit the client is told it has a gap
+        events = await replay(3, 4)
+        self.assertEqual(
+            events,
+            [[f"id: {pk}", "event: reading"] for pk in ids[1:4]]
+            + [[f"id: {ids[-1]}", "event: reset"]],
+        )
+
+    @override_settings(SENSOR_STREAM_CLIENT_QUEUE=1)
+    async def test_slow_client_is_dropped(self):
+        subscribers = len(hub)
+        stream = event_stream()
+        await anext(stream)
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        self.assertEqual(len(hub), subscribers + 1)
+        hub.publish([(1, "node-1")])
+        hub.publish([(2, "node-1")])
+        hub.publish([(3, "node-1")])
+        with self.assertRaises(StopAsyncIteration):
+            await asyncio.wait_for(waiting, 5)
+        self.assertEqual(len(hub), subscribers)
+
+
+class HistoryPaginationTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now().replace(microsecond=0)
+        # Two devices share a timestamp, so pages must tie-break on id
+        rows = [("node-1", now - timedelta(minutes=i)) for i in range(6)]
+        rows.append(("node-2", now - timedelta(minutes=2)))
+        readings = SensorReading.objects.bulk_create(
+            SensorReading(device_id=device_id, received_at=received_at)
+            for device_id, received_at in rows
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            record_readings(readings)
+        self.expected = [
+            r.pk for r in sorted(readings, key=lambda r: (r.received_at, r.pk), reverse=True)
+        ]
+
+    def test_keyset_pages_walk_both_ways(self):
+        readings = history_readings()
+        pages = [history_page(readings, size=3)]
+        while pages[-1].has_next:
+            pages.append(history_page(readings, after=pages[-1].next_cursor, size=3))
+        self.assertEqual([r.pk for page in pages for r in page.readings], self.expected)
+        self.assertEqual([len(page.readings) for page in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous)
+
+        newer = history_page(readings, before=pages[2].previous_cursor, size=3)
+        self.assertEqual([r.pk for r in newer.readings], self.expected[3:6])
+        self.assertTrue(newer.has_previous)
+        top = history_page(readings, before=newer.previous_cursor, size=3)
+        self.assertEqual([r.pk for r in top.readings], self.expected[:3])
+        self.assertFalse(top.has_previous)
+
+    def test_history_page_uses_cursors_and_totals(self):
+        first = self.client.get(reverse("history"))
+        self.assertEqual(len(first.context["readings"]), 7)
+        self.assertEqual(first.context["total_count"], 7)
+        self.assertFalse(first.context["total_is_approximate"])
+        approx = self.client.get(reverse("history"), {"total": "approx"})
+        self.assertEqual(approx.context["total_count"], 7)
+        self.assertTrue(approx.context["total_is_approximate"])
+
+        cursor = encode_cursor(SensorReading.objects.get(pk=self.expected[3]))
+        response = self.client.get(
+            reverse("history"), {"device": "node-1", "after": cursor, "total": "exact"}
+        )
+        self.assertEqual([r.pk for r in response.context["readings"]], self.expected[4:])
+        self.assertFalse(response.context["total_is_approximate"])
+        self.assertEqual(response.context["total_count"], 6)
+
+        bad = self.client.get(reverse("history"), {"after": "nonsense"})
+        self.assertEqual(len(bad.context["readings"]), 7)
+
+    def test_out_of_range_cursors_and_dates_are_ignored(self):
+        for cursor in ("999999999999999999999_1", "-999999999999999999999_1", "1_x"):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+            for direction in ("after", "before"):
+                response = self.client.get(reverse("history"), {direction: cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context["readings"]), 7)
+
+        response = self.client.get(
+            reverse("history"), {"date_from": "0001-01-01", "date_to": "9999-12-31"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["total_count"], 7)
+
+    def test_cached_page_view_costs_two_queries(self):
+        # The ETag's data version, the page, one stats aggregate, the devices
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("history"), {"total": "exact"})
+        self.assertEqual(response.context["total_count"], 7)
+        self.assertEqual(list(response.context["device_list"]), ["node-1", "node-2"])
+        # Then only the data version and the page
+        with self.assertNumQueries(2):
+            self.client.get(reverse("history"), {"total": "exact"})
+        self.client.get(reverse("history"), {"device": "node-1"})
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("history"), {"device": "node-1"})
+        self.assertEqual(response.context["total_count"], 6)
+
+        ingest(device_id="node-3", temperature_c=30.0, received_at=timezone.now())
+        for mode in HISTORY_TOTALS:
+            response = self.client.get(reverse("history"), {"total": mode})
+            self.assertEqual(response.context["total_count"], 8)
+            self.assertEqual(response.context["avg_temp"], 30.0)
+        self.assertIn("node-3", response.context["device_list"])
+
+    def test_approx_total_falls_back_without_rollups(self):
+        ingest(device_id="node-1", temperature_c=30.0, received_at=timezone.now())
+        # Averages always come from the raw rows
+        DailyRollup.objects.update(temperature_sum=0)
+        response = self.client.get(reverse("history"), {"total": "approx"})
+        self.assertEqual(response.context["total_count"], 8)
+        self.assertEqual(response.context["avg_temp"], 30.0)
+
+        # A database whose rollups were never backfilled
+        DailyRollup.objects.all().delete()
+        cache.clear()
+        response = self.client.get(reverse("history"), {"total": "approx"})
+        self.assertEqual(response.context["total_count"], 8)
+
+
+class ConditionalGetTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.readings = make_readings(2, per_device=3)
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_unchanged_poll_is_not_modified_without_running_the_view(self):
+        url = reverse("api_latest")
+        first = self.client.get(url, {"after_id": self.readings[-1].id})
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+        self.assertTrue(first.has_header("Last-Modified"))
+
+        # Only the data version: two primary key lookups in one query
+        with self.assertNumQueries(1):
+            again = self.revalidate(url, first, after_id=self.readings[-1].id)
+        self.assertEqual(again.status_code, 304)
+        other = self.revalidate(url, first, after_id=self.readings[0].id)
+        self.assertEqual(other.status_code, 200)
+
+        new = ingest(device_id="device-0", temperature_c=25.0, received_at=timezone.now())
+        changed = self.revalidate(url, first, after_id=self.readings[-1].id)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["last_id"], new.id)
+
+        # Retention deleting the oldest rows changes the version too
+        latest = self.client.get(url)
+        SensorReading.objects.filter(pk=self.readings[0].pk).delete()
+        self.assertEqual(self.revalidate(url, latest).status_code, 200)
+
+    def test_device_pages_only_change_with_their_device(self):
+        url = reverse("device_detail", args=["device-0"])
+        first = self.client.get(url)
+        ingest(device_id="device-1", temperature_c=25.0, received_at=timezone.now())
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+        ingest(device_id="device-0", temperature_c=25.0, received_at=timezone.now())
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_retention_changes_the_pages_of_affected_devices(self):
+        ingest(
+            device_id="device-0", temperature_c=20.0, received_at=timezone.now() - timedelta(days=60)
+        )
+        url = reverse("device_detail", args=["device-0"])
+        first = self.client.get(url)
+        other = self.client.get(reverse("device_detail", args=["device-1"]))
+
+        apply_retention({"raw": 30}, pause=0)
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+        self.assertEqual(
+            self.revalidate(reverse("device_detail", args=["device-1"]), other).status_code, 304
+        )
+
+    def test_clock_dependent_pages_change_every_window(self):
+        url = reverse("dashboard")
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+        later = timezone.now() + timedelta(minutes=5)
+        with mock.patch("sensors.conditional.timezone.now", return_value=later):
+            self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+        # History shows no clock-dependent data
+        history = self.client.get(reverse("history"))
+        with mock.patch("sensors.conditional.timezone.now", return_value=later):
+            self.assertEqual(self.revalidate(reverse("history"), history).status_code, 304)
+
+
+class JsonEncodingTests(SimpleTestCase):
+    def test_dumps_matches_the_stdlib_encoder(self):
+        value = {"id": 1, "values": [0.0, None, 21.5], "device_id": "node-1", 2: "x"}
+        self.assertEqual(json.loads(dumps(value)), json.loads(json.dumps(value)))
+        self.assertEqual(json.loads(dumps({"at": date(2024, 1, 2)})), {"at": "2024-01-02"})
+
+    def test_response_only_serializes_dicts_unless_unsafe(self):
+        with self.assertRaises(TypeError):
+            FastJsonResponse([1, 2])
+        response = FastJsonResponse([1, 2], safe=False, status=201)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(json.loads(response.content), [1, 2])
+        self.assertEqual(response.status_code, 201)
+
+
+class CompressionTests(SensorTestCase):
+    def setUp(self):
+        super().setUp()
+        make_readings(5, per_device=20)
+
+    def test_negotiation(self):
+        self.assertEqual(accepted_encoding("gzip, deflate"), "gzip")
+        self.assertIsNone(accepted_encoding("gzip;q=0, identity"))
+        self.assertIsNone(accepted_encoding(""))
+        self.assertEqual(accepted_encoding("*"), accepted_encoding("br, gzip"))
+
+    def test_large_json_is_gzipped(self):
+        plain = self.client.get(reverse("api_latest"), {"limit": 100})
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        response = self.client.get(
+            reverse("api_latest"), {"limit": 100}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertTrue(response["ETag"].startswith("W/"))
+
+        # A weakened ETag still revalidates
+        again = self.client.get(
+            reverse("api_latest"),
+            {"limit": 100},
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(again.status_code, 304)
+
+    def test_streamed_export_is_gzipped_and_html_is_not(self):
+        response = self.client.get(
+            reverse("history"), {"export": "csv"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        body = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(len(body.splitlines()), 101)
+
+        page = self.client.get(reverse("history"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(page.has_header("Content-Encoding"))
+
+    def test_small_bodies_are_sent_as_is(self):
+        response = self.client.get(
+            reverse("reading_detail", args=[SensorReading.objects.first().pk]),
+            HTTP_ACCEPT_ENCODING="gzip",
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
@@ -3,9 +3,7 @@ import json
 import time
 import requests
 import logging
-from django.utils import timezone
-from django.db import IntegrityError
-from .models import SensorReading
+from .ingest import InvalidReading, parse_reading, store_readings
 
 logger = logging.getLogger(__name__)
 
@@ -57,53 +55,20 @@ def fetch_recent_ttn_data(minutes: int = 10):
                 except Exception:
                     logger.exception("Failed to parse NDJSON line")
 
-        inserted = 0
+        rows = []
         for it in items:
             try:
-                device = (
-                    it.get("end_device_ids", {}).get("device_id")
-                    or device_id
-                    or "unknown-device"
-                )
-                received_at = it.get("received_at")
-                decoded = (
-                    it.get("uplink_message", {}).get("decoded_payload", {})
-                    or it.get("fields", {})
-                    or {}
-                )
-
-                # Avoid duplicates: check if a reading with same device and timestamp exists
-                from django.utils.dateparse import parse_datetime
-
-                dt = None
-                if isinstance(received_at, str):
-                    dt = parse_datetime(received_at)
-                if dt is None:
-                    dt = timezone.now()
-
-                # Map fields
-                battery = decoded.get("field1") or decoded.get("battery_voltage")
-                humidity = decoded.get("field3") or decoded.get("humidity")
-                motion = decoded.get("field4") or decoded.get("motion_counts")
-                temp = decoded.get("field5") or decoded.get("temperature_c")
-
-                exists = SensorReading.objects.filter(
-                    device_id=device, received_at=dt
-                ).exists()
-                if exists:
-                    continue
-
-                SensorReading.objects.create(
-                    device_id=device,
-                    battery_voltage=battery,
-                    humidity=humidity,
-                    motion_counts=motion,
-                    temperature_c=temp,
-                    received_at=dt,
-                )
-                inserted += 1
-            except Exception:
-                logger.exception("Error inserting TTN item")
+                row = parse_reading(it)
+            except InvalidReading:
+                logger.warning("Skipping invalid TTN item", exc_info=True)
+                continue
+            if row["device_id"] == "unknown-device" and device_id:
+                row["device_id"] = device_id
+            rows.append(row)
+
+        # Duplicates are skipped by the unique (device_id, received_at) constraint
+        results = store_readings(rows)
+        inserted = sum(1 for status, _ in results if status == "created")
 
         logger.info(f"Inserted {inserted} TTN items from storage API")
         return inserted
@@ -9,6 +9,12 @@ urlpatterns = [
     path("history/", views.history, name="history"),
     path("device/<str:device_id>/", views.device_detail, name="device_detail"),
     path("api/ingest/", views.ingest_reading, name="ingest_reading"),
+    path("api/ingest/batch/", views.ingest_batch, name="ingest_batch"),
+    path("api/ingest/metrics/", views.ingest_metrics, name="ingest_metrics"),
+    path("api/timeseries/", views.api_timeseries, name="api_timeseries"),
+    path("api/latest/", views.api_latest, name="api_latest"),
+    path("api/stream/", views.api_stream, name="api_stream"),
+    path("api/export/columnar/", views.export_columnar, name="export_columnar"),
     path("api/fetch-data/", views.fetch_data_endpoint, name="fetch_data"),
     path("api/reading/<int:reading_id>/", views.reading_detail, name="reading_detail"),
 ]
@@ -1,42 +1,87 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 from django.shortcuts import render, get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpRequest, HttpResponse
-from django.utils.dateparse import parse_datetime
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
 from django.db.models import Avg, Max, Min, Count, Q, Sum
-from django.core.paginator import Paginator
 from django.utils import timezone
+from concurrent.futures import TimeoutError as FutureTimeout
 from datetime import datetime, timedelta
-from .models import SensorReading
-from .ttn_poller import fetch_recent_ttn_data
+from .models import DailyRollup, DeviceState, HourlyRollup, SensorReading
+from .rollups import metric_stats, summarize
+from .conditional import conditional, device_arg, device_param
+from .columnar import COLUMNAR_FORMATS, ColumnarUnavailable, columnar_response
+from .downsample import DOWNSAMPLE_METHODS
+from .export import EXPORT_FORMATS, export_response
+from .fastjson import FastJsonResponse, columns
+from .history import (
+    HISTORY_TOTALS,
+    history_devices,
+    history_page,
+    history_readings,
+    history_stats,
+)
+from .ingest import InvalidReading, parse_reading, store_readings
+from .mqtt_ingest import METRICS_CACHE_KEY
+from .pipeline import IngestQueueFull, get_pipeline
+from .cache import ALL_READINGS, cached, device_tag, recent_day_tags
+from .series import build_series, cached_series
+from .stream import LATEST_FIELDS, compact_row, event_stream
+from .services import (
+    EXCLUDED_DEVICE_IDS,
+    ONLINE_WINDOW,
+    SERIES_BUCKETS,
+    SERIES_METRICS,
+    average_interval,
+    device_intervals,
+    device_states,
+    device_status_summary,
+    histograms,
+    last_readings_by_device,
+    timeseries,
+)
 
-# Simple module-level last-poll timestamp to avoid heavy polling on every request
-_last_ttn_poll = 0
-import os
-import time
 import logging
 import json
 import csv
+from functools import wraps
+from urllib.parse import urlencode
 
 
-def dashboard(request: HttpRequest):
-    # Run on-demand TTN poller at most once every N minutes as a fallback when worker isn't running
-    global _last_ttn_poll
-    try:
-        now_ts = int(time.time())
-        poll_interval = int(os.getenv("TTN_POLL_INTERVAL_MIN", "5")) * 60
-        if now_ts - _last_ttn_poll > poll_interval:
-            inserted = fetch_recent_ttn_data(
-                minutes=int(os.getenv("TTN_POLL_INTERVAL_MIN", "5"))
-            )
-            if inserted:
-                _last_ttn_poll = now_ts
-    except Exception:
-        # Don't let polling failures break the dashboard
-        logger = logging.getLogger(__name__)
-        logger.exception("TTN poller failure")
+def report_query_count(view):
+    """In DEBUG mode, log a view's SQL query count and return it as X-Query-Count"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.DEBUG:
+            return view(request, *args, **kwargs)
+        query_count = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            response = view(request, *args, **kwargs)
+        response["X-Query-Count"] = str(query_count)
+        logging.getLogger(__name__).debug(
+            "%s ran %d queries", view.__name__, query_count
+        )
+        return response
+
+    return wrapper
 
+
+@conditional(clock=True)
+def dashboard(request: HttpRequest):
     # Get latest readings
     readings = SensorReading.objects.order_by("-received_at")[:50]
+    # The page then polls /api/latest/ for anything stored after this id
+    last_id = SensorReading.objects.aggregate(last_id=Max("id"))["last_id"] or 0
 
     # Get latest values for metrics
     latest_reading = SensorReading.objects.order_by("-received_at").first()
@@ -44,26 +89,20 @@ def dashboard(request: HttpRequest):
     latest_humidity = latest_reading.humidity if latest_reading else None
     latest_battery = latest_reading.battery_voltage if latest_reading else None
     latest_motion = latest_reading.motion_counts if latest_reading else None
+    latest_at = (
+        timezone.localtime(latest_reading.received_at).isoformat()
+        if latest_reading
+        else ""
+    )
 
     # Get chart data for last 24 hours
     yesterday = timezone.now() - timedelta(days=1)
-    chart_data = SensorReading.objects.filter(received_at__gte=yesterday).order_by(
-        "received_at"
-    )
+    chart_data = SensorReading.objects.filter(received_at__gte=yesterday)
 
-    temp_data = [
-        float(r.temperature_c) for r in chart_data if r.temperature_c is not None
-    ]
-    temp_labels = [
-        r.received_at.strftime("%H:%M")
-        for r in chart_data
-        if r.temperature_c is not None
-    ]
-
-    humidity_data = [float(r.humidity) for r in chart_data if r.humidity is not None]
-    humidity_labels = [
-        r.received_at.strftime("%H:%M") for r in chart_data if r.humidity is not None
-    ]
+    # One values_list pass for both charts, downsampled and reused between refreshes
+    series = cached_series("dashboard", chart_data, recent_day_tags(1))
+    temp_labels, temp_data = series["temperature_c"]
+    humidity_labels, humidity_data = series["humidity"]
 
     # JSON-encode chart arrays so templates receive valid JS literals
     try:
@@ -77,41 +116,12 @@ def dashboard(request: HttpRequest):
         humidity_data_json = "[]"
         humidity_labels_json = "[]"
 
-    # Get device status information
-    device_count = (
-        SensorReading.objects.exclude(device_id__in=["test-device", "unknown-device"])
-        .values("device_id")
-        .distinct()
-        .count()
+    # Get device status information (one grouped query regardless of device count);
+    # online/offline also changes with the clock, so it is kept for a minute at most
+    device_status = cached(
+        "device_status", [ALL_READINGS], device_status_summary, timeout=60
     )
 
-    # Check online devices (last reading within 2 hours)
-    online_devices = 0
-    for device_id in (
-        SensorReading.objects.exclude(device_id__in=["test-device", "unknown-device"])
-        .values_list("device_id", flat=True)
-        .distinct()
-    ):
-        latest = (
-            SensorReading.objects.filter(device_id=device_id)
-            .order_by("-received_at")
-            .first()
-        )
-        if latest and (timezone.now() - latest.received_at).total_seconds() < 7200:
-            online_devices += 1
-
-    # Calculate uptime percentage
-    uptime_percentage = 0
-    if device_count > 0:
-        uptime_percentage = round((online_devices * 100) / device_count, 0)
-
-    device_status = {
-        "total": device_count,
-        "online": online_devices,
-        "offline": device_count - online_devices,
-        "uptime_percentage": uptime_percentage,
-    }
-
     return render(
         request,
         "sensors/dashboard.html",
@@ -130,119 +140,57 @@ def dashboard(request: HttpRequest):
             "humidity_data_json": humidity_data_json,
             "humidity_labels_json": humidity_labels_json,
             "device_status": device_status,
+            "last_id": last_id,
+            "latest_at": latest_at,
         },
     )
 
 
-def analytics(request: HttpRequest):
-    # Overall statistics - exclude test devices
-    total_readings = SensorReading.objects.exclude(
-        device_id__in=["test-device", "unknown-device"]
-    ).count()
-    device_count = (
-        SensorReading.objects.exclude(device_id__in=["test-device", "unknown-device"])
-        .values("device_id")
-        .distinct()
-        .count()
-    )
+def _analytics_context():
+    # Overall statistics come from the pre-aggregated rollups - exclude test devices
+    today = timezone.localdate()
+    daily_rollups = DailyRollup.objects.exclude(device_id__in=EXCLUDED_DEVICE_IDS)
+    totals = summarize(daily_rollups)
+    total_readings = totals["reading_count"]
+    device_count = device_states().count()
     today_readings = (
-        SensorReading.objects.exclude(device_id__in=["test-device", "unknown-device"])
-        .filter(received_at__date=timezone.now().date())
-        .count()
+        daily_rollups.filter(bucket=today).aggregate(total=Sum("reading_count"))[
+            "total"
+        ]
+        or 0
     )
 
-    # Calculate real average interval
-    readings = SensorReading.objects.exclude(
-        device_id__in=["test-device", "unknown-device"]
-    ).order_by("received_at")
-    avg_interval = 0
-    if readings.count() > 1:
-        intervals = []
-        prev_time = None
-        for reading in readings:
-            if prev_time:
-                interval = (
-                    reading.received_at - prev_time
-                ).total_seconds() / 60  # minutes
-                intervals.append(interval)
-            prev_time = reading.received_at
-        avg_interval = round(sum(intervals) / len(intervals), 1) if intervals else 0
-
-    # Temperature statistics - exclude test devices
-    temp_stats = (
-        SensorReading.objects.exclude(device_id__in=["test-device", "unknown-device"])
-        .filter(temperature_c__isnull=False)
-        .aggregate(
-            avg=Avg("temperature_c"), min=Min("temperature_c"), max=Max("temperature_c")
-        )
-    )
+    # Average interval between readings, per device and computed in SQL. It
+    # and the distributions below read raw readings, which retention only
+    # keeps for the last raw_days days, while the totals count every reading
+    raw_days = settings.SENSOR_RETENTION_DAYS.get("raw")
+    avg_interval = average_interval(device_intervals())
 
-    # Humidity statistics - exclude test devices
-    humidity_stats = (
-        SensorReading.objects.exclude(device_id__in=["test-device", "unknown-device"])
-        .filter(humidity__isnull=False)
-        .aggregate(avg=Avg("humidity"), min=Min("humidity"), max=Max("humidity"))
-    )
+    # Temperature and humidity statistics
+    temp_stats = metric_stats(totals, "temperature")
+    humidity_stats = metric_stats(totals, "humidity")
 
     # Daily readings for last 7 days
+    daily_counts = dict(
+        daily_rollups.filter(bucket__gte=today - timedelta(days=6))
+        .values_list("bucket")
+        .annotate(total=Sum("reading_count"))
+        .order_by()
+    )
     daily_data = []
     daily_labels = []
     for i in range(7):
-        date = timezone.now().date() - timedelta(days=i)
-        count = (
-            SensorReading.objects.exclude(
-                device_id__in=["test-device", "unknown-device"]
-            )
-            .filter(received_at__date=date)
-            .count()
-        )
-        daily_data.append(count)
+        date = today - timedelta(days=i)
+        daily_data.append(daily_counts.get(date, 0))
         daily_labels.append(date.strftime("%m/%d"))
 
-    # Temperature distribution - exclude test devices
-    temp_distribution_data = []
-    temp_distribution_labels = []
-    temp_ranges = [
-        ("<20°C", 0, 20),
-        ("20-22°C", 20, 22),
-        ("22-24°C", 22, 24),
-        ("24-26°C", 24, 26),
-        ("26-28°C", 26, 28),
-        ("28-30°C", 28, 30),
-        ("30-32°C", 30, 32),
-        ("32-34°C", 32, 34),
-        ("34-36°C", 34, 36),
-        (">36°C", 36, 100),
-    ]
-
-    for label, min_temp, max_temp in temp_ranges:
-        if min_temp == 0:
-            count = (
-                SensorReading.objects.exclude(
-                    device_id__in=["test-device", "unknown-device"]
-                )
-                .filter(temperature_c__lt=max_temp)
-                .count()
-            )
-        elif max_temp == 100:
-            count = (
-                SensorReading.objects.exclude(
-                    device_id__in=["test-device", "unknown-device"]
-                )
-                .filter(temperature_c__gte=min_temp)
-                .count()
-            )
-        else:
-            count = (
-                SensorReading.objects.exclude(
-                    device_id__in=["test-device", "unknown-device"]
-                )
-                .filter(temperature_c__gte=min_temp, temperature_c__lt=max_temp)
-                .count()
-            )
-
-        temp_distribution_labels.append(label)
-        temp_distribution_data.append(count)
+    # Temperature distribution and battery bands - one scan for every bucket
+    distributions = histograms(
+        SensorReading.objects.exclude(device_id__in=EXCLUDED_DEVICE_IDS),
+        ["temperature_c", "battery_voltage"],
+    )
+    temp_distribution_labels = [label for label, _ in distributions["temperature_c"]]
+    temp_distribution_data = [count for _, count in distributions["temperature_c"]]
 
     # Heatmap data (simplified)
     heatmap_days = []
@@ -254,203 +202,157 @@ def analytics(request: HttpRequest):
 
     # Combined temperature & humidity series for the last 24 hours
     last_24h = timezone.now() - timedelta(days=1)
-    recent_qs = (
-        SensorReading.objects.exclude(device_id__in=["test-device", "unknown-device"])
-        .filter(received_at__gte=last_24h)
-        .order_by("received_at")
-    )
-
-    temp_series = [
-        float(r.temperature_c) for r in recent_qs if r.temperature_c is not None
-    ]
-    temp_labels = [
-        r.received_at.strftime("%H:%M")
-        for r in recent_qs
-        if r.temperature_c is not None
-    ]
+    recent_qs = SensorReading.objects.exclude(
+        device_id__in=EXCLUDED_DEVICE_IDS
+    ).filter(received_at__gte=last_24h)
 
-    humidity_series = [float(r.humidity) for r in recent_qs if r.humidity is not None]
-    humidity_labels = [
-        r.received_at.strftime("%H:%M") for r in recent_qs if r.humidity is not None
-    ]
+    series = build_series(recent_qs)
+    temp_labels, temp_series = series["temperature_c"]
+    humidity_labels, humidity_series = series["humidity"]
 
     # Battery statistics
-    battery_stats = {
-        "high": SensorReading.objects.exclude(
-            device_id__in=["test-device", "unknown-device"]
-        )
-        .filter(battery_voltage__gt=3.5)
-        .count(),
-        "medium": SensorReading.objects.exclude(
-            device_id__in=["test-device", "unknown-device"]
-        )
-        .filter(battery_voltage__gte=3.0, battery_voltage__lte=3.5)
-        .count(),
-        "critical": SensorReading.objects.exclude(
-            device_id__in=["test-device", "unknown-device"]
-        )
-        .filter(battery_voltage__lt=3.0)
-        .count(),
-    }
+    battery_stats = dict(distributions["battery_voltage"])
 
     # Motion statistics
     motion_stats = {
-        "total": SensorReading.objects.exclude(
-            device_id__in=["test-device", "unknown-device"]
-        )
-        .filter(motion_counts__isnull=False)
-        .aggregate(total=Count("motion_counts"))["total"]
-        or 0,
+        "total": totals["motion_count"],
         "avg_per_hour": 0,  # Will calculate
         "peak_hour": "--",  # Will calculate
     }
 
-    # Battery and motion data for charts - compute hourly aggregates for last 24 hours
-    now = timezone.now()
+    # Battery and motion data for charts - hourly aggregates for last 24 hours
+    now = timezone.localtime()
+    first_bucket = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=23)
+    hourly = {
+        row["bucket"]: row
+        for row in HourlyRollup.objects.exclude(device_id__in=EXCLUDED_DEVICE_IDS)
+        .filter(bucket__gte=first_bucket)
+        .values("bucket")
+        .annotate(
+            battery_total=Sum("battery_sum"),
+            battery_readings=Sum("battery_count"),
+            motion_total=Sum("motion_sum"),
+        )
+        .order_by()
+    }
     battery_hour_labels = []
     battery_hour_values = []
     motion_hour_values = []
 
     # Build 24 hourly buckets (oldest -> newest)
     for i in range(24):
-        bucket_start = (now - timedelta(hours=23 - i)).replace(
-            minute=0, second=0, microsecond=0
-        )
-        bucket_end = bucket_start + timedelta(hours=1)
-        label = bucket_start.strftime("%H:00")
-        battery_hour_labels.append(label)
-
-        # Average battery voltage in this hour
-        agg_batt = (
-            SensorReading.objects.exclude(
-                device_id__in=["test-device", "unknown-device"]
-            )
-            .filter(received_at__gte=bucket_start, received_at__lt=bucket_end)
-            .aggregate(avg_batt=Avg("battery_voltage"))
-        )
-        avg_batt = agg_batt.get("avg_batt")
-        # Use None for missing values so Chart.js will gap the line
-        battery_hour_values.append(float(avg_batt) if avg_batt is not None else None)
+        bucket_start = first_bucket + timedelta(hours=i)
+        battery_hour_labels.append(bucket_start.strftime("%H:00"))
+        row = hourly.get(bucket_start)
+
+        # Average battery voltage in this hour; None lets Chart.js gap the line
+        if row and row["battery_readings"]:
+            battery_hour_values.append(row["battery_total"] / row["battery_readings"])
+        else:
+            battery_hour_values.append(None)
 
         # Sum of motion counts in this hour
-        agg_motion = (
-            SensorReading.objects.exclude(
-                device_id__in=["test-device", "unknown-device"]
-            )
-            .filter(received_at__gte=bucket_start, received_at__lt=bucket_end)
-            .aggregate(sum_motion=Sum("motion_counts"))
-        )
-        sum_motion = agg_motion.get("sum_motion") or 0
-        motion_hour_values.append(int(sum_motion))
+        motion_hour_values.append(int(row["motion_total"]) if row else 0)
+
+    return {
+        "total_readings": total_readings,
+        "device_count": device_count,
+        "avg_interval": avg_interval,
+        "raw_days": raw_days,
+        "today_readings": today_readings,
+        "temp_stats": temp_stats,
+        "humidity_stats": humidity_stats,
+        "daily_data": daily_data,
+        "daily_labels": daily_labels,
+        "temp_distribution_data": temp_distribution_data,
+        "temp_distribution_labels": temp_distribution_labels,
+        "battery_stats": battery_stats,
+        "motion_stats": motion_stats,
+        "heatmap_days": heatmap_days,
+        "heatmap_data": heatmap_data,
+        # hourly aggregates for improved visuals
+        "battery_hour_labels": battery_hour_labels,
+        "battery_hour_values": battery_hour_values,
+        "motion_hour_values": motion_hour_values,
+        "motion_hour_labels": battery_hour_labels,
+        # Combined timeseries for analytics
+        "temp_series": temp_series,
+        "temp_labels": temp_labels,
+        "humidity_series": humidity_series,
+        "humidity_labels": humidity_labels,
+    }
 
-    return render(
-        request,
-        "sensors/analytics.html",
-        {
-            "total_readings": total_readings,
-            "device_count": device_count,
-            "avg_interval": avg_interval,
-            "today_readings": today_readings,
-            "temp_stats": temp_stats,
-            "humidity_stats": humidity_stats,
-            "daily_data": daily_data,
-            "daily_labels": daily_labels,
-            "temp_distribution_data": temp_distribution_data,
-            "temp_distribution_labels": temp_distribution_labels,
-            "battery_stats": battery_stats,
-            "motion_stats": motion_stats,
-            "heatmap_days": heatmap_days,
-            "heatmap_data": heatmap_data,
-            # hourly aggregates for improved visuals
-            "battery_hour_labels": battery_hour_labels,
-            "battery_hour_values": battery_hour_values,
-            "motion_hour_values": motion_hour_values,
-            "motion_hour_labels": battery_hour_labels,
-            # Combined timeseries for analytics
-            "temp_series": temp_series,
-            "temp_labels": temp_labels,
-            "humidity_series": humidity_series,
-            "humidity_labels": humidity_labels,
-        },
+
+@report_query_count
+@conditional(clock=True)
+def analytics(request: HttpRequest):
+    # Recomputed only after new readings arrive (or the day changes)
+    context = cached(
+        f"analytics:{timezone.localdate().isoformat()}",
+        [ALL_READINGS],
+        _analytics_context,
     )
+    return render(request, "sensors/analytics.html", context)
 
 
-def devices(request: HttpRequest):
-    # Get device statistics
-    devices_data = []
-    # Collect device IDs, normalize and deduplicate to avoid showing the same device multiple times
-    raw_device_ids = (
-        SensorReading.objects.exclude(device_id__in=["test-device", "unknown-device"])
-        .values_list("device_id", flat=True)
-        .distinct()
-        .order_by("device_id")
-    )
+def _devices_context():
+    # One maintained state row per device instead of several queries per device
+    now = timezone.now()
+    cutoff = now - ONLINE_WINDOW
 
-    seen = set()
-    device_ids = []
-    for did in raw_device_ids:
-        if did is None:
-            continue
-        # Normalize by trimming surrounding whitespace
-        normalized = did.strip()
-        if not normalized:
-            continue
-        if normalized in seen:
-            continue
-        seen.add(normalized)
-        device_ids.append(normalized)
-
-    for device_id in device_ids:
-        device_readings = SensorReading.objects.filter(device_id=device_id)
-        latest = device_readings.order_by("-received_at").first()
-        last_five_qs = list(device_readings.order_by("-received_at")[:5])
-        today_count = device_readings.filter(
-            received_at__date=timezone.now().date()
-        ).count()
-
-        # Check if device is online (last reading within 2 hours)
-        is_online = (
-            latest and (timezone.now() - latest.received_at).total_seconds() < 7200
-        )
+    # Normalize and deduplicate device IDs to avoid showing the same device multiple times
+    states = {}
+    for state in device_states():
+        normalized = (state.device_id or "").strip()
+        if normalized and normalized not in states:
+            states[normalized] = state
 
+    last_readings = last_readings_by_device([s.device_id for s in states.values()])
+    intervals = device_intervals()
+
+    devices_data = []
+    for device_id, state in sorted(states.items()):
         devices_data.append(
             {
                 "device_id": device_id,
-                "latest_temp": latest.temperature_c if latest else None,
-                "latest_humidity": latest.humidity if latest else None,
-                "latest_battery": latest.battery_voltage if latest else None,
-                "latest_motion": latest.motion_counts if latest else None,
-                "last_seen": latest.received_at if latest else None,
-                "is_online": is_online,
-                "reading_count": device_readings.count(),
-                "today_readings": today_count,
-                "last_readings": last_five_qs,
-                "avg_interval": 15,  # Will calculate real interval
+                "latest_temp": state.temperature_c,
+                "latest_humidity": state.humidity,
+                "latest_battery": state.battery_voltage,
+                "latest_motion": state.motion_counts,
+                "last_seen": state.last_seen,
+                # Check if device is online (last reading within 2 hours)
+                "is_online": bool(state.last_seen and state.last_seen > cutoff),
+                "reading_count": state.reading_count,
+                "today_readings": state.today_readings,
+                "last_readings": last_readings.get(state.device_id, []),
+                "avg_interval": round(intervals.get(state.device_id, 0), 1),
             }
         )
 
-    total_devices = len(devices_data)
-    online_devices = sum(1 for d in devices_data if d["is_online"])
-    offline_devices = total_devices - online_devices
+    status = device_status_summary(
+        last_seen={d["device_id"]: d["last_seen"] for d in devices_data}, now=now
+    )
 
     # Total cumulative readings across all devices (exclude test/unknown)
-    total_readings = SensorReading.objects.exclude(
-        device_id__in=["test-device", "unknown-device"]
-    ).count()
+    total_readings = sum(d["reading_count"] for d in devices_data)
+
+    return {
+        "devices": devices_data,
+        "total_devices": status["total"],
+        "total_readings": total_readings,
+        "online_devices": status["online"],
+        "offline_devices": status["offline"],
+    }
 
-    return render(
-        request,
-        "sensors/devices.html",
-        {
-            "devices": devices_data,
-            "total_devices": total_devices,
-            "total_readings": total_readings,
-            "online_devices": online_devices,
-            "offline_devices": offline_devices,
-        },
-    )
+
+@conditional(clock=True)
+def devices(request: HttpRequest):
+    # Cached until new readings arrive; online flags go stale after a minute
+    context = cached("devices", [ALL_READINGS], _devices_context, timeout=60)
+    return render(request, "sensors/devices.html", context)
 
 
+@conditional()
 def history(request: HttpRequest):
     # Get filter parameters
     selected_device = request.GET.get("device", "")
@@ -458,97 +360,83 @@ def history(request: HttpRequest):
     date_to = request.GET.get("date_to", "")
     export_format = request.GET.get("export", "")
 
-    # Build query - exclude test devices
-    query = Q()
-    query &= ~Q(device_id__in=["test-device", "unknown-device"])
-    if selected_device:
-        query &= Q(device_id=selected_device)
-    if date_from:
-        query &= Q(received_at__date__gte=date_from)
-    if date_to:
-        query &= Q(received_at__date__lte=date_to)
-
-    readings = SensorReading.objects.filter(query).order_by("-received_at")
-
-    # Handle export
-    if export_format == "csv":
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = 'attachment; filename="sensor_readings.csv"'
-        writer = csv.writer(response)
-        writer.writerow(
-            ["Timestamp", "Device", "Temperature", "Humidity", "Battery", "Motion"]
-        )
-        for reading in readings:
-            writer.writerow(
-                [
-                    reading.received_at,
-                    reading.device_id,
-                    reading.temperature_c or "",
-                    reading.humidity or "",
-                    reading.battery_voltage or "",
-                    reading.motion_counts or "",
-                ]
-            )
-        return response
+    filtered = history_readings(selected_device, date_from, date_to)
 
-    elif export_format == "json":
-        data = []
-        for reading in readings:
-            data.append(
-                {
-                    "timestamp": reading.received_at.isoformat(),
-                    "device_id": reading.device_id,
-                    "temperature_c": reading.temperature_c,
-                    "humidity": reading.humidity,
-                    "battery_voltage": reading.battery_voltage,
-                    "motion_counts": reading.motion_counts,
-                }
-            )
-        return JsonResponse(data, safe=False)
-
-    # Pagination
-    paginator = Paginator(readings, 50)
-    page_number = request.GET.get("page")
-    readings = paginator.get_page(page_number)
-
-    # Get device list for filter - exclude test devices
-    device_list = (
-        SensorReading.objects.exclude(device_id__in=["test-device", "unknown-device"])
-        .values_list("device_id", flat=True)
-        .distinct()
-        .order_by("device_id")
-    )
-
-    # Calculate statistics
-    total_count = SensorReading.objects.filter(query).count()
-    avg_temp = SensorReading.objects.filter(
-        query, temperature_c__isnull=False
-    ).aggregate(avg=Avg("temperature_c"))["avg"]
-    avg_humidity = SensorReading.objects.filter(
-        query, humidity__isnull=False
-    ).aggregate(avg=Avg("humidity"))["avg"]
+    # Handle export - streamed so memory stays flat whatever the date range
+    if export_format in EXPORT_FORMATS:
+        return export_response(filtered, export_format)
 
+    # Keyset pagination - deep pages cost the same as the first one
+    try:
+        page = history_page(
+            filtered, after=request.GET.get("after"), before=request.GET.get("before")
+        )
+    except ValueError:
+        page = history_page(filtered)
+
+    # Statistics in one aggregate; cached, like the device list, until ingest
+    total_mode = request.GET.get("total")
+    if total_mode not in HISTORY_TOTALS:
+        total_mode = settings.SENSOR_HISTORY_TOTAL
+    stats = history_stats(selected_device, date_from, date_to, total_mode)
+
+    filters = {
+        name: value
+        for name, value in (
+            ("device", selected_device),
+            ("date_from", date_from),
+            ("date_to", date_to),
+        )
+        if value
+    }
     return render(
         request,
         "sensors/history.html",
         {
-            "readings": readings,
-            "device_list": device_list,
+            "readings": page.readings,
+            "page": page,
+            "filter_query": urlencode(filters),
+            "device_list": history_devices(),
             "selected_device": selected_device,
             "date_from": date_from,
             "date_to": date_to,
-            "total_count": total_count,
-            "avg_temp": avg_temp or 0,
-            "avg_humidity": avg_humidity or 0,
+            "total_count": stats["total"],
+            "total_is_approximate": total_mode == "approx",
+            "avg_temp": stats["avg_temp"] or 0,
+            "avg_humidity": stats["avg_humidity"] or 0,
         },
     )
 
 
+# Longest chart range offered on the device page
+DEVICE_CHART_MAX_DAYS = 30
+
+
+@conditional(device=device_arg, clock=True)
 def device_detail(request: HttpRequest, device_id: str):
     device_readings = SensorReading.objects.filter(device_id=device_id).order_by(
         "-received_at"
     )
-    latest = device_readings.first()
+    latest = DeviceState.objects.filter(device_id=device_id).first()
+
+    # Chart range in days; downsampling keeps a month as cheap as a day
+    try:
+        chart_days = int(request.GET.get("days", 1))
+    except ValueError:
+        chart_days = 1
+    chart_days = min(max(chart_days, 1), DEVICE_CHART_MAX_DAYS)
+    chart_readings = device_readings.filter(
+        received_at__gte=timezone.now() - timedelta(days=chart_days)
+    )
+    label_format = "%H:%M" if chart_days == 1 else "%m/%d %H:%M"
+    series = cached_series(
+        f"device:{device_id}:{chart_days}",
+        chart_readings,
+        [device_tag(device_id)],
+        label_format=label_format,
+    )
+    temp_labels, temp_data = series["temperature_c"]
+    humidity_labels, humidity_data = series["humidity"]
 
     return render(
         request,
@@ -557,12 +445,18 @@ def device_detail(request: HttpRequest, device_id: str):
             "device_id": device_id,
             "readings": device_readings[:100],
             "latest": latest,
-            "total_readings": device_readings.count(),
+            "total_readings": latest.reading_count if latest else 0,
+            "chart_days": chart_days,
+            "temp_labels": temp_labels,
+            "temp_data": temp_data,
+            "humidity_labels": humidity_labels,
+            "humidity_data": humidity_data,
         },
     )
 
 
 @csrf_exempt
+@conditional()
 def reading_detail(request: HttpRequest, reading_id: int):
     """API endpoint to get reading details"""
     try:
@@ -577,9 +471,9 @@ def reading_detail(request: HttpRequest, reading_id: int):
             "received_at": reading.received_at.isoformat(),
             "created_at": reading.created_at.isoformat(),
         }
-        return JsonResponse(data)
+        return FastJsonResponse(data)
     except SensorReading.DoesNotExist:
-        return JsonResponse({"error": "Reading not found"}, status=404)
+        return FastJsonResponse({"error": "Reading not found"}, status=404)
 
 
 @csrf_exempt
@@ -598,60 +492,289 @@ def fetch_data_endpoint(request: HttpRequest):
         try:
             call_command("fetch_sensor_data")
             result = out.getvalue()
-            return JsonResponse({"status": "success", "message": result})
+            return FastJsonResponse({"status": "success", "message": result})
         except Exception as e:
-            return JsonResponse({"status": "error", "message": str(e)}, status=500)
+            return FastJsonResponse({"status": "error", "message": str(e)}, status=500)
         finally:
             sys.stdout = old_stdout
 
-    return JsonResponse({"error": "Method not allowed"}, status=405)
+    return FastJsonResponse({"error": "Method not allowed"}, status=405)
 
 
 @csrf_exempt
 def ingest_reading(request: HttpRequest):
     if request.method != "POST":
-        return JsonResponse({"detail": "Method not allowed"}, status=405)
+        return FastJsonResponse({"detail": "Method not allowed"}, status=405)
     try:
         payload = json.loads(request.body.decode("utf-8"))
     except json.JSONDecodeError:
-        return JsonResponse({"detail": "Invalid JSON"}, status=400)
+        return FastJsonResponse({"detail": "Invalid JSON"}, status=400)
 
-    device_id = payload.get("device_id") or payload.get("end_device_ids", {}).get(
-        "device_id"
+    try:
+        row = parse_reading(payload)
+    except InvalidReading as e:
+        return FastJsonResponse({"detail": str(e)}, status=400)
+
+    if settings.SENSOR_INGEST_MODE != "queued":
+        [(status, reading)] = store_readings([row])
+        return FastJsonResponse({"id": reading.id, "status": status})
+
+    # Committed together with readings of concurrent requests
+    try:
+        [future] = get_pipeline().submit([row])
+    except IngestQueueFull as e:
+        response = FastJsonResponse({"detail": str(e)}, status=429)
+        response["Retry-After"] = "1"
+        return response
+    try:
+        status, reading = future.result(timeout=settings.SENSOR_INGEST_WAIT)
+    except FutureTimeout:
+        return FastJsonResponse({"id": None, "status": "queued"}, status=202)
+    except Exception:
+        response = FastJsonResponse({"detail": "Reading could not be stored"}, status=503)
+        response["Retry-After"] = "5"
+        return response
+    return FastJsonResponse({"id": reading.id, "status": status})
+
+
+def _parse_batch_body(body: str):
+    """Split a batch body (JSON array or NDJSON) into items; unparsable lines become None"""
+    try:
+        parsed = json.loads(body)
+    except json.JSONDecodeError:
+        items = []
+        for line in body.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                items.append(None)
+        return items
+    if isinstance(parsed, dict) and isinstance(parsed.get("result"), list):
+        return parsed["result"]
+    if isinstance(parsed, list):
+        return parsed
+    return [parsed]
+
+
+@csrf_exempt
+def ingest_batch(request: HttpRequest):
+    """Ingest many readings (JSON array or NDJSON) with one bulk insert"""
+    if request.method != "POST":
+        return FastJsonResponse({"detail": "Method not allowed"}, status=405)
+    try:
+        items = _parse_batch_body(request.body.decode("utf-8"))
+    except UnicodeDecodeError:
+        return FastJsonResponse({"detail": "Body must be UTF-8 encoded"}, status=400)
+    if not items:
+        return FastJsonResponse({"detail": "No readings supplied"}, status=400)
+    if len(items) > settings.SENSOR_INGEST_BATCH_MAX:
+        return FastJsonResponse(
+            {"detail": f"At most {settings.SENSOR_INGEST_BATCH_MAX} readings per batch"},
+            status=413,
+        )
+
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            if item is None:
+                raise InvalidReading("Invalid JSON")
+            valid.append((index, parse_reading(item)))
+        except InvalidReading as e:
+            results[index] = {"index": index, "status": "invalid", "error": str(e)}
+
+    stored = store_readings([row for _, row in valid])
+    for (index, _), (status, reading) in zip(valid, stored):
+        results[index] = {"index": index, "status": status, "id": reading.id}
+
+    summary = {"created": 0, "duplicate": 0, "invalid": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    return FastJsonResponse({**summary, "results": results})
+
+
+@conditional()
+def export_columnar(request: HttpRequest):
+    """Stream filtered history as Parquet or Arrow IPC (needs pyarrow)"""
+    columnar_format = request.GET.get("format", "parquet")
+    if columnar_format not in COLUMNAR_FORMATS:
+        return FastJsonResponse(
+            {"detail": f"format must be one of: {', '.join(COLUMNAR_FORMATS)}"},
+            status=400,
+        )
+    readings = history_readings(
+        request.GET.get("device", ""),
+        request.GET.get("date_from", ""),
+        request.GET.get("date_to", ""),
+    ).order_by("received_at", "id")
+    try:
+        return columnar_response(readings, columnar_format)
+    except ColumnarUnavailable as e:
+        return FastJsonResponse({"detail": str(e)}, status=501)
+
+
+def ingest_metrics(request: HttpRequest):
+    """Latest queue depth / latency snapshot published by run_mqtt_ingest"""
+    snapshot = cache.get(METRICS_CACHE_KEY)
+    if snapshot is None:
+        return FastJsonResponse({"detail": "No MQTT ingest worker has reported"}, status=404)
+    return FastJsonResponse(snapshot)
+
+
+LATEST_LIMIT = 50
+
+# JSON layouts of the series APIs: one array per row or one array per field
+API_SHAPES = ("rows", "columns")
+
+
+def _parse_moment(value: str):
+    """Parse an ISO datetime or a bare date (midnight) into an aware datetime"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        moment = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+@conditional(device=device_param, clock=True)
+def api_timeseries(request: HttpRequest):
+    """Compact JSON series of one metric for charts, raw or from the rollups"""
+    metric = request.GET.get("metric", "temperature")
+    bucket = request.GET.get("bucket") or None
+    if metric not in SERIES_METRICS:
+        return FastJsonResponse(
+            {"detail": f"metric must be one of: {', '.join(SERIES_METRICS)}"},
+            status=400,
+        )
+    method = request.GET.get("method", "lttb")
+    if method not in DOWNSAMPLE_METHODS:
+        return FastJsonResponse(
+            {"detail": f"method must be one of: {', '.join(DOWNSAMPLE_METHODS)}"},
+            status=400,
+        )
+    try:
+        points = int(request.GET.get("points", settings.SENSOR_CHART_POINTS))
+    except ValueError:
+        return FastJsonResponse({"detail": "points must be an integer"}, status=400)
+    shape = request.GET.get("shape", "rows")
+    if shape not in API_SHAPES:
+        return FastJsonResponse(
+            {"detail": f"shape must be one of: {', '.join(API_SHAPES)}"}, status=400
+        )
+    if bucket is not None and bucket not in SERIES_BUCKETS:
+        return FastJsonResponse(
+            {"detail": f"bucket must be one of: {', '.join(SERIES_BUCKETS)}"},
+            status=400,
+        )
+
+    end = timezone.now()
+    start = end - timedelta(days=1)
+    for name in ("from", "to"):
+        if request.GET.get(name):
+            moment = _parse_moment(request.GET[name])
+            if moment is None:
+                return FastJsonResponse(
+                    {"detail": f"{name} must be an ISO 8601 date or datetime"},
+                    status=400,
+                )
+            if name == "from":
+                start = moment
+            else:
+                end = moment
+
+    timestamps, values = timeseries(
+        metric,
+        start,
+        end,
+        device_id=request.GET.get("device") or None,
+        bucket=bucket,
+        points=points,
+        method=method,
     )
-    received_at_raw = payload.get("received_at") or payload.get("rx_metadata", [{}])[
-        0
-    ].get("time")
-
-    # Extract fields by expected mapping
-    fields = (
-        payload.get("uplink_message", {}).get("decoded_payload", {})
-        or payload.get("fields", {})
-        or payload
+    data = {
+        "metric": metric,
+        "bucket": bucket or "raw",
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "t": timestamps,
+    }
+    # ?shape=columns names the value array after the reading field
+    data[SERIES_METRICS[metric] if shape == "columns" else "v"] = values
+    return FastJsonResponse(data)
+
+
+@conditional()
+def api_latest(request: HttpRequest):
+    """Readings stored after ``after_id`` (oldest first), or the newest ones.
+
+    ``?shape=columns`` returns one array per field (``t`` for the time)
+    instead of ``fields`` and ``readings`` rows.
+    """
+    try:
+        after_id = int(request.GET.get("after_id", 0))
+        limit = min(int(request.GET.get("limit", LATEST_LIMIT)), LATEST_LIMIT * 10)
+    except ValueError:
+        return FastJsonResponse(
+            {"detail": "after_id and limit must be integers"}, status=400
+        )
+    if limit < 1:
+        return FastJsonResponse({"detail": "limit must be positive"}, status=400)
+
+    shape = request.GET.get("shape", "rows")
+    if shape not in API_SHAPES:
+        return FastJsonResponse(
+            {"detail": f"shape must be one of: {', '.join(API_SHAPES)}"}, status=400
+        )
+
+    readings = SensorReading.objects.values_list(*LATEST_FIELDS)
+    if after_id:
+        rows = list(readings.filter(id__gt=after_id).order_by("id")[:limit])
+    else:
+        rows = list(readings.order_by("-id")[:limit])[::-1]
+
+    last_id = rows[-1][0] if rows else after_id
+    rows = [compact_row(row) for row in rows]
+    if shape == "columns":
+        return FastJsonResponse({**columns(LATEST_FIELDS, rows), "last_id": last_id})
+    return FastJsonResponse(
+        {"fields": LATEST_FIELDS, "readings": rows, "last_id": last_id}
     )
-    battery_voltage = fields.get("field1") or fields.get("battery_voltage")
-    humidity = fields.get("field3") or fields.get("humidity")
-    motion_counts = fields.get("field4") or fields.get("motion_counts")
-    temperature_c = fields.get("field5") or fields.get("temperature_c")
-
-    # Parse timestamp
-    received_at = None
-    if isinstance(received_at_raw, str):
-        received_at = parse_datetime(received_at_raw)
-    if received_at is None:
-        from django.utils import timezone
-
-        received_at = timezone.now()
-
-    reading = SensorReading.objects.create(
-        device_id=device_id or "unknown-device",
-        battery_voltage=battery_voltage,
-        humidity=humidity,
-        motion_counts=motion_counts,
-        temperature_c=temperature_c,
-        received_at=received_at,
+
+
+async def api_stream(request: HttpRequest):
+    """Server-Sent Events of new readings, optionally for one ``device``.
+
+    Resumes after ``Last-Event-ID`` (sent by reconnecting browsers) or
+    ``after_id``. Only served by the ASGI app; under WSGI each client would
+    hold a worker for as long as it stays connected.
+    """
+    if not isinstance(request, ASGIRequest):
+        return FastJsonResponse(
+            {"detail": "Live streaming needs the ASGI server; poll /api/latest/ instead"},
+            status=501,
+        )
+    try:
+        after_id = int(
+            request.headers.get("Last-Event-ID") or request.GET.get("after_id", 0)
+        )
+    except ValueError:
+        return FastJsonResponse({"detail": "after_id must be an integer"}, status=400)
+
+    response = StreamingHttpResponse(
+        event_stream(request.GET.get("device") or None, after_id),
+        content_type="text/event-stream",
     )
-    return JsonResponse({"id": reading.id})
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 # Create your views here.